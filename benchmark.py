@@ -0,0 +1,171 @@
+"""Headless benchmark suite for the Time Loop Puzzle Game.
+
+Runs fixed scenarios without a display and prints per-phase timings and
+frames per second as JSON, e.g.
+
+    python benchmark.py
+    python benchmark.py --scenario particle_storm --frames 300 --output bench.json
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import time
+
+# Must be set before pygame is imported so no window or audio device is needed
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import numpy as np
+import pygame
+
+from time_loop_game import (SCREEN_WIDTH, SCREEN_HEIGHT, LoopRecording, ScriptedInput,
+                            TimeLoopGame)
+
+# A walk around the stock level: right along the top corridor, then down
+PATROL_SCRIPT = ([(pygame.K_RIGHT,)] * 120 + [(pygame.K_DOWN,)] * 40 +
+                 [(pygame.K_LEFT,)] * 120 + [(pygame.K_UP,)] * 40)
+
+
+def random_walk(rng, length, start, speed=5, size=20):
+    """Build a ghost recording that wanders around the screen"""
+    x, y = start
+    dx, dy = 1, 0
+    actions = []
+    for _ in range(length):
+        if rng.random() < 0.05:
+            dx, dy = rng.choice([(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, -1)])
+        x = min(max(0, x + dx * speed), SCREEN_WIDTH - size)
+        y = min(max(0, y + dy * speed), SCREEN_HEIGHT - size)
+        actions.append((x, y))
+    return LoopRecording.from_positions(actions, start, speed)
+
+
+def setup_stock(game):
+    pass
+
+
+def setup_particle_storm(game):
+    # Keep roughly 10,000 particles alive for the whole run
+    def top_up():
+        missing = 10000 - game.particles.count
+        if missing > 0:
+            game.particles.burst(missing, (0, 0, SCREEN_WIDTH, SCREEN_HEIGHT), None,
+                                 size_range=(1, 4), lifetime_range=(30, 90))
+    top_up()
+    return top_up
+
+
+def setup_many_ghosts(game):
+    rng = random.Random(1)
+    game.max_loops = 200
+    for _ in range(200):
+        color = (rng.randint(0, 255), rng.randint(0, 255), rng.randint(0, 255), 180)
+        start = (rng.randint(0, SCREEN_WIDTH - 20), rng.randint(0, SCREEN_HEIGHT - 20))
+        game.ghosts.add(random_walk(rng, 2000, start), color=color)
+
+
+def setup_many_walls(game):
+    # 5,000 small wall segments on a regular lattice, leaving the start clear
+    walls = []
+    start_x, start_y = game.level.start_pos
+    for row in range(SCREEN_HEIGHT // 8):
+        for column in range(SCREEN_WIDTH // 8):
+            x, y = column * 8 + 2, row * 8 + 2
+            if abs(x - start_x) < 40 and abs(y - start_y) < 40:
+                continue
+            walls.append((x, y, 3, 3))
+            if len(walls) == 5000:
+                break
+        if len(walls) == 5000:
+            break
+    game.level.set_walls(walls)
+
+
+SCENARIOS = {
+    'stock': setup_stock,
+    'particle_storm': setup_particle_storm,
+    'ghosts_200': setup_many_ghosts,
+    'walls_5000': setup_many_walls,
+}
+
+
+def summarize(samples):
+    samples = np.asarray(samples) * 1000.0
+    return {
+        'mean_ms': round(float(samples.mean()), 4),
+        'p50_ms': round(float(np.percentile(samples, 50)), 4),
+        'p95_ms': round(float(np.percentile(samples, 95)), 4),
+        'max_ms': round(float(samples.max()), 4),
+    }
+
+
+def run_scenario(name, frames, render=True, seed=0):
+    game = TimeLoopGame(headless=True, input_source=ScriptedInput(PATROL_SCRIPT), seed=seed)
+    # Skip the opening fade so every measured frame is a gameplay frame
+    game.transition_alpha = 0
+    per_frame = SCENARIOS[name](game)
+
+    phases = {'handle_events': [], 'update': [], 'draw': []}
+    particles = []
+    start = time.perf_counter()
+    for _ in range(frames):
+        if per_frame:
+            per_frame()
+        t0 = time.perf_counter()
+        game.handle_events()
+        t1 = time.perf_counter()
+        game.update()
+        t2 = time.perf_counter()
+        if render:
+            game.draw()
+        t3 = time.perf_counter()
+        phases['handle_events'].append(t1 - t0)
+        phases['update'].append(t2 - t1)
+        phases['draw'].append(t3 - t2)
+        particles.append(game.particles.count)
+    elapsed = time.perf_counter() - start
+
+    return {
+        'frames': frames,
+        'fps': round(frames / elapsed, 2),
+        'frame': summarize(np.sum([phases[p] for p in phases], axis=0)),
+        'phases': {phase: summarize(samples) for phase, samples in phases.items()},
+        'particles_mean': round(float(np.mean(particles)), 1),
+        'ghosts': len(game.ghosts),
+        'walls': len(game.level.walls),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenario', action='append', choices=sorted(SCENARIOS),
+                        help='scenario to run (repeatable, default: all)')
+    parser.add_argument('--frames', type=int, default=600, help='frames per scenario')
+    parser.add_argument('--no-render', action='store_true', help='skip draw() entirely')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='write the JSON report to this file')
+    args = parser.parse_args(argv)
+
+    report = {
+        'python': platform.python_version(),
+        'pygame': pygame.version.ver,
+        'numpy': np.__version__,
+        'render': not args.no_render,
+        'scenarios': {},
+    }
+    for name in args.scenario or list(SCENARIOS):
+        report['scenarios'][name] = run_scenario(name, args.frames, not args.no_render, args.seed)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+    print(text)
+    pygame.quit()
+
+
+if __name__ == '__main__':
+    main()
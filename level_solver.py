@@ -0,0 +1,384 @@
+"""Offline solvability checker for Time Loop Puzzle Game levels.
+
+Searches the game's own simulation for the fewest loops (ghosts) needed to
+reach the goal, prints a JSON report and optionally writes the solution as a
+replay that the game can play back, e.g.
+
+    python level_solver.py
+    python level_solver.py --max-loops 2 --workers 4 --witness solution.tlr
+    python time_loop_game.py --replay solution.tlr
+
+Every search step restores a snapshot into a headless TimeLoopGame and runs
+one real tick, so the solver always agrees with the game's rules (lever
+cooldowns, movable-wall animation, plate timers, ghost playback).
+
+Loops before the last are drawn from a small set of candidate plans: the
+shortest walk from the start onto each lever, after which the loop is
+restarted and its ghost parks on that spot. The last loop is an A* search
+over the full joint state. With --witness, a reported solution is replayed
+in a fresh game while it is recorded, and the report says whether it was
+verified; "unsolved" means no solution exists within that plan space and
+the tick/state limits.
+"""
+import argparse
+import heapq
+import itertools
+import json
+import os
+import time
+from array import array
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+# Must be set before pygame is imported so no window or audio device is needed
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import pygame
+
+from time_loop_game import (INPUT_DOWN, INPUT_LEFT, INPUT_RIGHT, INPUT_UP, MAX_LOOPS,
+                            HeldKeys, ScriptedInput, TimeLoopGame)
+
+# Every input the player can hold for one tick: idle, 4 directions, 4 diagonals
+MASK_KEYS = {INPUT_LEFT: pygame.K_LEFT, INPUT_RIGHT: pygame.K_RIGHT,
+             INPUT_UP: pygame.K_UP, INPUT_DOWN: pygame.K_DOWN}
+ACTIONS = [0, INPUT_LEFT, INPUT_RIGHT, INPUT_UP, INPUT_DOWN,
+           INPUT_LEFT | INPUT_UP, INPUT_LEFT | INPUT_DOWN,
+           INPUT_RIGHT | INPUT_UP, INPUT_RIGHT | INPUT_DOWN]
+RESTART = -1  # Marks a loop restart in a witness script
+
+MAX_SEARCH_TICKS = 60 * 60  # One minute of game time per loop
+MAX_SEARCH_STATES = 200000
+
+
+def mask_keys(mask):
+    return tuple(key for bit, key in MASK_KEYS.items() if mask & bit)
+
+
+class SolverInput:
+    """Input source whose held keys and events are set before each tick"""
+    def __init__(self):
+        self.held_by_mask = {mask: HeldKeys(mask_keys(mask)) for mask in ACTIONS}
+        self.held = self.held_by_mask[0]
+        self.events = []
+
+    def set(self, mask, restart=False):
+        self.held = self.held_by_mask[mask]
+        self.events = [pygame.event.Event(pygame.KEYDOWN, key=pygame.K_r)] if restart else []
+
+    def get_events(self):
+        events, self.events = self.events, []
+        return events
+
+    def get_pressed(self):
+        return self.held
+
+    def get_mouse_pos(self):
+        return (-1, -1)
+
+
+class Simulator:
+    """A headless game whose logic state can be snapshotted and restored.
+
+    A snapshot is a plain tuple: player position, then (active, y) per
+    movable wall, (activated, cooldown) per lever, (activated, timer) per
+    plate and the cursor of every ghost. Nothing else affects game logic.
+    """
+    def __init__(self, max_loops=MAX_LOOPS, seed=0, level=0):
+        self.input = SolverInput()
+        self.max_loops = max_loops
+        self.seed = seed
+        self.level = level
+        self.game = None
+        self.reset()
+
+    def reset(self):
+        """Start over from a fresh game at the level start"""
+        if self.game is not None:
+            self.game.close()
+        self.game = TimeLoopGame(headless=True, input_source=self.input,
+                                 max_loops=self.max_loops, seed=self.seed, level=self.level)
+        self.game.transition_alpha = 0
+
+    def step(self, mask, restart=False):
+        """Run one tick holding mask; True once the goal has been reached"""
+        self.input.set(mask, restart)
+        self.game.step()
+        return self.game.game_state == 'level_complete'
+
+    def run(self, script):
+        """Play a list of masks (RESTART starts a new loop) from the current state"""
+        restart = False
+        for mask in script:
+            if mask == RESTART:
+                restart = True
+                continue
+            self.step(mask, restart)
+            restart = False
+
+    def snapshot(self):
+        game = self.game
+        level = game.level
+        return ((game.player.x, game.player.y),
+                tuple(level.movable_walls.rows('active', 'y')),
+                tuple(level.levers.rows('activated', 'cooldown')),
+                tuple(level.pressure_plates.rows('activated', 'timer')),
+                tuple(game.ghosts.cursor.tolist()))
+
+    def restore(self, state):
+        game = self.game
+        level = game.level
+        player = game.player
+        (player.x, player.y), walls, levers, plates, cursors = state
+        player.prev_x, player.prev_y = player.x, player.y
+        moved = [i for i, ((wall_y,), (active, y)) in enumerate(zip(level.movable_walls.rows('y'), walls))
+                 if wall_y != y]
+        level.movable_walls.set_rows(('active', 'y'), walls)
+        for i in moved:
+            level.wall_moved(i)
+        level.levers.set_rows(('activated', 'cooldown'), levers)
+        level.pressure_plates.set_rows(('activated', 'timer'), plates)
+        level.reschedule()
+        ghosts = game.ghosts
+        ghosts.seek(cursors)
+        # Who stands in which trigger volume follows from the positions, so
+        # re-place every mover without firing events
+        triggers = level.triggers
+        triggers.move('player', player.rect(), silent=True)
+        for ghost in ghosts:
+            triggers.move(ghost, ghost.rect(), silent=True)
+        ghosts.take_moved()  # Already placed
+        level.player_at_goal = player.rect().colliderect(level.goal_rect)
+        game.particles.clear()
+        game.game_state = 'playing'
+        game.fade_direction = -1
+
+    def key(self, state):
+        """Compact hashable form of a snapshot for the visited set.
+
+        Components that cannot change what happens next are dropped: lever
+        handles (only the cooldown gates a toggle), cooldowns that expire before
+        the player can reach their lever, pressure plates (they only light up),
+        and the active flag of a wall that has slid out of the world (toggling
+        it can no longer bring it back).
+        """
+        (x, y), walls, levers, _, cursors = state
+        values = [int(x), int(y)]
+        bottom = self.game.level.world.bottom
+        for active, current_y in walls:
+            values += [-1, bottom] if current_y >= bottom else [active, current_y]
+        size, speed = self.game.player.size, self.game.player.speed
+        for lever, (activated, cooldown) in zip(self.game.level.levers, levers):
+            # A cooldown that runs out before the player can reach the lever is moot
+            gap = max(lever.rect.left - (x + size), x - lever.rect.right,
+                      lever.rect.top - (y + size), y - lever.rect.bottom)
+            values.append(cooldown if gap < cooldown * speed else 0)
+        values += cursors
+        return array('i', values).tobytes()
+
+    def distance_field(self, target):
+        """Ticks from every player position to one touching target, walking
+        around the static walls only, as {(x, y): ticks}. Movable walls are
+        left out, so this never overestimates and serves as the A* heuristic."""
+        level = self.game.level
+        size = self.game.player.size
+        speed = self.game.player.speed
+        start_x, start_y = level.start_pos
+        world = level.world
+        # The player only ever stands on the lattice its start position lies on
+        xs = range(world.left + (start_x - world.left) % speed, world.right - size + 1, speed)
+        ys = range(world.top + (start_y - world.top) % speed, world.bottom - size + 1, speed)
+        free = set()
+        for x in xs:
+            for y in ys:
+                if level.collision_index.first(pygame.Rect(x, y, size, size), ('wall',)) is None:
+                    free.add((x, y))
+        distances = {cell: 0 for cell in free if target.colliderect((cell[0], cell[1], size, size))}
+        queue = deque(distances)
+        steps = [(dx * speed, dy * speed) for dx in (-1, 0, 1) for dy in (-1, 0, 1) if dx or dy]
+        while queue:
+            x, y = queue.popleft()
+            ticks = distances[(x, y)] + 1
+            for dx, dy in steps:
+                cell = (x + dx, y + dy)
+                if cell in free and cell not in distances:
+                    distances[cell] = ticks
+                    queue.append(cell)
+        return distances
+
+    def search(self, root, target, max_ticks=MAX_SEARCH_TICKS, max_states=MAX_SEARCH_STATES):
+        """A* from snapshot root until the player touches target (the goal when
+        target is None). Returns (masks, states_expanded); masks is None when
+        no path was found within the limits."""
+        reach_goal = target is None
+        target = pygame.Rect(self.game.level.goal_rect if reach_goal else target)
+        size = self.game.player.size
+        distances = self.distance_field(target)
+        if root[0] not in distances:
+            return None, 0
+
+        root_key = self.key(root)
+        parents = {root_key: (None, None)}  # key -> (parent key, mask)
+        counter = itertools.count()
+        frontier = [(distances[root[0]], 0, next(counter), root_key, root)]
+        expanded = 0
+        while frontier and expanded < max_states:
+            _, ticks, _, key, state = heapq.heappop(frontier)
+            if ticks >= max_ticks:
+                continue
+            expanded += 1
+            for mask in ACTIONS:
+                self.restore(state)
+                done = self.step(mask)
+                if not reach_goal:
+                    player = self.game.player
+                    done = target.colliderect((player.x, player.y, size, size))
+                child = self.snapshot()
+                child_key = self.key(child)
+                if child_key in parents:
+                    continue
+                parents[child_key] = (key, mask)
+                if done:
+                    masks = []
+                    while parents[child_key][0] is not None:
+                        child_key, mask = parents[child_key]
+                        masks.append(mask)
+                    return masks[::-1], expanded
+                # Positions the static walls cut off from the target are dead ends
+                estimate = distances.get(child[0])
+                if estimate is not None:
+                    heapq.heappush(frontier, (ticks + 1 + estimate, ticks + 1,
+                                              next(counter), child_key, child))
+        return None, expanded
+
+
+def candidate_plans(simulator, max_ticks, max_states):
+    """Shortest walks from the level start onto every lever, as {name: masks}.
+    A ghost parked on a pressure plate changes nothing, so plates are skipped,
+    as are levers that cannot be reached."""
+    level = simulator.game.level
+    targets = [(f'lever{i}', lever.rect) for i, lever in enumerate(level.levers)]
+    root = simulator.snapshot()
+    plans = {}
+    for name, rect in targets:
+        masks, _ = simulator.search(root, rect, max_ticks, max_states)
+        if masks is not None:
+            plans[name] = masks
+    return plans
+
+
+def build_script(plans, order, final=()):
+    """Join earlier loops (plan names in order) and the final loop's masks.
+    Each restart gets an idle tick of its own, so a script that ends with a
+    restart leaves the game at the start of a fresh loop."""
+    script = []
+    for name in order:
+        script += plans[name] + [RESTART, 0]
+    return script + list(final)
+
+
+# One simulator per worker process, built on first use
+_worker_simulator = None
+
+
+def search_loops(task):
+    """Search the final loop after replaying the plans in order.
+    Runs in a worker process when the search is spread across a pool."""
+    global _worker_simulator
+    level, plans, order, max_loops, max_ticks, max_states = task
+    simulator = _worker_simulator
+    if simulator is None or (simulator.level, simulator.max_loops) != (level, max_loops):
+        simulator = _worker_simulator = Simulator(max_loops, level=level)
+    else:
+        simulator.reset()
+    simulator.run(build_script(plans, order))
+    masks, expanded = simulator.search(simulator.snapshot(), None, max_ticks, max_states)
+    return order, masks, expanded
+
+
+def solve(level=0, max_loops=MAX_LOOPS, workers=1, max_ticks=MAX_SEARCH_TICKS,
+          max_states=MAX_SEARCH_STATES):
+    """Find the fewest restarts needed to reach the goal.
+
+    Returns a report dict; on success it includes 'script', the witness as a
+    list of masks with RESTART between loops.
+    """
+    start = time.perf_counter()
+    simulator = Simulator(max_loops, level=level)
+    plans = candidate_plans(simulator, max_ticks, max_states)
+    report = {'level': simulator.game.level.name, 'solved': False, 'loops': None, 'plans': {name: len(masks) for name, masks in plans.items()},
+              'searches': 0, 'states': 0}
+    pool = ProcessPoolExecutor(workers) if workers > 1 else None
+    try:
+        for loops in range(max_loops + 1):
+            # Ghosts only differ by which plan they replay, so each multiset of
+            # plans is searched once instead of once per ordering
+            tasks = [(level, plans, order, max_loops, max_ticks, max_states)
+                     for order in itertools.combinations_with_replacement(sorted(plans), loops)]
+            results = pool.map(search_loops, tasks) if pool else map(search_loops, tasks)
+            best = None
+            for order, masks, expanded in results:
+                report['searches'] += 1
+                report['states'] += expanded
+                if masks is not None and (best is None or len(masks) < len(best[1])):
+                    best = (order, masks)
+            if best:
+                order, masks = best
+                report.update(solved=True, loops=loops, order=list(order),
+                              script=build_script(plans, order, masks))
+                break
+    finally:
+        if pool:
+            pool.shutdown()
+    report['seconds'] = round(time.perf_counter() - start, 3)
+    return report
+
+
+def write_witness(script, path, level=0, max_loops=MAX_LOOPS, seed=0):
+    """Play a witness script in a fresh game while recording it to a replay
+    file; returns True if the goal was reached"""
+    keys, events = [], {}
+    for mask in script:
+        if mask == RESTART:
+            events[len(keys)] = [pygame.event.Event(pygame.KEYDOWN, key=pygame.K_r)]
+        else:
+            keys.append(mask_keys(mask))
+    game = TimeLoopGame(headless=True, input_source=ScriptedInput(keys, events, repeat=False),
+                        max_loops=max_loops, seed=seed, record_path=path, level=level)
+    try:
+        for _ in keys:
+            game.step()
+            if game.game_state == 'level_complete':
+                return True
+        return False
+    finally:
+        game.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--level', default='0', help='level name or index in the default pack')
+    parser.add_argument('--max-loops', type=int, default=MAX_LOOPS, help='most ghosts to try')
+    parser.add_argument('--workers', type=int, default=1, help='worker processes for the search')
+    parser.add_argument('--max-ticks', type=int, default=MAX_SEARCH_TICKS, help='tick limit per loop')
+    parser.add_argument('--max-states', type=int, default=MAX_SEARCH_STATES,
+                        help='states expanded per search before giving up')
+    parser.add_argument('--witness', metavar='FILE', help='write the solution as a replay file')
+    args = parser.parse_args(argv)
+
+    level = int(args.level) if args.level.isdigit() else args.level
+    report = solve(level, args.max_loops, args.workers, args.max_ticks, args.max_states)
+    script = report.pop('script', None)
+    if script is not None:
+        report['ticks'] = sum(1 for mask in script if mask != RESTART)
+        if args.witness:
+            report['witness'] = args.witness
+            report['verified'] = write_witness(script, args.witness, level, args.max_loops)
+    print(json.dumps(report, indent=2))
+    pygame.quit()
+    return 0 if report['solved'] else 1
+
+
+if __name__ == '__main__':
+    raise SystemExit(main())
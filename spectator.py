@@ -0,0 +1,132 @@
+"""Watch a Time Loop Puzzle Game session streamed with --spectate.
+
+Connects to a game started with `python time_loop_game.py --spectate` and
+either shows the session in a window or dumps the decoded state, e.g.
+
+    python spectator.py
+    python spectator.py --connect 192.168.1.20:8765 --levels my_levels.json
+    python spectator.py --json > session.jsonl
+    python spectator.py --stats
+
+The window rebuilds the level from the local level pack (by the name the
+game sends) and draws it from the streamed player, ghost, lever, plate and
+movable-wall state, following the player like the game does.
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+
+import pygame
+
+from time_loop_game import (DEFAULT_LEVEL_PACK, GHOST_COLOR, SCREEN_HEIGHT, SCREEN_WIDTH, SPECTATOR_HOST,
+                            SPECTATOR_PORT, WALL_COLOR, Camera, Level, ParticlePool, Player, SpectatorDecoder,
+                            open_level_pack)
+
+
+class SpectatorView:
+    """Draws decoded snapshots in a window"""
+    def __init__(self, level_pack):
+        pygame.init()
+        self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+        pygame.display.set_caption("Time Loop Puzzle Game - spectating")
+        self.font = pygame.font.Font(None, 28)
+        self.level_pack = open_level_pack(level_pack)
+        self.level = None
+        self.player = Player(0, 0)
+        self.camera = Camera()
+        self.ghost = pygame.Surface((self.player.size, self.player.size), pygame.SRCALPHA)
+        self.ghost.fill(GHOST_COLOR)
+
+    def apply(self, snapshot):
+        if self.level is None or self.level.name != snapshot['level']:
+            self.level = Level(particles=ParticlePool(), data=self.level_pack.load(snapshot['level']))
+        level = self.level
+        for store, names, rows in ((level.levers, ('activated', 'cooldown'), snapshot['levers']),
+                                   (level.pressure_plates, ('activated', 'timer'), snapshot['plates']),
+                                   (level.movable_walls, ('active', 'y'), snapshot['movable_walls'])):
+            if len(store) != len(rows):
+                continue  # The level was edited in game; its layout is not streamed
+            moved = [i for i, row in enumerate(rows) if store is level.movable_walls and store.y[i] != row[1]]
+            store.set_rows(names, rows)
+            for i in moved:
+                level.wall_moved(i)
+        self.player.x, self.player.y = snapshot['player']
+        self.player.prev_x, self.player.prev_y = snapshot['player']
+
+    def draw(self, snapshot):
+        level = self.level
+        center = (self.player.x + self.player.size / 2, self.player.y + self.player.size / 2)
+        self.camera.follow(center, level.world)
+        view = self.camera.view
+        offset = (-view.x, -view.y)
+        level.draw(self.screen, view)
+        for _, x, y in snapshot['ghosts']:
+            self.screen.blit(self.ghost, (x + offset[0], y + offset[1]))
+        self.player.draw(self.screen, offset=offset)
+        label = f"{snapshot['level']}  loop {snapshot['loop'] + 1}  tick {snapshot['tick']}"
+        self.screen.blit(self.font.render(label, True, WALL_COLOR), (10, 10))
+        pygame.display.flip()
+
+    def closed(self):
+        return any(event.type == pygame.QUIT for event in pygame.event.get())
+
+
+async def watch(host, port, mode, level_pack):
+    reader, writer = await asyncio.open_connection(host, port)
+    decoder = SpectatorDecoder()
+    view = SpectatorView(level_pack) if mode == 'window' else None
+    received = 0
+    started = last_report = time.perf_counter()
+    try:
+        while True:
+            data = await reader.read(65536)
+            if not data:
+                break
+            received += len(data)
+            if mode == 'json':
+                decoder.feed(data, lambda: print(json.dumps(decoder.snapshot())))
+                continue
+            decoder.feed(data)
+            snapshot = decoder.snapshot()
+            if mode == 'stats':
+                now = time.perf_counter()
+                if now - last_report >= 1.0 and snapshot:
+                    print(f"tick {snapshot['tick']}: {received / (now - started):.0f} bytes/s", file=sys.stderr)
+                    last_report = now
+            elif snapshot:
+                if view.closed():
+                    break
+                view.apply(snapshot)
+                view.draw(snapshot)
+    finally:
+        writer.close()
+        if view:
+            pygame.quit()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--connect', metavar='[HOST:]PORT', default=f'{SPECTATOR_HOST}:{SPECTATOR_PORT}',
+                        help='address of the game to watch')
+    parser.add_argument('--levels', metavar='FILE', default=DEFAULT_LEVEL_PACK,
+                        help='level pack the game is playing from')
+    output = parser.add_mutually_exclusive_group()
+    output.add_argument('--json', action='store_const', dest='mode', const='json',
+                        help='print every tick as a JSON line instead of opening a window')
+    output.add_argument('--stats', action='store_const', dest='mode', const='stats',
+                        help='only report the bytes received per second')
+    args = parser.parse_args(argv)
+
+    host, _, port = args.connect.rpartition(':')
+    try:
+        asyncio.run(watch(host or SPECTATOR_HOST, int(port), args.mode or 'window', args.levels))
+    except KeyboardInterrupt:
+        pass
+    except ConnectionError as error:
+        sys.exit(f"Could not watch {args.connect}: {error}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,43 @@
+"""Level edits re-bake only the damaged part of the static layer; the chunks
+and the layer on screen must come out exactly as a full rebuild draws them."""
+import pygame
+
+from time_loop_game import Level
+
+
+def rebuilt(level):
+    """A level with the same walls, its static layer baked from scratch"""
+    fresh = Level()
+    fresh.set_walls(level.walls)
+    assert fresh.world == level.world
+    return fresh
+
+
+def assert_same_pixels(level, view):
+    fresh = rebuilt(level)
+    for cell, chunk in level.chunks.items():
+        assert pygame.image.tobytes(chunk, 'RGB') == pygame.image.tobytes(fresh.get_chunk(cell), 'RGB'), cell
+    on_screen = pygame.image.tobytes(level.get_static_layer(view), 'RGB')
+    assert on_screen == pygame.image.tobytes(fresh.get_static_layer(view), 'RGB')
+
+
+def test_incremental_repair_is_pixel_exact():
+    level = Level()
+    view = level.start_view()
+    level.get_static_layer(view)
+    assert level.chunks
+
+    edits = [
+        lambda: level.add_wall((240, 100, 40, 200)),   # Across a chunk edge
+        lambda: level.add_wall((250, 150, 2, 120)),    # Thin walls paint past their rect
+        lambda: level.add_wall((200, 250, 100, 3)),
+        lambda: level.add_wall((260, 120, 30, 30)),    # On top of the first
+        lambda: level.remove_wall(len(level.walls) - 4),
+        lambda: level.remove_wall(0),
+        lambda: level.add_wall((500, 500, 60, 20)),
+    ]
+    for edit in edits:
+        edit()
+        damage = level.take_static_damage()
+        assert damage and all(view.move(-view.x, -view.y).contains(area) for area in damage)
+        assert_same_pixels(level, view)
@@ -0,0 +1,88 @@
+"""Levers, plates and movable walls are handles into EntityStore columns;
+Countdowns run down on the store's TickScheduler by themselves."""
+import numpy as np
+
+from time_loop_game import EntityStore, Level, Lever, MovableWall, PressurePlate, TickScheduler
+
+
+def test_store_grows_and_pops_in_order():
+    walls = EntityStore(MovableWall, capacity=2)
+    handles = walls.extend(3, x=[10, 20, 30], y=5, width=8, height=8, active=True)
+    walls.add(x=40, y=6, width=8, height=8)
+    assert len(walls) == 4 and walls.capacity >= 4
+    assert walls.values('x').tolist() == [10, 20, 30, 40]
+    assert walls.rows('y', 'active') == [(5, True), (5, True), (5, True), (6, False)]
+
+    popped = walls.pop(1)
+    assert popped is handles[1]
+    assert walls.values('x').tolist() == [10, 30, 40]
+    # The handles after it follow their rows
+    assert [wall.index for wall in walls] == [0, 1, 2]
+    assert handles[2].x == 30 and handles[2].rect == (30, 5, 8, 8)
+    assert walls.rows('x', 'y', which=[2, 0]) == [(40, 6), (10, 5)]
+
+    walls.set_rows(('y', 'active'), [(1, False), (2, True), (3, False)])
+    assert [(wall.y, wall.active) for wall in walls] == [(1, False), (2, True), (3, False)]
+
+
+def test_handle_writes_land_in_the_columns():
+    levers = EntityStore(Lever, clock=TickScheduler())
+    lever = levers.add(x=1, y=2, linked_wall=-1)
+    assert lever.linked_wall is None
+    lever.linked_wall = 3
+    lever.x += 5
+    assert levers.linked_wall[0] == 3 and levers.x[0] == 6
+    lever.linked_wall = None
+    assert levers.linked_wall[0] == -1
+
+
+def test_countdown_runs_on_the_clock():
+    clock = TickScheduler()
+    plates = EntityStore(PressurePlate, clock=clock)
+    plate = plates.add(x=0, y=0, width=10, height=10, duration=3, timer=2)
+    assert plate.timer == 2
+    plate.timer = plate.duration
+    assert PressurePlate.timer.deadline(plate) == clock.now + 3
+    left = []
+    for _ in range(5):
+        clock.advance()
+        left.append(plate.timer)
+    assert left == [2, 1, 0, 0, 0]
+    assert plates.values('timer').tolist() == [0]
+    # Stored as the deadline tick, so set_rows/rows round trip against the clock
+    plates.set_rows(('timer',), [(4,)])
+    assert plates.rows('timer') == [(4,)]
+    clock.advance()
+    assert plate.timer == 3
+
+
+def test_lever_slides_its_wall_and_plates_pop_up():
+    level = Level()
+    lever = next(lever for lever in level.levers if lever.linked_wall is not None)
+    wall = level.movable_walls[lever.linked_wall]
+    home = wall.y
+    level.on_lever_enter(lever, 'ghost')
+    assert wall.active and not lever.activated
+    level.on_lever_enter(lever, 'player')
+    assert not wall.active and lever.activated and lever.cooldown == Lever.cooldown_max
+    # Still cooling down: another touch does nothing
+    level.on_lever_enter(lever, 'player')
+    assert not wall.active
+
+    level.update()
+    assert wall.y == home + wall.speed
+    for _ in range(level.world.height // max(wall.speed, 1) + 60):
+        level.update()
+    assert wall.y == level.world.bottom + 50
+    assert level.collision_index.first(wall.rect, accept=lambda entry: entry.entity is wall) is not None
+    assert not level.scheduler.tweens
+
+    plate = level.pressure_plates[0]
+    level.on_plate_enter(plate, 'ghost')
+    assert plate.activated and plate.timer == plate.duration
+    # Nobody is standing on it, so it runs out duration ticks later
+    for _ in range(plate.duration):
+        assert plate.activated
+        level.update()
+    assert not plate.activated and plate not in level.down_plates
+    assert not np.any(level.pressure_plates.activated[:len(level.pressure_plates)])
@@ -0,0 +1,109 @@
+"""The environments play a level exactly as the game does: TimeLoopEnv
+against TimeLoopGame, BatchedTimeLoopEnv against TimeLoopEnv and
+PooledTimeLoopEnv against BatchedTimeLoopEnv, under random walks with
+loop restarts."""
+import numpy as np
+import pygame
+import pytest
+
+from time_loop_env import ACTIONS, BatchedTimeLoopEnv, PooledTimeLoopEnv, TimeLoopEnv
+from time_loop_game import (INPUT_DOWN, INPUT_LEFT, INPUT_RESTART, INPUT_RIGHT, INPUT_UP, MAX_LOOPS,
+                            ScriptedInput, TimeLoopGame)
+
+LEVELS = (0, 1, 2)
+SEEDS = (0, 1, 2)
+TICKS = 3000
+EPISODE_TICKS = 700  # Short enough that the batched runs end and reset episodes along the way
+KEYS = {INPUT_LEFT: pygame.K_LEFT, INPUT_RIGHT: pygame.K_RIGHT, INPUT_UP: pygame.K_UP, INPUT_DOWN: pygame.K_DOWN}
+
+
+def walk(seed, ticks=TICKS):
+    """Actions held for a while each, with a loop restart now and then"""
+    rng = np.random.default_rng(seed)
+    changes = rng.random(ticks) < 0.08
+    held = np.maximum.accumulate(np.where(changes, np.arange(ticks), 0))
+    actions = ACTIONS[:9][rng.integers(9, size=ticks)][held]
+    return actions | np.where(rng.random(ticks) < 0.01, INPUT_RESTART, 0).astype(np.uint8)
+
+
+def scripted(actions):
+    keys = [tuple(key for bit, key in KEYS.items() if action & bit) for action in actions.tolist()]
+    events = {tick: [pygame.event.Event(pygame.KEYDOWN, key=pygame.K_r)]
+              for tick, action in enumerate(actions.tolist()) if action & INPUT_RESTART}
+    return ScriptedInput(keys, events, repeat=False)
+
+
+def game_observation(game):
+    """What TimeLoopEnv should observe, read off the game"""
+    level = game.level
+    ghosts = np.zeros((MAX_LOOPS, 3))
+    ghosts[:len(game.ghosts)] = np.column_stack([np.ones(len(game.ghosts)), game.ghosts.current])
+    pairs = [np.column_stack([store.values(a), store.values(b)]).ravel()
+             for store, a, b in ((level.levers, 'activated', 'cooldown'),
+                                 (level.pressure_plates, 'activated', 'timer'),
+                                 (level.movable_walls, 'active', 'y'))]
+    return np.concatenate([[game.player.x, game.player.y, game.loop_count], ghosts.ravel()] + pairs)
+
+
+@pytest.mark.parametrize('seed', SEEDS)
+@pytest.mark.parametrize('level', LEVELS)
+def test_env_matches_game(level, seed):
+    actions = walk(seed)
+    game = TimeLoopGame(headless=True, input_source=scripted(actions), level=level, seed=seed)
+    game.transition_alpha = 0  # The game ignores restarts while the level fades in
+    env = TimeLoopEnv(level, max_ticks=TICKS)
+    try:
+        for tick, action in enumerate(actions):
+            game.step()
+            observation, _, done, info = env.step(action)
+            assert np.array_equal(observation, game_observation(game)), tick
+            assert info['solved'] == (game.game_state == 'level_complete'), tick
+            if done:
+                break
+    finally:
+        game.close()
+
+
+def batched_run(env, actions):
+    observations = [env.reset()]
+    results = []
+    for tick_actions in actions:
+        observation, reward, done, info = env.step(tick_actions)
+        observations.append(observation.copy())
+        results.append((reward.copy(), done.copy(), {name: values.copy() for name, values in info.items()}))
+    return observations, results
+
+
+@pytest.mark.parametrize('level', LEVELS)
+def test_batched_matches_single(level):
+    actions = np.column_stack([walk(seed) for seed in SEEDS])
+    singles = [TimeLoopEnv(level, max_ticks=EPISODE_TICKS) for _ in SEEDS]
+    observations, results = batched_run(BatchedTimeLoopEnv(len(SEEDS), level, max_ticks=EPISODE_TICKS), actions)
+    for k, single in enumerate(singles):
+        assert np.array_equal(observations[0][k], single.reset())
+    for tick, (reward, done, info) in enumerate(results):
+        for k, single in enumerate(singles):
+            observation, single_reward, single_done, single_info = single.step(actions[tick, k])
+            if single_done:
+                observation = single.reset()  # The batched env resets finished episodes itself
+            assert np.array_equal(observations[tick + 1][k], observation), (tick, k)
+            assert (reward[k], done[k]) == (single_reward, single_done), (tick, k)
+            for name in ('solved', 'truncated', 'ticks', 'loops'):
+                assert info[name][k] == single_info[name], (tick, k, name)
+
+
+@pytest.mark.parametrize('level', LEVELS)
+def test_pooled_matches_batched(level):
+    actions = np.column_stack([walk(seed, EPISODE_TICKS * 2) for seed in SEEDS + (3,)])
+    expected = batched_run(BatchedTimeLoopEnv(actions.shape[1], level, max_ticks=EPISODE_TICKS), actions)
+    pooled = PooledTimeLoopEnv(actions.shape[1], 2, level=level, max_ticks=EPISODE_TICKS)
+    try:
+        observations, results = batched_run(pooled, actions)
+    finally:
+        pooled.close()
+    for tick, (want, got) in enumerate(zip(expected[0], observations)):
+        assert np.array_equal(want, got), tick
+    for tick, (want, got) in enumerate(zip(expected[1], results)):
+        assert np.array_equal(want[0], got[0]) and np.array_equal(want[1], got[1]), tick
+        for name, values in want[2].items():
+            assert np.array_equal(values, got[2][name]), (tick, name)
@@ -0,0 +1,100 @@
+"""GhostSwarm plays every ghost's recording back tick for tick, through
+window refills, seeks, removals and growth."""
+import random
+
+import numpy as np
+
+from time_loop_game import GHOST_WINDOW, KEYFRAME_INTERVAL, GhostSwarm, LoopRecording, ParticlePool
+
+
+def wander(seed, ticks, start=(100, 100), speed=5):
+    """A recording of a random walk, with an occasional jump that the motion
+    bits cannot express; returns it and the positions it recorded"""
+    rng = random.Random(seed)
+    recording = LoopRecording(start, speed)
+    x, y = start
+    positions = []
+    for tick in range(ticks):
+        dx, dy = rng.choice([(speed, 0), (-speed, 0), (0, speed), (0, -speed), (0, 0), (speed, speed)])
+        if rng.random() < 0.01:
+            dx, dy = rng.randint(-40, 40), rng.randint(-40, 40)
+        x, y = x + dx, y + dy
+        recording.record(rng.randrange(16), (x, y))
+        positions.append((x, y))
+    return recording, positions
+
+
+def test_decode_matches_recorded_positions():
+    recording, positions = wander(1, KEYFRAME_INTERVAL * 3 + 17)
+    assert recording.decode(0, len(positions)).tolist() == [list(p) for p in positions]
+    for begin in (0, 1, KEYFRAME_INTERVAL - 1, KEYFRAME_INTERVAL, 500, len(positions) - 3):
+        window = recording.decode(begin, GHOST_WINDOW)
+        assert window.tolist() == [list(p) for p in positions[begin:begin + GHOST_WINDOW]]
+        if begin:
+            assert recording.decode(begin, 10, positions[begin - 1]).tolist() == \
+                [list(p) for p in positions[begin:begin + 10]]
+
+
+def test_playback_follows_recordings_across_windows():
+    swarm = GhostSwarm(ParticlePool())
+    walks = [wander(seed, ticks) for seed, ticks in ((1, GHOST_WINDOW * 3 + 5), (2, 7), (3, GHOST_WINDOW))]
+    for recording, _ in walks:
+        swarm.add(recording)
+    assert swarm.current.tolist() == [list(positions[0]) for _, positions in walks]
+    for tick in range(1, GHOST_WINDOW * 4):
+        swarm.begin_tick()
+        swarm.update()
+        expected = [list(positions[min(tick, len(positions) - 1)]) for _, positions in walks]
+        assert swarm.current.tolist() == expected, tick
+    assert swarm.cursor.tolist() == [len(positions) - 1 for _, positions in walks]
+
+
+def test_seek_matches_playback():
+    recording, positions = wander(4, KEYFRAME_INTERVAL * 2 + 40)
+    swarm = GhostSwarm(ParticlePool())
+    swarm.add(recording)
+    swarm.add(recording)
+    for cursors in ([0, 0], [300, 5], [KEYFRAME_INTERVAL, KEYFRAME_INTERVAL * 2 + 39], [77, 200]):
+        swarm.seek(cursors)
+        assert swarm.current.tolist() == [list(positions[c]) for c in cursors]
+        swarm.update()
+        assert swarm.current.tolist() == [list(positions[min(c + 1, len(positions) - 1)]) for c in cursors]
+
+
+def test_pop_keeps_the_other_ghosts_playing():
+    swarm = GhostSwarm(ParticlePool(), capacity=2)
+    walks = [wander(seed, GHOST_WINDOW + 30) for seed in range(5)]
+    for recording, _ in walks:  # Grows past the initial capacity
+        swarm.add(recording)
+    for _ in range(GHOST_WINDOW + 10):
+        swarm.update()
+    removed = swarm.pop(0)
+    assert removed.recording is walks[0][0]
+    swarm.pop(2)
+    kept = [walks[i] for i in (1, 2, 4)]
+    assert [ghost.index for ghost in swarm] == [0, 1, 2]
+    assert [ghost.recording for ghost in swarm] == [recording for recording, _ in kept]
+    assert swarm.current.tolist() == [list(positions[GHOST_WINDOW + 10]) for _, positions in kept]
+    swarm.update()
+    assert swarm.current.tolist() == [list(positions[GHOST_WINDOW + 11]) for _, positions in kept]
+    assert len(swarm.cursor) == len(swarm.current) == len(swarm) == 3
+
+
+def test_take_moved_reports_new_and_moving_ghosts_once():
+    swarm = GhostSwarm(ParticlePool())
+    still = LoopRecording((50, 50))
+    moving = LoopRecording((50, 50))
+    for tick in range(1, 4):
+        still.record(0, (50, 50))
+        moving.record(0, (50 + 5 * tick, 50))
+    swarm.add(still)
+    swarm.add(moving)
+    assert swarm.take_moved() == [0, 1]  # Where they start
+    assert swarm.take_moved() == []
+    swarm.update()
+    assert swarm.take_moved() == [1]
+    swarm.update()
+    swarm.update()  # The moving ghost reached the end of its loop and holds there
+    assert swarm.take_moved() == [1]
+    swarm.update()
+    assert swarm.take_moved() == []
@@ -0,0 +1,41 @@
+"""Level sources survive compiling into a pack and saving back unchanged, and
+levels with the same compiled layout bake their chunks once."""
+import json
+
+import pygame
+
+from time_loop_game import DEFAULT_LEVEL_PACK, Level, ParticlePool, compile_level_pack, open_level_pack
+
+
+def test_pack_round_trip(tmp_path):
+    with open(DEFAULT_LEVEL_PACK) as f:
+        source = json.load(f)
+    pack = open_level_pack(DEFAULT_LEVEL_PACK)
+    saved = {'levels': [Level(particles=ParticlePool(), data=pack.load(name)).to_json() for name in pack.names]}
+    assert saved == source
+
+    copy = tmp_path / 'levels.json'
+    copy.write_text(json.dumps(saved))
+    recompiled = open_level_pack(compile_level_pack(str(copy)))
+    assert recompiled.names == pack.names
+    for name in pack.names:
+        original, again = pack.load(name), recompiled.load(name)
+        for column in ('walls', 'movable_walls', 'levers', 'plates'):
+            assert getattr(original, column).tolist() == getattr(again, column).tolist()
+
+
+def test_levels_with_one_layout_share_baked_chunks():
+    pack = open_level_pack(DEFAULT_LEVEL_PACK)
+    first, second = (Level(particles=ParticlePool(), data=pack.load(0)) for _ in range(2))
+    view = first.start_view()
+    first.get_static_layer(view)
+    cell = (0, 0)
+    before = pygame.image.tobytes(first.chunks[cell], 'RGB')
+    assert second.get_chunk(cell) is first.chunks[cell]
+
+    # An edit patches the editing level's own copies only
+    second.add_wall(second.chunk_rect(cell).inflate(-100, -100))
+    assert second.static_layer_key is None
+    assert second.chunks[cell] is not first.chunks[cell]
+    assert pygame.image.tobytes(first.chunks[cell], 'RGB') == before
+    assert pygame.image.tobytes(second.chunks[cell], 'RGB') != before
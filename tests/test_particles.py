@@ -0,0 +1,47 @@
+"""ParticlePool keeps live particles packed at the front of its columns, in
+emission order, and grows up to its maximum capacity."""
+import numpy as np
+
+from time_loop_game import ParticlePool
+
+
+def test_dead_particles_are_compacted_away_in_order():
+    pool = ParticlePool(capacity=4)
+    lifetimes = [3, 1, 5, 2, 4, 1]
+    pool.emit_many(np.arange(6, dtype=np.float32), np.zeros(6), np.full((6, 3), 7, dtype=np.uint8),
+                   sizes=np.full(6, 2.0), lifetimes=np.array(lifetimes))
+    assert pool.count == 6 and pool.capacity == 8
+    start = pool.x[:6].copy()
+    drift = pool.dx[:6].copy()
+
+    alive = []
+    for tick in range(1, 6):
+        pool.update()
+        alive.append(pool.count)
+        survivors = [i for i, lifetime in enumerate(lifetimes) if lifetime > tick]
+        assert pool.lifetime[:pool.count].tolist() == [lifetimes[i] - tick for i in survivors]
+        # Every column moved together with its particle
+        assert np.allclose(pool.x[:pool.count], start[survivors] + tick * drift[survivors])
+        assert (pool.color[:pool.count] == 7).all()
+    assert alive == [4, 3, 2, 1, 0]
+    assert pool.bounds() is None
+
+
+def test_sizes_shrink_with_lifetime():
+    pool = ParticlePool()
+    pool.emit(10, 10, (255, 0, 0), size=4, lifetime=4)
+    sizes = []
+    for _ in range(3):
+        pool.update()
+        sizes.append(float(pool.size[0]))
+    assert sizes == [3.0, 1.5, 0.375]
+
+
+def test_growth_stops_at_max_capacity():
+    pool = ParticlePool(capacity=4, max_capacity=16)
+    pool.burst(100, (0, 0, 10, 10), None, (1, 2), (5, 10))
+    assert pool.capacity == pool.count == 16
+    pool.emit(0, 0, (1, 2, 3))
+    assert pool.count == 16
+    pool.clear()
+    assert pool.count == 0 and pool.capacity == 16
@@ -0,0 +1,29 @@
+"""Entering a level uses the preloaded build, or builds it when that failed."""
+import pytest
+
+from time_loop_game import LevelPreloader, ScriptedInput, TimeLoopGame
+
+
+@pytest.fixture
+def game():
+    game = TimeLoopGame(headless=True, input_source=ScriptedInput([()]), seed=1)
+    yield game
+    game.close()
+
+
+def test_enter_level_takes_the_preloaded_level(game):
+    preloaded = game.preloader.future.result()
+    game.enter_level(1)
+    assert game.level is preloaded
+    assert game.level.name == game.level_pack.names[1]
+
+
+def test_enter_level_builds_the_level_when_preloading_failed(game, monkeypatch):
+    def broken(pack, index, particles, texts):
+        raise OSError("worker could not build the level")
+    monkeypatch.setattr(LevelPreloader, 'build', staticmethod(broken))
+    game.preload_next_level()
+    game.enter_level(1)
+    assert game.level.name == game.level_pack.names[1]
+    assert game.level_index == 1
+    assert (game.player.x, game.player.y) == tuple(game.level.start_pos)
@@ -0,0 +1,23 @@
+"""Games only adapt the effect quality while they render a window."""
+from time_loop_game import QUALITY_LEVELS, ScriptedInput, TimeLoopGame, quality
+
+
+def test_new_games_leave_the_preset_alone():
+    quality.set_preset(QUALITY_LEVELS[2])
+    try:
+        game = TimeLoopGame(headless=True, input_source=ScriptedInput([()]), seed=1)
+        game.close()
+        assert quality.preset == QUALITY_LEVELS[2]
+    finally:
+        quality.set_preset(QUALITY_LEVELS[0])
+
+
+def test_headless_games_never_adapt():
+    game = TimeLoopGame(headless=True, input_source=ScriptedInput([()]), seed=1)
+    try:
+        assert not game.quality.adaptive
+        for _ in range(100):
+            assert not game.quality.observe(1000.0)
+        assert quality.preset == QUALITY_LEVELS[0]
+    finally:
+        game.close()
@@ -0,0 +1,32 @@
+"""LoopRecording stores a loop as one byte per tick plus sparse keyframes and
+decodes it back to the positions that were recorded."""
+from time_loop_game import (INPUT_DOWN, INPUT_RIGHT, KEYFRAME_INTERVAL, MOTION_DOWN, MOTION_RIGHT,
+                            LoopRecording)
+
+
+def test_round_trip_with_a_byte_per_tick():
+    recording = LoopRecording((0, 0))
+    positions = []
+    x = y = 0
+    for tick in range(KEYFRAME_INTERVAL * 4):
+        if tick % 3:
+            x += 5
+        if tick % 7 == 0:
+            y += 5
+        recording.record(INPUT_RIGHT | INPUT_DOWN, (x, y))
+        positions.append([x, y])
+    assert len(recording) == len(recording.ticks) == len(positions)
+    assert recording.ticks.itemsize == 1
+    # Only the periodic seek keyframes: every step was expressible in motion bits
+    assert sorted(recording.keyframes) == list(range(0, len(positions), KEYFRAME_INTERVAL))
+    assert recording.decode(0, len(positions)).tolist() == positions
+    assert recording.ticks[1] == INPUT_RIGHT | INPUT_DOWN | MOTION_RIGHT
+    assert recording.ticks[7] & MOTION_DOWN
+
+
+def test_jumps_are_kept_as_keyframes():
+    recording = LoopRecording.from_positions([(10, 10), (15, 10), (200, 40), (205, 45), (205, 45)], start=(10, 10))
+    assert 2 in recording.keyframes
+    assert recording.decode(0, 5).tolist() == [[10, 10], [15, 10], [200, 40], [205, 45], [205, 45]]
+    assert recording.decode(3, 10).tolist() == [[205, 45], [205, 45]]
+    assert recording.decode(5, 10).tolist() == []
@@ -0,0 +1,71 @@
+"""TickScheduler runs expirations on their tick and tweens every tick until
+they finish; cancelling or replacing a key drops what it had pending."""
+from time_loop_game import TickScheduler
+
+
+def test_expirations_run_in_order_and_can_be_replaced():
+    scheduler = TickScheduler()
+    ran = []
+    scheduler.at(3, 'a', lambda key: ran.append((scheduler.now, key)))
+    scheduler.at(2, 'b', lambda key: ran.append((scheduler.now, key)))
+    scheduler.at(2, 'c', lambda key: ran.append((scheduler.now, key)))
+    scheduler.at(5, 'b', lambda key: ran.append((scheduler.now, key + '!')))  # Replaces b's tick 2
+    scheduler.at(4, 'd', lambda key: ran.append((scheduler.now, key)))
+    scheduler.cancel('d')
+    for _ in range(6):
+        scheduler.advance()
+    assert ran == [(2, 'c'), (3, 'a'), (5, 'b!')]
+    assert scheduler.pending == {}
+
+
+def test_tweens_step_until_done():
+    scheduler = TickScheduler()
+    steps = {'x': 0, 'y': 0}
+    order = []
+
+    def count(key, until):
+        steps[key] += 1
+        order.append(key)
+        return steps[key] < until
+
+    scheduler.tween('x', lambda key: count(key, 3))
+    scheduler.tween('y', lambda key: count(key, 10))
+    for _ in range(5):
+        scheduler.advance()
+    assert steps == {'x': 3, 'y': 5}
+    assert order[:4] == ['x', 'y', 'x', 'y']
+    assert list(scheduler.tweens) == ['y']
+
+    scheduler.cancel('y')
+    scheduler.advance()
+    assert steps['y'] == 5 and scheduler.tweens == {}
+
+
+def test_a_tween_replaced_while_stepping_survives():
+    scheduler = TickScheduler()
+    seen = []
+
+    def first(key):
+        seen.append('first')
+        scheduler.tween(key, second)
+        return False  # Done, but a new tween already took its place
+
+    def second(key):
+        seen.append('second')
+        return True
+
+    scheduler.tween('k', first)
+    scheduler.advance()
+    scheduler.advance()
+    assert seen == ['first', 'second']
+    assert scheduler.tweens == {'k': second}
+
+    # Tweens step before the expirations due on the same tick
+    scheduler.at(scheduler.now + 1, 'k', lambda key: seen.append('expired'))
+    scheduler.advance()
+    assert seen[-2:] == ['second', 'expired']
+
+    scheduler.at(scheduler.now + 1, 'k', lambda key: seen.append('expired'))
+    scheduler.clear()
+    scheduler.advance()
+    assert seen[-1] == 'expired' and len(seen) == 4 and scheduler.now == 4
@@ -0,0 +1,23 @@
+"""The solver finds a level's solution, and its witness plays back to the goal
+in the game and as a recorded replay."""
+from level_solver import RESTART, solve, write_witness
+from time_loop_game import TimeLoopGame
+
+
+def test_default_level_solves_without_ghosts(tmp_path):
+    report = solve('default', max_loops=0)
+    assert report['solved'] and report['loops'] == 0 and report['searches'] == 1
+    script = report['script']
+    assert script and RESTART not in script
+
+    path = str(tmp_path / 'solution.tlr')
+    assert write_witness(script, path, 'default', max_loops=0)
+
+    game = TimeLoopGame(headless=True, replay_path=path)
+    try:
+        while game.step():
+            pass
+        assert game.replay_mismatches == 0
+        assert game.game_state == 'level_complete'
+    finally:
+        game.close()
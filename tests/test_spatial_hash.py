@@ -0,0 +1,49 @@
+"""SpatialHash buckets rects by grid cell; queries see exactly the entries a
+brute-force scan over every rect would, through inserts, moves and removals."""
+import random
+
+import pygame
+
+from time_loop_game import SpatialHash
+
+
+def brute_force(entries, rect, kinds=None):
+    return {id(entry) for entry in entries
+            if entry.rect.colliderect(rect) and (kinds is None or entry.kind in kinds)}
+
+
+def test_insert_move_remove_match_brute_force():
+    rng = random.Random(3)
+    index = SpatialHash(32)
+    entries = []
+    for i in range(200):
+        rect = (rng.randrange(-100, 500), rng.randrange(-100, 500), rng.randrange(1, 90), rng.randrange(1, 90))
+        entries.append(index.insert(rect, rng.choice(['wall', 'plate']), i))
+    for step in range(300):
+        entry = rng.choice(entries)
+        if step % 3 == 0:
+            index.move(entry, entry.rect.move(rng.randrange(-40, 41), rng.randrange(-40, 41)))
+        elif step % 7 == 0:
+            index.remove(entry)
+            entries.remove(entry)
+        query = pygame.Rect(rng.randrange(-100, 500), rng.randrange(-100, 500), rng.randrange(1, 120), 50)
+        assert {id(entry) for entry in index.query(query)} == brute_force(entries, query)
+        assert {id(entry) for entry in index.query(query, ('wall',))} == brute_force(entries, query, ('wall',))
+        first = index.first(query)
+        assert (first is None) == (not brute_force(entries, query))
+    # Every entry sits in exactly the cells its rect covers, and no bucket is left empty
+    for entry in entries:
+        assert entry.cells == index.cell_range(entry.rect)
+        assert all(entry in index.cells[cell] for cell in entry.cells)
+    assert all(index.cells.values())
+    assert sum(map(len, index.cells.values())) == sum(len(entry.cells) for entry in entries)
+
+
+def test_removed_entry_is_gone():
+    index = SpatialHash(64)
+    entry = index.insert((60, 60, 10, 10), 'lever', 'a')
+    assert len(entry.cells) == 4
+    assert index.first(pygame.Rect(0, 0, 100, 100), accept=lambda found: found.entity == 'a') is entry
+    index.remove(entry)
+    assert entry.cells == () and index.cells == {}
+    assert index.query(pygame.Rect(0, 0, 200, 200)) == []
@@ -0,0 +1,96 @@
+"""A live game streamed over loopback decodes to the game's own state."""
+import random
+import socket
+import time
+
+import pygame
+import pytest
+
+from time_loop_game import SPECTATOR_HOST, ScriptedInput, SpectatorDecoder, SpectatorServer, TimeLoopGame
+
+TICKS = 1200
+RESTARTS = (300, 700, 1000)
+
+
+def wander(seed, ticks):
+    """Held keys that change now and then, with a few loop restarts"""
+    rng = random.Random(seed)
+    keys = [pygame.K_LEFT, pygame.K_RIGHT, pygame.K_UP, pygame.K_DOWN]
+    script = []
+    held = ()
+    for _ in range(ticks):
+        if rng.random() < 0.05:
+            held = tuple(rng.sample(keys, rng.randint(0, 2)))
+        script.append(held)
+    events = {tick: [pygame.event.Event(pygame.KEYDOWN, key=pygame.K_r)] for tick in RESTARTS}
+    return ScriptedInput(script, events, repeat=False)
+
+
+def game_snapshot(game):
+    level = game.level
+    ghosts = game.ghosts
+    return {
+        'tick': game.tick - 1,
+        'level': level.name,
+        'player': [game.player.x, game.player.y],
+        'loop': game.loop_count,
+        'ghosts': [[cursor, x, y] for cursor, (x, y) in zip(ghosts.cursor.tolist(), ghosts.current.tolist())],
+        'levers': [list(row) for row in level.levers.rows('activated', 'cooldown')],
+        'plates': [list(row) for row in level.pressure_plates.rows('activated', 'timer')],
+        'movable_walls': [list(row) for row in level.movable_walls.rows('active', 'y')],
+    }
+
+
+def receive(client, decoder, received):
+    try:
+        data = client.recv(65536)
+    except BlockingIOError:
+        return True
+    if not data:
+        return False
+    decoder.feed(data, lambda: received.__setitem__(decoder.tick, decoder.snapshot()))
+    return True
+
+
+def test_loopback_stream_matches_game():
+    game = TimeLoopGame(headless=True, input_source=wander(3, TICKS), seed=3, spectate=0)
+    try:
+        client = socket.create_connection((SPECTATOR_HOST, game.spectator.port), timeout=5)
+        deadline = time.monotonic() + 5
+        while not game.spectator.clients and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert game.spectator.clients
+        client.setblocking(False)
+        decoder = SpectatorDecoder()
+        expected = {}
+        received = {}
+        for _ in range(TICKS):
+            game.step()
+            expected[game.tick - 1] = game_snapshot(game)
+            receive(client, decoder, received)
+        client.settimeout(5)
+        while decoder.tick != TICKS - 1 and receive(client, decoder, received):
+            pass
+        client.close()
+    finally:
+        game.close()
+    assert game.loop_count == len(RESTARTS)
+    assert decoder.tick == TICKS - 1
+    assert game.spectator.lagged == 0
+    assert len(received) == TICKS
+    for tick, snapshot in received.items():
+        assert snapshot == expected[tick], tick
+
+
+def test_taken_port_raises_instead_of_hanging():
+    server = SpectatorServer(port=0)
+    try:
+        with pytest.raises(OSError):
+            SpectatorServer(port=server.port)
+    finally:
+        server.close()
+
+
+def test_bad_host_raises():
+    with pytest.raises(OSError):
+        SpectatorServer(host='no-such-host.invalid', port=0)
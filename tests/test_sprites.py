@@ -0,0 +1,49 @@
+"""SpriteCache quantizes sizes and alphas into a bounded LRU of sprites, and the
+particle pool's batched draw paints exactly what one blit per particle would."""
+import pygame
+
+from time_loop_game import ParticlePool, SpriteCache, sprite_cache
+
+
+def test_quantized_requests_share_a_sprite():
+    cache = SpriteCache()
+    sprite = cache.get('circle', (10, 20, 30), 2.2, 250)
+    assert cache.get('circle', (10, 20, 30, 99), 2.0, 255) is sprite
+    assert cache.stats() == {'entries': 1, 'hits': 1, 'misses': 1, 'evictions': 0}
+    assert sprite.get_size() == (4, 4)
+    assert cache.get('rect', (10, 20, 30), (0.2, 5)) is None
+
+
+def test_least_recently_used_is_evicted():
+    cache = SpriteCache(max_entries=2)
+    a = cache.get('circle', (255, 0, 0), 3)
+    b = cache.get('circle', (0, 255, 0), 3)
+    assert cache.get('circle', (255, 0, 0), 3) is a  # a is now the most recent
+    cache.get('circle', (0, 0, 255), 3)
+    assert cache.evictions == 1 and len(cache.sprites) == 2
+    assert cache.get('circle', (255, 0, 0), 3) is a
+    assert cache.get('circle', (0, 255, 0), 3) is not b
+    assert cache.stats()['misses'] == 4
+
+
+def blit_one_by_one(pool, screen, view):
+    for i in range(pool.count):
+        alpha = 255 * int(pool.lifetime[i]) // int(pool.max_lifetime[i])
+        sprite = sprite_cache.get('circle', pool.color[i].tolist(), float(pool.size[i]), alpha)
+        if sprite is not None:
+            half = sprite.get_width() / 2
+            screen.blit(sprite, (float(pool.x[i] - view.x) - half, float(pool.y[i] - view.y) - half))
+
+
+def test_batched_draw_matches_single_blits():
+    pool = ParticlePool()
+    pool.seed(5)
+    for _ in range(8):
+        pool.burst(300, (0, 0, 400, 300), None, (0.1, 6), (5, 40))
+    view = pygame.Rect(20, 10, 300, 200)
+    for _ in range(10):
+        pool.update()
+        batched, single = pygame.Surface(view.size), pygame.Surface(view.size)
+        pool.draw(batched, view)
+        blit_one_by_one(pool, single, view)
+        assert pygame.image.tobytes(batched, 'RGB') == pygame.image.tobytes(single, 'RGB')
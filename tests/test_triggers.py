@@ -0,0 +1,59 @@
+"""TriggerSystem fires enter, stay and exit as movers report their rects, and
+counts how many movers are inside each volume."""
+import pygame
+
+from time_loop_game import TriggerSystem
+
+
+def recording_system():
+    triggers = TriggerSystem(cell_size=32)
+    events = []
+    for event in ('enter', 'stay', 'exit'):
+        for kind in ('plate', 'goal'):
+            triggers.subscribe(event, kind, lambda entity, mover, event=event: events.append((event, entity, mover)))
+    return triggers, events
+
+
+def test_enter_stay_exit():
+    triggers, events = recording_system()
+    plate = triggers.add_volume((100, 100, 40, 10), 'plate', 'plate')
+    goal = triggers.add_volume((300, 100, 50, 50), 'goal', 'goal')
+
+    triggers.move('player', pygame.Rect(0, 0, 20, 20))
+    assert events == [] and not triggers.occupied(plate)
+    triggers.move('player', pygame.Rect(110, 95, 20, 20))
+    triggers.move('player', pygame.Rect(115, 95, 20, 20))
+    triggers.move('ghost', pygame.Rect(100, 100, 20, 20))
+    assert events == [('enter', 'plate', 'player'), ('stay', 'plate', 'player'), ('enter', 'plate', 'ghost')]
+    assert triggers.occupants[id(plate)] == 2
+
+    events.clear()
+    # One report can leave one volume and enter another
+    triggers.move('player', pygame.Rect(320, 110, 20, 20))
+    assert events == [('exit', 'plate', 'player'), ('enter', 'goal', 'player')]
+    assert triggers.occupied(plate) and triggers.occupied(goal)
+
+    events.clear()
+    triggers.remove_mover('ghost')
+    assert events == [('exit', 'plate', 'ghost')] and not triggers.occupied(plate)
+    assert 'ghost' not in triggers.inside
+
+
+def test_silent_moves_and_removed_volumes():
+    triggers, events = recording_system()
+    plate = triggers.add_volume((0, 0, 50, 50), 'plate', 'plate')
+    triggers.move('ghost', pygame.Rect(10, 10, 20, 20), silent=True)
+    assert events == [] and triggers.occupied(plate)
+
+    # A moved volume is noticed on the mover's next report
+    triggers.move_volume(plate, (200, 200, 50, 50))
+    triggers.move('ghost', pygame.Rect(10, 10, 20, 20))
+    assert events == [('exit', 'plate', 'ghost')] and not triggers.occupied(plate)
+    triggers.move('ghost', pygame.Rect(210, 210, 20, 20))
+    assert events[-1] == ('enter', 'plate', 'ghost')
+
+    events.clear()
+    triggers.remove_volume(plate)
+    assert triggers.inside == {} and not triggers.occupied(plate)
+    triggers.move('ghost', pygame.Rect(200, 200, 20, 20))
+    assert events == []
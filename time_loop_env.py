@@ -0,0 +1,647 @@
+"""Rendering-free environments for playing Time Loop Puzzle Game levels from code.
+
+Agents (e.g. for tuning level difficulty) drive a level through reset() and
+step() instead of the game window:
+
+    env = BatchedTimeLoopEnv(1024, level='switchback')
+    observations = env.reset()
+    observations, rewards, dones, info = env.step(ACTIONS[choices])
+
+There are three environments with the same rules, tick for tick:
+
+    TimeLoopEnv          one level played by the game's own Level, Player and
+                         GhostSwarm, without a window, sound or HUD
+    BatchedTimeLoopEnv   N independent copies of a level stepped in lockstep
+                         with NumPy, hundreds of thousands of steps a second
+    PooledTimeLoopEnv    a BatchedTimeLoopEnv split across worker processes
+
+An action is an input byte as written to replays: the INPUT_LEFT, INPUT_RIGHT,
+INPUT_UP and INPUT_DOWN bits of the keys held for the tick, plus
+INPUT_RESTART to start a new loop first. ACTIONS lists the ten that matter.
+
+An observation is a float32 vector: player x and y and the loop count, then
+present, x and y per ghost slot (max_loops slots, oldest ghost first),
+activated and cooldown per lever, activated and timer per plate, and active
+and y per movable wall. layout gives the counts.
+
+A step is rewarded goal_reward when it reaches the goal and tick_reward
+otherwise. An episode is done when the goal is reached or after max_ticks.
+
+Run as a script to measure throughput under a random policy:
+
+    python time_loop_env.py --envs 4096 --steps 1000
+    python time_loop_env.py --envs 4096 --workers 4
+    python time_loop_env.py --single --steps 20000
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+
+# Must be set before pygame is imported so no window or audio device is needed
+os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+os.environ.setdefault('SDL_AUDIODRIVER', 'dummy')
+os.environ.setdefault('PYGAME_HIDE_SUPPORT_PROMPT', '1')
+
+import numpy as np
+import pygame
+
+from time_loop_game import (DEFAULT_LEVEL_PACK, INPUT_DOWN, INPUT_LEFT, INPUT_RESTART, INPUT_RIGHT, INPUT_UP,
+                            MAX_LOOPS, GhostSwarm, Lever, Level, ParticlePool, Player, open_level_pack)
+
+# Idle, 4 directions, 4 diagonals and restarting the loop
+ACTIONS = np.array([0, INPUT_LEFT, INPUT_RIGHT, INPUT_UP, INPUT_DOWN,
+                    INPUT_LEFT | INPUT_UP, INPUT_LEFT | INPUT_DOWN,
+                    INPUT_RIGHT | INPUT_UP, INPUT_RIGHT | INPUT_DOWN, INPUT_RESTART], dtype=np.uint8)
+
+MAX_EPISODE_TICKS = 60 * 60  # One minute of game time
+GOAL_REWARD = 1.0
+TICK_REWARD = -0.001  # Every tick spent short of the goal
+
+NO_VIEW = pygame.Rect(0, 0, 0, 0)  # Trails and particles are only produced in view, so none are
+NO_TICK = -1  # No plate release pending
+FAR = 2 ** 40  # Where empty trigger rects are parked, out of everyone's reach
+
+
+def observation_layout(level, max_loops):
+    return {'ghosts': max_loops, 'levers': len(level.levers),
+            'plates': len(level.pressure_plates), 'movable_walls': len(level.movable_walls)}
+
+
+def observation_size(layout):
+    return 3 + 3 * layout['ghosts'] + 2 * (layout['levers'] + layout['plates'] + layout['movable_walls'])
+
+
+def rect_array(rects):
+    """Rects as an (n, 4) array of left, top, right, bottom. pygame never
+    reports a collision with an empty rect, so those are parked far away."""
+    array = np.array([(rect.left, rect.top, rect.right, rect.bottom) for rect in rects],
+                     dtype=np.int64).reshape(-1, 4)
+    array[(array[:, 2] <= array[:, 0]) | (array[:, 3] <= array[:, 1])] = FAR
+    return array
+
+
+def overlap(x, y, size, rects):
+    """Whether a size x size square at x, y (arrays of any shape) collides
+    with each of rects (see rect_array); shape (..., len(rects))"""
+    x, y = x[..., None], y[..., None]
+    return (x < rects[:, 2]) & (x + size > rects[:, 0]) & (y < rects[:, 3]) & (y + size > rects[:, 1])
+
+
+class TimeLoopEnv:
+    """One level played by the game's own Level, Player and GhostSwarm, with
+    the window, sound, HUD and game loop left out. It runs exactly the game's
+    code, so it is the reference the batched environment is checked against."""
+    def __init__(self, level=0, level_pack=DEFAULT_LEVEL_PACK, max_loops=MAX_LOOPS,
+                 max_ticks=MAX_EPISODE_TICKS, goal_reward=GOAL_REWARD, tick_reward=TICK_REWARD):
+        self.data = open_level_pack(level_pack).load(level)
+        self.max_loops = max_loops
+        self.max_ticks = max_ticks
+        self.goal_reward = goal_reward
+        self.tick_reward = tick_reward
+        self.particles = ParticlePool()  # Effects are still emitted, and dropped every tick
+        self.reset()
+
+    def reset(self):
+        """Start a new episode from a fresh copy of the level; returns the
+        first observation"""
+        self.level = Level(particles=self.particles, data=self.data)
+        self.player = Player(*self.level.start_pos, particles=self.particles)
+        self.player.world = self.level.world
+        self.ghosts = GhostSwarm(self.particles)
+        self.level.triggers.move('player', self.player.rect())
+        self.layout = observation_layout(self.level, self.max_loops)
+        self.observation_size = observation_size(self.layout)
+        self.loop_count = 0
+        self.tick = 0
+        self.particles.clear()
+        return self.observe()
+
+    def restart_loop(self):
+        """TimeLoopGame.restart_loop, less the ghost colors and the sound"""
+        if len(self.player.recording):
+            self.ghosts.add(self.player.recording)
+        if len(self.ghosts) > self.max_loops:
+            self.level.triggers.remove_mover(self.ghosts.pop(0))
+        self.player.reset_position(*self.level.start_pos)
+        self.level.triggers.move('player', self.player.rect())
+        self.loop_count += 1
+
+    def step(self, action):
+        """Play one tick; returns (observation, reward, done, info). Call
+        reset() once an episode is done."""
+        action = int(action)
+        level, player = self.level, self.player
+        if action & INPUT_RESTART:
+            self.restart_loop()
+        dx = 1 if action & INPUT_RIGHT else -1 if action & INPUT_LEFT else 0
+        dy = 1 if action & INPUT_DOWN else -1 if action & INPUT_UP else 0
+        if dx or dy:
+            level.move_player(player, dx, dy)
+        player.record(action & 0x0F)
+        level.update(NO_VIEW)
+        self.ghosts.update(NO_VIEW)
+        for index in self.ghosts.take_moved():
+            ghost = self.ghosts[index]
+            level.triggers.move(ghost, ghost.rect())
+        self.particles.clear()
+        self.tick += 1
+
+        solved = level.player_at_goal
+        truncated = not solved and self.tick >= self.max_ticks
+        reward = self.goal_reward if solved else self.tick_reward
+        info = {'solved': solved, 'truncated': truncated, 'ticks': self.tick, 'loops': self.loop_count}
+        return self.observe(), reward, solved or truncated, info
+
+    def observe(self):
+        level, ghosts = self.level, self.ghosts
+        observation = np.zeros(self.observation_size, dtype=np.float32)
+        observation[:3] = self.player.x, self.player.y, self.loop_count
+        slots = observation[3:3 + 3 * self.max_loops].reshape(-1, 3)
+        slots[:len(ghosts), 0] = 1
+        slots[:len(ghosts), 1:] = ghosts.current
+        column = 3 + 3 * self.max_loops
+        for store, flag, value in ((level.levers, 'activated', 'cooldown'),
+                                   (level.pressure_plates, 'activated', 'timer'),
+                                   (level.movable_walls, 'active', 'y')):
+            width = 2 * len(store)
+            observation[column:column + width:2] = store.values(flag)
+            observation[column + 1:column + width:2] = store.values(value)
+            column += width
+        return observation
+
+
+class BatchedTimeLoopEnv:
+    """num_envs independent copies of one level, stepped in lockstep. Each
+    env is a row of NumPy arrays and a tick is the same few dozen array
+    operations whatever the number of envs, following the game step by step:
+    collision resolution, trigger enter events, lever cooldowns, plate
+    timers and wall slides.
+
+    Static walls are baked into a grid of the positions the player can
+    stand on. Each env keeps a ring of max_loops + 1 loop recordings, one
+    motion code per tick: the newest is being recorded and the ones behind
+    it are the ghosts, replayed from their codes, so recordings take
+    num_envs * (max_loops + 1) * max_ticks bytes. Cooldowns and timers are
+    deadlines on one clock shared by every env, like the Level's
+    TickScheduler.
+
+    Envs whose episode ends are reset within step(), so the observation
+    returned for them is the first of their next episode."""
+    def __init__(self, num_envs, level=0, level_pack=DEFAULT_LEVEL_PACK, max_loops=MAX_LOOPS,
+                 max_ticks=MAX_EPISODE_TICKS, goal_reward=GOAL_REWARD, tick_reward=TICK_REWARD):
+        self.num_envs = num_envs
+        self.level = Level(particles=ParticlePool(), data=open_level_pack(level_pack).load(level))
+        self.max_loops = max_loops
+        self.max_ticks = max_ticks
+        self.goal_reward = goal_reward
+        self.tick_reward = tick_reward
+        self.layout = observation_layout(self.level, max_loops)
+        self.observation_size = observation_size(self.layout)
+        self.setup_geometry()
+
+        n, slots, levers = num_envs, max_loops + 1, len(self.lever_rects)
+        plates, walls = len(self.plate_rects), len(self.wall_home)
+        self.now = 0  # Ticks stepped, the clock every deadline is on
+        self.rows = np.arange(n)
+        self.slots = np.arange(slots)
+        self.x = np.zeros(n, dtype=np.int64)
+        self.y = np.zeros(n, dtype=np.int64)
+        self.ticks = np.zeros(n, dtype=np.int64)  # Into the episode
+        self.loops = np.zeros(n, dtype=np.int64)
+        # Trigger volumes the player was inside when it last reported
+        self.at_goal = np.zeros(n, dtype=bool)
+        self.player_levers = np.zeros((n, levers), dtype=bool)
+        self.player_plates = np.zeros((n, plates), dtype=bool)
+        self.lever_activated = np.zeros((n, levers), dtype=bool)
+        self.lever_deadline = np.zeros((n, levers), dtype=np.int64)
+        self.plate_activated = np.zeros((n, plates), dtype=bool)
+        self.plate_deadline = np.zeros((n, plates), dtype=np.int64)
+        self.plate_holding = np.zeros((n, plates), dtype=bool)  # Timer kept full while occupied
+        self.plate_release = np.zeros((n, plates), dtype=np.int64)  # Tick it pops up at, if still due
+        self.wall_active = np.zeros((n, walls), dtype=bool)
+        self.wall_y = np.zeros((n, walls), dtype=np.int64)
+        # Loop recordings: head is the slot being recorded
+        self.head = np.zeros(n, dtype=np.int64)
+        self.motions = np.zeros((n, slots, max_ticks), dtype=np.uint8)
+        self.lengths = np.zeros((n, slots), dtype=np.int64)
+        self.ghost = np.zeros((n, slots), dtype=bool)  # Slot holds a ghost
+        self.cursor = np.zeros((n, slots), dtype=np.int64)
+        self.ghost_x = np.zeros((n, slots), dtype=np.int64)
+        self.ghost_y = np.zeros((n, slots), dtype=np.int64)
+        self.fresh = np.zeros((n, slots), dtype=bool)  # Added, not reported to the triggers yet
+        self.ghost_plates = np.zeros((n, slots, plates), dtype=bool)
+        self.reset()
+
+    def setup_geometry(self):
+        """Read everything that never changes from the level"""
+        level = self.level
+        player = Player(*level.start_pos)
+        self.size, self.speed = player.size, player.speed
+        self.start = level.start_pos
+        world = level.world
+        self.bounds = (world.left, world.right - self.size, world.top, world.bottom - self.size)
+        # The player only ever moves by speed, so it stays on the lattice of its start
+        self.origin = (world.left + (self.start[0] - world.left) % self.speed,
+                       world.top + (self.start[1] - world.top) % self.speed)
+        # Motion code (dx + 1) * 3 + dy + 1 -> step
+        self.deltas = self.speed * np.array([(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)])
+        self.wall_grid = self.bake_walls(level.walls)
+
+        levers, plates, walls = level.levers, level.pressure_plates, level.movable_walls
+        self.lever_rects = rect_array([lever.rect for lever in levers])
+        self.lever_links = np.zeros((len(levers), len(walls)), dtype=np.int64)
+        for i, lever in enumerate(levers):
+            if lever.linked_wall is not None and lever.linked_wall < len(walls):
+                self.lever_links[i, lever.linked_wall] = 1
+        self.plate_rects = rect_array([plate.rect for plate in plates])
+        self.plate_duration = plates.values('duration').astype(np.int64)
+        self.goal_rect = rect_array([level.goal_rect])
+        self.wall_x = walls.values('x').astype(np.int64)
+        self.wall_right = self.wall_x + walls.values('width')
+        self.wall_height = walls.values('height').astype(np.int64)
+        self.wall_solid = (walls.values('width') > 0) & (self.wall_height > 0)
+        self.wall_home = walls.values('y').astype(np.int64)
+        self.wall_speed = walls.values('speed').astype(np.int64)
+        self.wall_target = world.bottom + 50  # Where an inactive wall slides to
+
+    def bake_walls(self, walls):
+        """Which lattice positions put the player inside a static wall, as a
+        (columns, rows) grid"""
+        left, right, top, bottom = self.bounds
+        xs = np.arange(self.origin[0], right + 1, self.speed)
+        ys = np.arange(self.origin[1], bottom + 1, self.speed)
+        grid = np.zeros((len(xs), len(ys)), dtype=bool)
+        walls = np.array(walls, dtype=np.int64).reshape(-1, 4)
+        walls = walls[(walls[:, 2] > 0) & (walls[:, 3] > 0)]
+        # The player at x collides with a wall when wall x - size < x < wall x + width
+        spans = zip(np.searchsorted(xs, walls[:, 0] - self.size, 'right').tolist(),
+                    np.searchsorted(xs, walls[:, 0] + walls[:, 2], 'left').tolist(),
+                    np.searchsorted(ys, walls[:, 1] - self.size, 'right').tolist(),
+                    np.searchsorted(ys, walls[:, 1] + walls[:, 3], 'left').tolist())
+        for x0, x1, y0, y1 in spans:
+            grid[x0:x1, y0:y1] = True
+        return grid
+
+    def reset(self, rows=None):
+        """Start new episodes in every env, or in rows; returns the
+        observations of every env"""
+        rows = self.rows if rows is None else rows
+        self.x[rows], self.y[rows] = self.start
+        self.ticks[rows] = 0
+        self.loops[rows] = 0
+        self.at_goal[rows] = False
+        self.player_levers[rows] = False
+        self.player_plates[rows] = False
+        self.lever_activated[rows] = False
+        self.lever_deadline[rows] = self.now
+        self.plate_activated[rows] = False
+        self.plate_deadline[rows] = self.now
+        self.plate_holding[rows] = False
+        self.plate_release[rows] = NO_TICK
+        self.wall_active[rows] = True
+        self.wall_y[rows] = self.wall_home
+        self.head[rows] = 0
+        self.lengths[rows] = 0
+        self.ghost[rows] = False
+        self.cursor[rows] = 0
+        self.fresh[rows] = False
+        self.ghost_plates[rows] = False
+        # The level reports where the player starts as it is entered
+        self.report(rows)
+        return self.observe()
+
+    def step(self, actions):
+        """Play one tick in every env, actions holding one input byte per
+        env. Returns (observations, rewards, dones, info); info has solved,
+        truncated, ticks and loops per env, for the episode that just ended
+        where one did."""
+        actions = np.asarray(actions)
+        restart = np.flatnonzero(actions & INPUT_RESTART)
+        if len(restart):
+            self.restart_loop(restart)
+        x0, y0 = self.x.copy(), self.y.copy()
+        dx = np.where(actions & INPUT_RIGHT, 1, np.where(actions & INPUT_LEFT, -1, 0))
+        dy = np.where(actions & INPUT_DOWN, 1, np.where(actions & INPUT_UP, -1, 0))
+        moving = np.flatnonzero(dx | dy)
+        if len(moving):
+            self.move_player(moving, dx[moving], dy[moving])
+        self.record(x0, y0)
+        self.now += 1
+        self.advance()
+        self.update_ghosts()
+        self.ticks += 1
+
+        solved = self.at_goal.copy()
+        truncated = ~solved & (self.ticks >= self.max_ticks)
+        dones = solved | truncated
+        rewards = np.where(solved, self.goal_reward, self.tick_reward).astype(np.float32)
+        info = {'solved': solved, 'truncated': truncated, 'ticks': self.ticks.copy(), 'loops': self.loops.copy()}
+        if dones.any():
+            self.reset(np.flatnonzero(dones))
+        return self.observe(), rewards, dones, info
+
+    def restart_loop(self, rows):
+        """The loop being recorded becomes a ghost (unless nothing was
+        recorded yet), the oldest ghost goes if there are too many and the
+        player is back at the start"""
+        head = self.head[rows]
+        recorded = self.lengths[rows, head] > 0
+        added, head = rows[recorded], head[recorded]
+        if len(added):
+            self.ghost[added, head] = True
+            self.cursor[added, head] = 0
+            self.fresh[added, head] = True
+            first = self.deltas[self.motions[added, head, 0]]
+            self.ghost_x[added, head] = self.start[0] + first[:, 0]
+            self.ghost_y[added, head] = self.start[1] + first[:, 1]
+            # Recording goes on in the slot after, which held the oldest ghost if the ring is full
+            head = (head + 1) % len(self.slots)
+            self.head[added] = head
+            self.ghost[added, head] = False
+            self.lengths[added, head] = 0
+            self.fresh[added, head] = False
+            self.ghost_plates[added, head] = False
+        self.x[rows], self.y[rows] = self.start
+        self.loops[rows] += 1
+        self.report(rows)
+
+    def bounded_step(self, x, y, dx, dy):
+        """Player.move: each axis only moves if it stays inside the world"""
+        left, right, top, bottom = self.bounds
+        new_x, new_y = x + dx * self.speed, y + dy * self.speed
+        return (np.where((new_x >= left) & (new_x <= right), new_x, x),
+                np.where((new_y >= top) & (new_y <= bottom), new_y, y))
+
+    def collides(self, rows, x, y):
+        """Level.check_collision for the player at x, y in rows"""
+        hit = self.wall_grid[(x - self.origin[0]) // self.speed, (y - self.origin[1]) // self.speed]
+        if len(self.wall_home):
+            wall_y = self.wall_y[rows]
+            x, y = x[:, None], y[:, None]
+            hit |= (self.wall_active[rows] & self.wall_solid & (x < self.wall_right) & (x + self.size > self.wall_x) &
+                    (y < wall_y + self.wall_height) & (y + self.size > wall_y)).any(axis=1)
+        return hit
+
+    def move_player(self, rows, dx, dy):
+        """Level.move_player for the envs in rows"""
+        x0, y0 = self.x[rows], self.y[rows]
+        x, y = self.bounded_step(x0, y0, dx, dy)
+        hit = self.collides(rows, x, y)
+        if hit.any():
+            back_x, back_y = self.bounded_step(x, y, -dx, -dy)
+            x, y = np.where(hit, back_x, x), np.where(hit, back_y, y)
+        self.x[rows], self.y[rows] = x, y
+        self.report(rows[~hit & ((x != x0) | (y != y0))])
+
+    def report(self, rows):
+        """The player reports its position to the triggers in rows: levers
+        and plates it entered fire, and whether it is at the goal updates"""
+        if not len(rows):
+            return
+        x, y = self.x[rows], self.y[rows]
+        self.at_goal[rows] = overlap(x, y, self.size, self.goal_rect)[:, 0]
+        if len(self.lever_rects):
+            inside = overlap(x, y, self.size, self.lever_rects)
+            entered = inside & ~self.player_levers[rows]
+            self.player_levers[rows] = inside
+            # Lever.activate, then toggle the linked wall; an inactive wall slides away
+            pulled = entered & (self.lever_deadline[rows] <= self.now)
+            if pulled.any():
+                self.lever_activated[rows] ^= pulled
+                self.lever_deadline[rows] = np.where(pulled, self.now + Lever.cooldown_max, self.lever_deadline[rows])
+                self.wall_active[rows] ^= (pulled @ self.lever_links) % 2 == 1
+        if len(self.plate_rects):
+            inside = overlap(x, y, self.size, self.plate_rects)
+            entered = inside & ~self.player_plates[rows]
+            self.player_plates[rows] = inside
+            self.press(rows, entered)
+
+    def press(self, rows, entered):
+        """Level.on_plate_enter for the plates entered in rows"""
+        self.plate_activated[rows] |= entered
+        self.plate_deadline[rows] = np.where(entered, self.now + self.plate_duration, self.plate_deadline[rows])
+        self.plate_holding[rows] |= entered
+
+    def record(self, x0, y0):
+        """Append this tick's motion to every env's loop recording"""
+        code = (np.sign(self.x - x0) + 1) * 3 + np.sign(self.y - y0) + 1
+        length = self.lengths[self.rows, self.head]
+        self.motions[self.rows, self.head, length] = code
+        self.lengths[self.rows, self.head] = length + 1
+
+    def advance(self):
+        """Level.update: walls slide, held plates stay down and plates whose
+        time ran out pop up"""
+        now = self.now
+        if len(self.wall_home):
+            slide = np.clip(self.wall_target - self.wall_y, -self.wall_speed, self.wall_speed)
+            self.wall_y += np.where(self.wall_active, 0, slide)
+        if len(self.plate_rects):
+            # Ghosts are only counted where they reported last tick
+            occupied = self.player_plates | self.ghost_plates.any(axis=1)
+            holding = self.plate_holding
+            self.plate_deadline = np.where(holding & occupied, now + self.plate_duration, self.plate_deadline)
+            self.plate_release = np.where(holding & ~occupied, self.plate_deadline, self.plate_release)
+            self.plate_holding = holding & occupied
+            due = (self.plate_release != NO_TICK) & (self.plate_release <= now)
+            self.plate_release[due] = NO_TICK
+            self.plate_activated &= ~(due & (self.plate_deadline <= now))
+
+    def update_ghosts(self):
+        """GhostSwarm.update: every ghost steps along its recording, then the
+        ghosts that moved report to the plates"""
+        advancing = self.ghost & (self.cursor < self.lengths - 1)
+        self.cursor += advancing
+        codes = self.motions[self.rows[:, None], self.slots, self.cursor]
+        step = self.deltas[codes] * advancing[..., None]
+        self.ghost_x += step[..., 0]
+        self.ghost_y += step[..., 1]
+        moved = self.fresh | (advancing & (codes != 4))  # 4 is the code of standing still
+        self.fresh[:] = False
+        if len(self.plate_rects) and moved.any():
+            inside = overlap(self.ghost_x, self.ghost_y, self.size, self.plate_rects)
+            entered = moved[..., None] & inside & ~self.ghost_plates
+            self.ghost_plates = np.where(moved[..., None], inside, self.ghost_plates)
+            self.press(self.rows, entered.any(axis=1))
+
+    def observe(self):
+        n, ghosts = self.num_envs, self.max_loops
+        observations = np.empty((n, self.observation_size), dtype=np.float32)
+        observations[:, 0] = self.x
+        observations[:, 1] = self.y
+        observations[:, 2] = self.loops
+        if ghosts:
+            # Ghosts sit in the slots behind head, oldest first
+            count = self.ghost.sum(axis=1)[:, None]
+            order = np.arange(ghosts)
+            slots = (self.head[:, None] - count + order) % len(self.slots)
+            present = order < count
+            rows = self.rows[:, None]
+            observations[:, 3:3 + 3 * ghosts] = np.stack(
+                [present, self.ghost_x[rows, slots] * present, self.ghost_y[rows, slots] * present],
+                axis=2).reshape(n, 3 * ghosts)
+        column = 3 + 3 * ghosts
+        for flag, value in ((self.lever_activated, np.maximum(self.lever_deadline - self.now, 0)),
+                            (self.plate_activated, np.maximum(self.plate_deadline - self.now, 0)),
+                            (self.wall_active, self.wall_y)):
+            width = 2 * flag.shape[1]
+            observations[:, column:column + width:2] = flag
+            observations[:, column + 1:column + width:2] = value
+            column += width
+        return observations
+
+
+def batch_dtype(observation_size):
+    """One env's row of a PooledTimeLoopEnv's shared batch"""
+    return np.dtype([('action', np.uint8), ('observation', np.float32, (observation_size,)),
+                     ('reward', np.float32), ('done', np.bool_), ('solved', np.bool_),
+                     ('truncated', np.bool_), ('ticks', np.int64), ('loops', np.int64)], align=True)
+
+
+def pool_worker(connection, shared, dtype, rows, options):
+    """Body of a PooledTimeLoopEnv worker process: owns a BatchedTimeLoopEnv
+    for its rows of the shared batch and steps it when told to"""
+    batch = np.frombuffer(shared, dtype=dtype)[rows]
+    env = BatchedTimeLoopEnv(rows.stop - rows.start, **options)
+    while True:
+        command = connection.recv()
+        if command == 'reset':
+            batch['observation'] = env.reset()
+        elif command == 'step':
+            observations, rewards, dones, info = env.step(batch['action'])
+            batch['observation'] = observations
+            batch['reward'] = rewards
+            batch['done'] = dones
+            for name, values in info.items():
+                batch[name] = values
+        else:
+            break
+        connection.send(command)
+
+
+class PooledTimeLoopEnv:
+    """A BatchedTimeLoopEnv of num_envs split across worker processes, to
+    use more than one core. Actions and results pass through one batch in
+    shared memory, a row per env; the pipes only carry the commands."""
+    def __init__(self, num_envs, workers=None, **options):
+        """options are passed on to BatchedTimeLoopEnv"""
+        workers = max(1, min(workers or os.cpu_count() or 1, num_envs))
+        self.num_envs = num_envs
+        probe = BatchedTimeLoopEnv(1, **options)  # Checks the options and gives the layout
+        self.level = probe.level
+        self.layout = probe.layout
+        self.observation_size = probe.observation_size
+
+        context = multiprocessing.get_context()
+        dtype = batch_dtype(self.observation_size)
+        shared = context.RawArray('b', dtype.itemsize * num_envs)
+        self.batch = np.frombuffer(shared, dtype=dtype)
+        self.connections = []
+        self.processes = []
+        bounds = np.linspace(0, num_envs, workers + 1).astype(int).tolist()
+        for start, end in zip(bounds, bounds[1:]):
+            connection, child = context.Pipe()
+            process = context.Process(target=pool_worker, args=(child, shared, dtype, slice(start, end), options),
+                                      daemon=True)
+            process.start()
+            child.close()
+            self.connections.append(connection)
+            self.processes.append(process)
+
+    def run(self, command):
+        for connection in self.connections:
+            connection.send(command)
+        for connection in self.connections:
+            connection.recv()
+
+    def reset(self):
+        """Start new episodes in every env; returns the observations"""
+        self.run('reset')
+        return self.batch['observation'].copy()
+
+    def step(self, actions):
+        """BatchedTimeLoopEnv.step, across the workers"""
+        self.batch['action'] = actions
+        self.run('step')
+        batch = self.batch
+        info = {name: batch[name].copy() for name in ('solved', 'truncated', 'ticks', 'loops')}
+        return batch['observation'].copy(), batch['reward'].copy(), batch['done'].copy(), info
+
+    def close(self):
+        for connection in self.connections:
+            connection.send('close')
+            connection.close()
+        for process in self.processes:
+            process.join()
+        self.connections = []
+        self.processes = []
+
+
+def measure(env, steps, num_envs, seed=0):
+    """Step env with uniformly random ACTIONS; returns a report dict"""
+    rng = np.random.default_rng(seed)
+    episodes = solved = 0
+    if isinstance(env, TimeLoopEnv):
+        actions = ACTIONS[rng.integers(len(ACTIONS), size=steps)].tolist()
+        env.reset()
+        start = time.perf_counter()
+        for action in actions:
+            _, _, done, info = env.step(action)
+            if done:
+                episodes += 1
+                solved += info['solved']
+                env.reset()
+    else:
+        actions = ACTIONS[rng.integers(len(ACTIONS), size=(steps, num_envs))]
+        env.reset()
+        start = time.perf_counter()
+        for row in actions:
+            _, _, dones, info = env.step(row)
+            episodes += int(dones.sum())
+            solved += int(info['solved'].sum())
+    seconds = time.perf_counter() - start
+    return {
+        'steps': steps * num_envs,
+        'seconds': round(seconds, 3),
+        'steps_per_second': round(steps * num_envs / seconds),
+        'episodes': episodes,
+        'solved': int(solved),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--level', default='0', help='level name or index in the default pack')
+    parser.add_argument('--envs', type=int, default=1024, help='environments stepped in lockstep')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='worker processes to split the environments across')
+    parser.add_argument('--steps', type=int, default=1000, help='ticks to step every environment')
+    parser.add_argument('--max-loops', type=int, default=MAX_LOOPS, help='ghosts kept at once')
+    parser.add_argument('--single', action='store_true', help='measure the one-level TimeLoopEnv instead')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the random policy')
+    args = parser.parse_args(argv)
+
+    level = int(args.level) if args.level.isdigit() else args.level
+    if args.single:
+        kind, num_envs = 'single', 1
+        env = TimeLoopEnv(level, max_loops=args.max_loops)
+    elif args.workers > 1:
+        kind, num_envs = 'pooled', args.envs
+        env = PooledTimeLoopEnv(num_envs, args.workers, level=level, max_loops=args.max_loops)
+    else:
+        kind, num_envs = 'batched', args.envs
+        env = BatchedTimeLoopEnv(num_envs, level, max_loops=args.max_loops)
+    try:
+        report = {'level': env.level.name, 'env': kind, 'envs': num_envs, 'workers': args.workers}
+        report.update(measure(env, args.steps, num_envs, args.seed))
+    finally:
+        if kind == 'pooled':
+            env.close()
+    print(json.dumps(report, indent=2))
+    pygame.quit()
+
+
+if __name__ == '__main__':
+    main()
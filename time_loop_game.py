@@ -1,18 +1,100 @@
+import time
+IMPORT_STARTED = time.perf_counter()  # For the startup report
 import pygame
 import sys
+import argparse
+import asyncio
+import csv
+import hashlib
+import heapq
+import io
 import math
 import random
-from collections import deque
+from bisect import bisect_left
+from collections import deque, OrderedDict
+from array import array
+from contextlib import contextmanager, nullcontext
 import os
-
-# Initialize pygame
-pygame.init()
-pygame.mixer.init()  # For sound effects
+import json
+import mmap
+import struct
+import zlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 
 # Constants
 SCREEN_WIDTH = 800
 SCREEN_HEIGHT = 600
 FPS = 60
+TICK_RATE = 60  # Simulation ticks per second, independent of the render rate
+TICK_TIME = 1.0 / TICK_RATE
+MAX_RENDER_FPS = 144
+MAX_FRAME_TIME = 0.25  # Longest real-time step fed to the simulation at once
+FAST_FORWARD_TICKS = 8  # Ticks per rendered frame while fast-forwarding
+MAX_LOOPS = 3  # Default number of ghosts kept at once
+CHUNK_SIZE = 256  # Side of a square chunk of the world, each with its own static surface
+MAX_CHUNKS = 96  # Chunk surfaces kept cached, least recently used dropped first
+VIEW_MARGIN = 64  # Chunks this close to the view are baked before they scroll in
+LAYER_ORDER = {'goal': 0, 'movable_wall': 1, 'lever': 2, 'plate': 3}  # Drawing order of level elements
+FRAME_BUDGET_MS = 1000 / 60  # Frame time the quality governor keeps under
+QUALITY_DOWNGRADE_FRAMES = 20  # Frames over budget before effects step down
+QUALITY_UPGRADE_FRAMES = 180  # Frames with headroom before they step back up
+QUALITY_HEADROOM = 0.6  # A frame has headroom under this share of the budget
+
+# Effect quality presets, best first. particles scales how many particles
+# effects emit, trail is the share of each trail that is drawn, shadows covers
+# the player and movable walls, glow is the goal's ('pulse', 'static' or None)
+# and grid is the background grid.
+QUALITY_PRESETS = {
+    'high': {'particles': 1.0, 'trail': 1.0, 'shadows': True, 'glow': 'pulse', 'grid': True},
+    'medium': {'particles': 0.5, 'trail': 0.6, 'shadows': True, 'glow': 'static', 'grid': True},
+    'low': {'particles': 0.25, 'trail': 0.3, 'shadows': False, 'glow': 'static', 'grid': True},
+    'minimal': {'particles': 0.0, 'trail': 0.0, 'shadows': False, 'glow': None, 'grid': False},
+}
+QUALITY_LEVELS = list(QUALITY_PRESETS)
+
+# Loop recording bits - the low nibble is the input held on a tick, the high
+# nibble the movement that actually resulted from it after collisions
+INPUT_LEFT = 1
+INPUT_RIGHT = 2
+INPUT_UP = 4
+INPUT_DOWN = 8
+MOTION_LEFT = 16
+MOTION_RIGHT = 32
+MOTION_UP = 64
+MOTION_DOWN = 128
+KEYFRAME_INTERVAL = 256  # Ticks between seek keyframes in a recording
+GHOST_WINDOW = 128  # Ticks of each ghost's timeline decoded at a time
+INPUT_RESTART = 16  # Replay input bit: the loop was restarted on this tick
+
+# Replay files
+REPLAY_MAGIC = b'TLREPLAY'
+REPLAY_VERSION = 2  # 2: levers and plates are driven by trigger events
+REPLAY_CHUNK_TICKS = 60  # Ticks buffered before a chunk is written and flushed
+
+# Spectator streams
+SPECTATOR_VERSION = 1
+SPECTATOR_HOST = '127.0.0.1'
+SPECTATOR_PORT = 8765
+SPECTATOR_BUFFER_LIMIT = 16 * 1024  # Bytes queued for a client before it is skipped until it catches up
+
+# Sound effects: file in assets/, playback volume and the tone synthesized
+# when the file is missing
+ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
+PLACEHOLDER_TONE = {'frequency': 440, 'duration': 0.1, 'amplitude': 0.3}
+SOUND_SPECS = {
+    'move': {'file': 'move.wav', 'volume': 0.2},
+    'restart': {'file': 'restart.wav', 'volume': 0.4},
+    'goal': {'file': 'goal.wav', 'volume': 0.5},
+    'lever': {'file': 'lever.wav', 'volume': 0.4},
+    'button': {'file': 'button.wav', 'volume': 0.3},
+}
+
+# Level packs
+LEVEL_PACK_MAGIC = b'TLPACK\0\0'
+LEVEL_PACK_VERSION = 2
+DEFAULT_LEVEL_PACK = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'levels', 'main.json')
 
 # Colors
 WHITE = (255, 255, 255)
@@ -29,47 +111,756 @@ GOAL_COLOR = (0, 200, 0)
 BUTTON_COLOR = (100, 100, 200)
 BUTTON_HOVER_COLOR = (120, 120, 220)
 BACKGROUND_COLOR = (240, 240, 245)
+# Palette for multicolored bursts; a fixed set keeps their sprites cacheable
+CONFETTI_COLORS = [
+    (255, 80, 80), (255, 160, 40), (255, 230, 60), (120, 230, 80),
+    (40, 200, 200), (60, 140, 255), (150, 90, 255), (255, 90, 200),
+]
 
-# Particle effect class
-class Particle:
-    def __init__(self, x, y, color, size=3, lifetime=30):
-        self.x = x
-        self.y = y
-        self.color = color
+# Startup profile - nothing starts at import: SDL subsystems come up on first
+# use through init_subsystem, and each start, like the other startup steps, is
+# timed here. Times are measured from the start of this module's import.
+class StartupProfile:
+    def __init__(self, started=IMPORT_STARTED):
+        self.started = started
+        self.marks = {}  # event -> seconds after import started, first occurrence only
+        self.costs = {}  # step -> seconds spent in it
+        self.lock = threading.Lock()  # Audio starts on its own thread
+        
+    def mark(self, event):
+        with self.lock:
+            self.marks.setdefault(event, time.perf_counter() - self.started)
+            
+    @contextmanager
+    def timed(self, step):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            with self.lock:
+                self.costs[step] = self.costs.get(step, 0.0) + time.perf_counter() - start
+                
+    def report(self):
+        with self.lock:
+            return {
+                'events_ms': {event: round(seconds * 1000, 3) for event, seconds in self.marks.items()},
+                'init_ms': {step: round(seconds * 1000, 3) for step, seconds in self.costs.items()},
+            }
+
+startup = StartupProfile()
+
+SUBSYSTEMS = {'display': pygame.display, 'font': pygame.font, 'mixer': pygame.mixer}
+
+def init_subsystem(name):
+    """Start an SDL subsystem ('display', 'font' or 'mixer') unless it is
+    already running; returns whether it is available"""
+    module = SUBSYSTEMS[name]
+    if module.get_init():
+        return True
+    with startup.timed(name):
+        try:
+            module.init()
+        except pygame.error as e:
+            print(f"Warning: Could not start {name}: {e}")
+            return False
+    return True
+    
+def animation_ms():
+    """Milliseconds since import, for purely visual animation like pulses.
+    Unlike pygame.time.get_ticks it needs no SDL subsystem running."""
+    return (time.perf_counter() - IMPORT_STARTED) * 1000
+
+# Frame profiler - scoped timers around the hot phases of a frame (event
+# handling, update, drawing the level, ghosts, player, particles and HUD, and
+# presenting to the display) plus per-frame counters. Counters come from
+# running totals the game already keeps (sprite cache misses, SpatialHash
+# tests, renderer blits), sampled once per frame, so nothing extra is counted
+# in the hot paths. While no frame is being recorded scope() hands back a
+# shared no-op context, so a disabled profiler costs one attribute check.
+NULL_SCOPE = nullcontext()
+
+class FrameProfiler:
+    def __init__(self, max_frames=36000, window=300):
+        self.enabled = False  # Record frames
+        self.show_overlay = False
+        self.frames = deque(maxlen=max_frames)  # Ten minutes at 60 FPS for export
+        self.window = window  # Frames summarized by the overlay
+        self.origin = time.perf_counter()
+        self.frame = None  # Frame being recorded, if any
+        self.frame_count = 0
+        self.totals = {}  # name -> callable returning a running total
+        self.gauges = {}  # name -> callable returning a current value
+        self.last_totals = {}
+        self.overlay = None  # Rendered overlay, rebuilt every overlay_interval frames
+        self.overlay_version = 0
+        self.overlay_interval = 15
+        
+    def watch_total(self, name, source):
+        """Count the per-frame increase of source(), a running total"""
+        self.totals[name] = source
+        
+    def watch_gauge(self, name, source):
+        """Record source() as it stands at the end of each frame"""
+        self.gauges[name] = source
+        
+    def set_enabled(self, enabled):
+        if enabled and not self.enabled:
+            self.last_totals = {name: source() for name, source in self.totals.items()}
+        self.enabled = enabled
+        if not enabled:
+            self.frame = None
+            
+    def begin_frame(self):
+        if self.enabled:
+            self.frame = {'start': time.perf_counter(), 'phases': {}, 'spans': []}
+            
+    def scope(self, phase):
+        """Context manager timing phase within the current frame"""
+        if self.frame is None:
+            return NULL_SCOPE
+        return self.timed(phase)
+        
+    @contextmanager
+    def timed(self, phase):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(phase, start, time.perf_counter())
+            
+    def add_span(self, phase, start, end):
+        phases = self.frame['phases']
+        phases[phase] = phases.get(phase, 0.0) + end - start
+        # Back-to-back spans of one phase (e.g. each ghost) become one trace span
+        spans = self.frame['spans']
+        if spans and spans[-1][0] == phase:
+            spans[-1][2] = end
+        else:
+            spans.append([phase, start, end])
+            
+    def end_frame(self):
+        frame = self.frame
+        if frame is None:
+            return
+        self.frame = None
+        frame['duration'] = time.perf_counter() - frame['start']
+        counters = {}
+        for name, source in self.totals.items():
+            value = source()
+            last = self.last_totals.get(name, 0)
+            # A total that went down was replaced (e.g. a new level's index)
+            counters[name] = value - last if value >= last else value
+            self.last_totals[name] = value
+        for name, source in self.gauges.items():
+            counters[name] = source()
+        frame['counters'] = counters
+        self.frames.append(frame)
+        self.frame_count += 1
+        if self.frame_count % self.overlay_interval == 0:
+            self.overlay = None
+            
+    def stats(self, window=None):
+        """Percentiles in milliseconds of the frame time and each phase over
+        the last window frames"""
+        frames = list(self.frames)[-(window or self.window):]
+        if not frames:
+            return {}
+        names = sorted({phase for frame in frames for phase in frame['phases']})
+        series = {'frame': [frame['duration'] for frame in frames]}
+        for name in names:
+            series[name] = [frame['phases'].get(name, 0.0) for frame in frames]
+        stats = {}
+        for name, samples in series.items():
+            samples = np.asarray(samples) * 1000.0
+            p50, p95, p99 = np.percentile(samples, [50, 95, 99])
+            stats[name] = {'mean_ms': round(float(samples.mean()), 3), 'p50_ms': round(float(p50), 3),
+                           'p95_ms': round(float(p95), 3), 'p99_ms': round(float(p99), 3),
+                           'max_ms': round(float(samples.max()), 3)}
+        return stats
+        
+    def overlay_layer(self):
+        """The overlay as a (key, state, rect, draw) layer for the Renderer"""
+        if self.overlay is None:
+            self.overlay = self.render_overlay()
+            self.overlay_version += 1
+        rect = self.overlay.get_rect(bottomleft=(10, SCREEN_HEIGHT - 10))
+        return ('profiler', self.overlay_version, rect, lambda screen: screen.blit(self.overlay, rect))
+        
+    def render_overlay(self, width=320, bins=34):
+        font = text_cache.get_font(None, 18)
+        rows = [("Frame profile (ms)", "p50", "p95", "p99")]
+        for name, stat in self.stats().items():
+            rows.append((name, f"{stat['p50_ms']:.2f}", f"{stat['p95_ms']:.2f}", f"{stat['p99_ms']:.2f}"))
+        counters = list(self.frames[-1]['counters'].items()) if self.frames else []
+        # Two counters per line under the table
+        for i in range(0, len(counters), 2):
+            rows.append(tuple(f"{name} {value}" for name, value in counters[i:i + 2]))
+        line_height = 15
+        graph_height = 50
+        height = line_height * len(rows) + graph_height + 16
+        surface = pygame.Surface((width, height), pygame.SRCALPHA)
+        surface.fill((0, 0, 0, 170))
+        for i, row in enumerate(rows):
+            y = 4 + i * line_height
+            if len(row) == 4:
+                surface.blit(font.render(row[0], True, WHITE), (6, y))
+                for column, text in enumerate(row[1:]):
+                    # Right-align the numbers, the default font is proportional
+                    rendered = font.render(text, True, WHITE)
+                    surface.blit(rendered, (width - 96 + column * 45 - rendered.get_width(), y))
+            else:
+                for column, text in enumerate(row):
+                    surface.blit(font.render(text, True, WHITE), (6 + column * 150, y))
+            
+        # Histogram of frame times in 1 ms bins; the last bin collects the slow tail
+        if self.frames:
+            durations = np.array([frame['duration'] for frame in list(self.frames)[-self.window:]]) * 1000.0
+            counts, _ = np.histogram(np.minimum(durations, bins - 0.5), bins=bins, range=(0, bins))
+            bar_width = (width - 12) / bins
+            bottom = height - 6
+            scale = graph_height / max(1, counts.max())
+            for i, count in enumerate(counts.tolist()):
+                if count:
+                    bar_height = max(1, round(count * scale))
+                    color = GREEN if i < 1000 / FPS else RED
+                    pygame.draw.rect(surface, color, (6 + i * bar_width, bottom - bar_height,
+                                                      max(1, bar_width - 1), bar_height))
+            budget_x = 6 + bar_width * 1000 / FPS
+            pygame.draw.line(surface, WHITE, (budget_x, bottom - graph_height), (budget_x, bottom))
+        return surface
+        
+    def export(self, path):
+        """Write the recorded frames as CSV if path ends in .csv, otherwise as
+        a Chrome trace (open it in chrome://tracing or Perfetto)"""
+        if path.lower().endswith('.csv'):
+            self.export_csv(path)
+        else:
+            self.export_chrome_trace(path)
+            
+    def export_chrome_trace(self, path):
+        def us(seconds):
+            return round((seconds - self.origin) * 1e6, 1)
+            
+        events = []
+        for i, frame in enumerate(self.frames):
+            events.append({'name': 'frame', 'ph': 'X', 'pid': 1, 'tid': 1, 'ts': us(frame['start']),
+                           'dur': round(frame['duration'] * 1e6, 1), 'args': {'frame': i}})
+            for phase, start, end in frame['spans']:
+                events.append({'name': phase, 'ph': 'X', 'pid': 1, 'tid': 1, 'ts': us(start),
+                               'dur': round((end - start) * 1e6, 1)})
+            events.append({'name': 'counters', 'ph': 'C', 'pid': 1, 'ts': us(frame['start']),
+                           'args': frame['counters']})
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f)
+            
+    def export_csv(self, path):
+        frames = list(self.frames)
+        phases = sorted({phase for frame in frames for phase in frame['phases']})
+        counters = sorted({name for frame in frames for name in frame['counters']})
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['frame', 'start_ms', 'frame_ms'] + [f'{phase}_ms' for phase in phases] + counters)
+            for i, frame in enumerate(frames):
+                writer.writerow([i, round((frame['start'] - self.origin) * 1000, 3),
+                                 round(frame['duration'] * 1000, 3)] +
+                                [round(frame['phases'].get(phase, 0.0) * 1000, 3) for phase in phases] +
+                                [frame['counters'].get(name, '') for name in counters])
+
+# Quality governor - effects (particles, trails, shadows, the goal glow and
+# the background grid) read their fidelity from the module-wide quality
+# settings. Unless a preset is pinned, the governor watches how long each
+# frame took to produce and steps down a preset once frames have run over
+# budget for a while, and back up only after a longer stretch with clear
+# headroom. A step up that has to be taken back makes the next one wait twice
+# as long, so a scene right at the budget settles instead of flickering.
+class QualitySettings:
+    def __init__(self, preset=QUALITY_LEVELS[0]):
+        self.set_preset(preset)
+        
+    def set_preset(self, preset):
+        self.preset = preset
+        for name, value in QUALITY_PRESETS[preset].items():
+            setattr(self, name, value)
+            
+    def visible_trail(self, points):
+        """The newest share of a trail (oldest point first) that is drawn"""
+        points = list(points)
+        return points[len(points) - int(len(points) * self.trail + 0.5):]
+
+quality = QualitySettings()
+
+class QualityGovernor:
+    def __init__(self, settings=quality, budget_ms=FRAME_BUDGET_MS, adaptive=True):
+        """adaptive=False holds the settings' current preset"""
+        self.settings = settings
+        self.budget_ms = budget_ms
+        self.adaptive = adaptive
+        self.average = 0.0  # Smoothed frame time in milliseconds
+        self.over = 0  # Consecutive frames with the average over budget
+        self.under = 0  # Consecutive frames with headroom
+        self.upgrade_frames = QUALITY_UPGRADE_FRAMES
+        self.since_upgrade = None  # Frames since the last step up, while it may still be taken back
+        self.changes = 0
+        
+    def observe(self, frame_ms):
+        """Feed the time one frame took; returns True if the preset changed"""
+        self.average += (frame_ms - self.average) * 0.1
+        if not self.adaptive:
+            return False
+        if self.since_upgrade is not None:
+            self.since_upgrade += 1
+            if self.since_upgrade > self.upgrade_frames:
+                self.since_upgrade = None
+        if self.average > self.budget_ms:
+            self.over += 1
+            self.under = 0
+            if self.over >= QUALITY_DOWNGRADE_FRAMES:
+                if self.since_upgrade is not None:
+                    self.upgrade_frames = min(self.upgrade_frames * 2, QUALITY_UPGRADE_FRAMES * 8)
+                    self.since_upgrade = None
+                return self.step(1)
+        elif self.average < self.budget_ms * QUALITY_HEADROOM:
+            self.under += 1
+            self.over = 0
+            if self.under >= self.upgrade_frames:
+                if self.step(-1):
+                    self.since_upgrade = 0
+                    return True
+        else:
+            self.over = self.under = 0
+        return False
+        
+    def step(self, direction):
+        """Move one preset down (1) or up (-1) the list, if there is one"""
+        self.over = self.under = 0
+        index = QUALITY_LEVELS.index(self.settings.preset) + direction
+        if not 0 <= index < len(QUALITY_LEVELS):
+            return False
+        self.settings.set_preset(QUALITY_LEVELS[index])
+        self.changes += 1
+        return True
+
+# Sprite cache - small alpha shapes (particles, trails, shadows) are rendered
+# once per (shape, color, size, alpha) and reused, so draw methods only blit
+class SpriteCache:
+    def __init__(self, max_entries=4096, size_step=0.5, alpha_step=16):
+        self.max_entries = max_entries
+        self.size_step = size_step
+        self.alpha_step = alpha_step
+        self.sprites = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def quantize_size(self, size):
+        if isinstance(size, tuple):
+            return tuple(self.quantize_size(s) for s in size)
+        return round(size / self.size_step) * self.size_step
+
+    def quantize_alpha(self, alpha):
+        return min(255, round(alpha / self.alpha_step) * self.alpha_step)
+
+    def get(self, shape, color, size, alpha=255, border_radius=0):
+        """Return a cached sprite for shape ('circle' or 'rect').
+
+        For circles size is the radius; for rects it is the side length or a
+        (width, height) tuple. Returns None when the quantized size is empty.
+        """
+        size = self.quantize_size(size)
+        if (min(size) if isinstance(size, tuple) else size) <= 0:
+            return None
+        alpha = self.quantize_alpha(alpha)
+        key = (shape, tuple(color[:3]), size, alpha, border_radius)
+        sprite = self.sprites.get(key)
+        if sprite is not None:
+            self.hits += 1
+            self.sprites.move_to_end(key)
+            return sprite
+
+        self.misses += 1
+        sprite = self.render(shape, (*color[:3], alpha), size, border_radius)
+        self.sprites[key] = sprite
+        if len(self.sprites) > self.max_entries:
+            self.sprites.popitem(last=False)
+            self.evictions += 1
+        return sprite
+
+    def render(self, shape, color, size, border_radius):
+        if shape == 'circle':
+            sprite = pygame.Surface((math.ceil(size*2), math.ceil(size*2)), pygame.SRCALPHA)
+            pygame.draw.circle(sprite, color, (size, size), size)
+        else:
+            width, height = size if isinstance(size, tuple) else (size, size)
+            sprite = pygame.Surface((math.ceil(width), math.ceil(height)), pygame.SRCALPHA)
+            pygame.draw.rect(sprite, color, (0, 0, width, height), border_radius=border_radius)
+        # Match the display format when there is one so blits take the fast path
+        if pygame.display.get_surface() is not None:
+            sprite = sprite.convert_alpha()
+        return sprite
+
+    def blit_circle(self, screen, color, center, radius, alpha=255):
+        """Blit a cached circle centered on center"""
+        sprite = self.get('circle', color, radius, alpha)
+        if sprite is not None:
+            half = sprite.get_width() / 2
+            screen.blit(sprite, (center[0] - half, center[1] - half))
+
+    def clear(self):
+        self.sprites.clear()
+
+    def stats(self):
+        return {'entries': len(self.sprites), 'hits': self.hits,
+                'misses': self.misses, 'evictions': self.evictions}
+
+sprite_cache = SpriteCache()
+
+# Text cache - SysFont lookups go through the system font database, so fonts
+# are created once per (name, size) and rendered strings are memoized
+class TextCache:
+    def __init__(self, max_entries=256):
+        self.max_entries = max_entries
+        self.fonts = {}
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.RLock()  # The level preloader warms the cache from its thread
+        
+    def get_font(self, name=None, size=24):
+        with self.lock:
+            font = self.fonts.get((name, size))
+            if font is None:
+                init_subsystem('font')
+                font = pygame.font.SysFont(name, size)
+                self.fonts[(name, size)] = font
+            return font
+        
+    def render(self, text, size=24, color=WHITE, antialias=True, name=None):
+        """Return a rendered text surface, reusing it if seen recently"""
+        key = (text, name, size, tuple(color), antialias)
+        with self.lock:
+            surface = self.surfaces.get(key)
+            if surface is not None:
+                self.hits += 1
+                self.surfaces.move_to_end(key)
+                return surface
+                
+            self.misses += 1
+            surface = self.get_font(name, size).render(text, antialias, color)
+            self.surfaces[key] = surface
+            if len(self.surfaces) > self.max_entries:
+                self.surfaces.popitem(last=False)
+            return surface
+        
+    def clear(self):
+        with self.lock:
+            self.fonts.clear()
+            self.surfaces.clear()
+        
+    def stats(self):
+        return {'fonts': len(self.fonts), 'entries': len(self.surfaces),
+                'hits': self.hits, 'misses': self.misses}
+
+text_cache = TextCache()
+
+# Text label - a HUD widget that only re-renders when its text changes
+class TextLabel:
+    def __init__(self, size=24, color=WHITE, name=None):
         self.size = size
-        self.lifetime = lifetime
-        self.max_lifetime = lifetime
-        self.dx = random.uniform(-1.5, 1.5)
-        self.dy = random.uniform(-1.5, 1.5)
+        self.color = color
+        self.name = name
+        self.text = None
+        self.surface = None
+        
+    def set_text(self, text):
+        if text != self.text:
+            self.text = text
+            self.surface = text_cache.render(text, self.size, self.color, name=self.name)
+        return self.surface
         
+    def draw(self, screen, text, pos=None, center=None):
+        surface = self.set_text(text)
+        if center is not None:
+            screen.blit(surface, surface.get_rect(center=center))
+        else:
+            screen.blit(surface, pos)
+
+# Particle pool - every particle in the game lives in one set of preallocated
+# NumPy columns, so updating and culling them is a handful of array operations
+# instead of a Python object (and a list.remove) per particle
+class ParticlePool:
+    def __init__(self, capacity=1024, max_capacity=65536):
+        self.capacity = capacity
+        self.max_capacity = max_capacity
+        self.count = 0  # Live particles occupy indices [0, count)
+        self.version = 0  # Bumped whenever particle state changes
+        # All particle randomness comes from these two generators so a seeded
+        # game (see seed()) emits exactly the same particles every run
+        self.random = random.Random()
+        self.rng = np.random.default_rng()
+        self.x = np.zeros(capacity, dtype=np.float32)
+        self.y = np.zeros(capacity, dtype=np.float32)
+        self.dx = np.zeros(capacity, dtype=np.float32)
+        self.dy = np.zeros(capacity, dtype=np.float32)
+        self.size = np.zeros(capacity, dtype=np.float32)
+        self.lifetime = np.zeros(capacity, dtype=np.int32)
+        self.max_lifetime = np.ones(capacity, dtype=np.int32)
+        self.color = np.zeros((capacity, 3), dtype=np.uint8)
+
+    def seed(self, seed):
+        self.random.seed(seed)
+        self.rng = np.random.default_rng(seed)
+
+    def _reserve(self, n):
+        """Make room for n more particles, returning how many actually fit"""
+        needed = self.count + n
+        if needed > self.capacity and self.capacity < self.max_capacity:
+            new_capacity = self.capacity
+            while new_capacity < needed and new_capacity < self.max_capacity:
+                new_capacity *= 2
+            new_capacity = min(new_capacity, self.max_capacity)
+            for name in ('x', 'y', 'dx', 'dy', 'size', 'lifetime', 'max_lifetime', 'color'):
+                old = getattr(self, name)
+                grown = np.zeros((new_capacity,) + old.shape[1:], dtype=old.dtype)
+                grown[:self.count] = old[:self.count]
+                setattr(self, name, grown)
+            self.capacity = new_capacity
+        return max(0, min(n, self.capacity - self.count))
+
+    def emit(self, x, y, color, size=3, lifetime=30):
+        """Add a single particle with a random drift"""
+        if self._reserve(1) == 0:
+            return
+        i = self.count
+        self.x[i] = x
+        self.y[i] = y
+        self.dx[i] = self.random.uniform(-1.5, 1.5)
+        self.dy[i] = self.random.uniform(-1.5, 1.5)
+        self.size[i] = size
+        self.lifetime[i] = lifetime
+        self.max_lifetime[i] = max(1, lifetime)
+        self.color[i] = color[:3]
+        self.count += 1
+        self.version += 1
+
+    def emit_many(self, xs, ys, colors, sizes, lifetimes):
+        """Add one particle per element of the given arrays with random drift"""
+        n = self._reserve(len(xs))
+        if n == 0:
+            return
+        start, end = self.count, self.count + n
+        self.x[start:end] = xs[:n]
+        self.y[start:end] = ys[:n]
+        self.dx[start:end] = self.rng.uniform(-1.5, 1.5, n)
+        self.dy[start:end] = self.rng.uniform(-1.5, 1.5, n)
+        self.size[start:end] = sizes[:n]
+        self.lifetime[start:end] = lifetimes[:n]
+        self.max_lifetime[start:end] = np.maximum(lifetimes[:n], 1)
+        self.color[start:end] = colors[:n]
+        self.count = end
+        self.version += 1
+
+    def burst(self, count, area, color, size_range, lifetime_range):
+        """Add count particles spread over area (x, y, width, height) in one step.
+
+        color may be a single color or None for a random CONFETTI_COLORS entry
+        per particle. The count is scaled by the particle quality setting.
+        """
+        n = self._reserve(int(count * quality.particles))
+        if n == 0:
+            return
+        start, end = self.count, self.count + n
+        x, y, width, height = area
+        rng = self.rng
+        self.x[start:end] = rng.uniform(x, x + width, n)
+        self.y[start:end] = rng.uniform(y, y + height, n)
+        self.dx[start:end] = rng.uniform(-1.5, 1.5, n)
+        self.dy[start:end] = rng.uniform(-1.5, 1.5, n)
+        self.size[start:end] = rng.uniform(size_range[0], size_range[1], n)
+        lifetimes = rng.integers(lifetime_range[0], lifetime_range[1] + 1, n)
+        self.lifetime[start:end] = lifetimes
+        self.max_lifetime[start:end] = np.maximum(lifetimes, 1)
+        if color is None:
+            self.color[start:end] = np.array(CONFETTI_COLORS, dtype=np.uint8)[
+                rng.integers(0, len(CONFETTI_COLORS), n)]
+        else:
+            self.color[start:end] = color[:3]
+        self.count = end
+        self.version += 1
+
     def update(self):
-        self.x += self.dx
-        self.y += self.dy
-        self.lifetime -= 1
-        self.size = max(0, self.size * (self.lifetime / self.max_lifetime))
-        
-    def draw(self, screen):
-        alpha = int(255 * (self.lifetime / self.max_lifetime))
-        particle_color = (*self.color[:3], alpha) if len(self.color) > 3 else (*self.color, alpha)
-        particle_surface = pygame.Surface((self.size*2, self.size*2), pygame.SRCALPHA)
-        pygame.draw.circle(particle_surface, particle_color, (self.size, self.size), self.size)
-        screen.blit(particle_surface, (self.x - self.size, self.y - self.size))
+        n = self.count
+        if n == 0:
+            return
+        self.version += 1
+        self.x[:n] += self.dx[:n]
+        self.y[:n] += self.dy[:n]
+        self.lifetime[:n] -= 1
+        self.size[:n] *= np.maximum(self.lifetime[:n], 0) / self.max_lifetime[:n]
+
+        # Compact the survivors to the front of every column
+        alive = self.lifetime[:n] > 0
+        alive_count = int(np.count_nonzero(alive))
+        if alive_count < n:
+            keep = np.flatnonzero(alive)
+            for column in (self.x, self.y, self.dx, self.dy, self.size,
+                           self.lifetime, self.max_lifetime, self.color):
+                column[:alive_count] = column[keep]
+            self.count = alive_count
+
+    def clear(self):
+        self.count = 0
+        self.version += 1
+
+    def bounds(self):
+        """Rect covering every live particle, or None when the pool is empty"""
+        n = self.count
+        if n == 0:
+            return None
+        radius = math.ceil(float(self.size[:n].max())) + 1
+        left = int(self.x[:n].min()) - radius
+        top = int(self.y[:n].min()) - radius
+        right = int(self.x[:n].max()) + radius + 1
+        bottom = int(self.y[:n].max()) + radius + 1
+        return pygame.Rect(left, top, right - left, bottom - top)
+
+    def draw(self, screen, view=None):
+        """Draw the particles inside view (world coordinates, its corner at the
+        screen's origin), or all of them at their own position"""
+        n = self.count
+        if n == 0:
+            return
+        if view is None:
+            shown = slice(0, n)
+            xs, ys = self.x[:n], self.y[:n]
+        else:
+            size = self.size[:n] + 1
+            shown = np.flatnonzero((self.x[:n] + size >= view.left) & (self.x[:n] - size < view.right) &
+                                   (self.y[:n] + size >= view.top) & (self.y[:n] - size < view.bottom))
+            xs, ys = self.x[shown] - view.x, self.y[shown] - view.y
+        # Quantize the way sprite_cache does, so each distinct sprite is looked
+        # up once per frame and every particle goes out in a single blits()
+        cache = sprite_cache
+        steps = np.round(self.size[shown].astype(np.float64) / cache.size_step).astype(np.int64)
+        alphas = 255 * self.lifetime[shown].astype(np.int64) // self.max_lifetime[shown]
+        alphas = np.minimum(255, np.round(alphas / cache.alpha_step).astype(np.int64) * cache.alpha_step)
+        colors = self.color[shown].astype(np.int64)
+        keys = (colors[:, 0] << 48) | (colors[:, 1] << 40) | (colors[:, 2] << 32) | (steps << 9) | alphas
+        _, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+        sprites = [cache.get('circle', colors[i].tolist(), steps.item(i) * cache.size_step, alphas.item(i))
+                   for i in first.tolist()]
+        halves = np.array([sprite.get_width() / 2 if sprite is not None else 0.0 for sprite in sprites])
+        inverse = inverse.ravel()
+        drawn = np.array([sprite is not None for sprite in sprites])[inverse]
+        lefts = (xs.astype(np.float64) - halves[inverse])[drawn].tolist()
+        tops = (ys.astype(np.float64) - halves[inverse])[drawn].tolist()
+        screen.blits([(sprites[k], (left, top)) for k, left, top in zip(inverse[drawn].tolist(), lefts, tops)],
+                     doreturn=False)
+
+# Loop recording - one byte per tick plus sparse position keyframes. Positions
+# are rebuilt from the motion bits, so a ghost can share its loop's recording
+# instead of copying a list of coordinates.
+class LoopRecording:
+    def __init__(self, start, speed=5):
+        self.start = start  # Position before the first tick
+        self.speed = speed
+        self.ticks = array('B')
+        # tick -> position after that tick, stored wherever the motion bits
+        # can't express the step and every KEYFRAME_INTERVAL ticks for seeking
+        self.keyframes = {}
+        self.keyframe_ticks = array('I')  # The keyframes' ticks, in order
+        self.last = start
+        
+    def __len__(self):
+        return len(self.ticks)
+        
+    @classmethod
+    def from_positions(cls, positions, start=None, speed=5):
+        """Build a recording from a list of per-tick (x, y) positions"""
+        recording = cls(start or (positions[0] if positions else (0, 0)), speed)
+        for position in positions:
+            recording.record(0, position)
+        return recording
+        
+    def record(self, input_mask, position):
+        """Append one tick: the input held and the position it led to"""
+        tick = len(self.ticks)
+        last_x, last_y = self.last
+        x, y = position
+        motion = 0
+        regular = True
+        if x == last_x + self.speed:
+            motion |= MOTION_RIGHT
+        elif x == last_x - self.speed:
+            motion |= MOTION_LEFT
+        elif x != last_x:
+            regular = False
+        if y == last_y + self.speed:
+            motion |= MOTION_DOWN
+        elif y == last_y - self.speed:
+            motion |= MOTION_UP
+        elif y != last_y:
+            regular = False
+        self.ticks.append(input_mask | motion)
+        if not regular or tick % KEYFRAME_INTERVAL == 0:
+            self.keyframes[tick] = position
+            self.keyframe_ticks.append(tick)
+        self.last = position
+        
+    def decode(self, begin, count, before=None):
+        """Positions after ticks [begin, begin + count) (fewer at the end of
+        the recording) as an (n, 2) float32 array, decoded with cumsum between
+        keyframes. before is the position after tick begin - 1 when the caller
+        knows it; otherwise decoding seeks back to the keyframe before begin."""
+        end = min(begin + count, len(self.ticks))
+        first = begin if before is not None else begin - begin % KEYFRAME_INTERVAL
+        if end <= begin:
+            return np.zeros((0, 2), dtype=np.float32)
+        bits = np.frombuffer(self.ticks, dtype=np.uint8)[first:end]
+        deltas = np.zeros((end - first, 2), dtype=np.float32)
+        deltas[:, 0] = self.speed * (((bits & MOTION_RIGHT) > 0).astype(np.float32) -
+                                     ((bits & MOTION_LEFT) > 0))
+        deltas[:, 1] = self.speed * (((bits & MOTION_DOWN) > 0).astype(np.float32) -
+                                     ((bits & MOTION_UP) > 0))
+        positions = np.zeros((end - first, 2), dtype=np.float32)
+        ticks = self.keyframe_ticks
+        marks = ticks[bisect_left(ticks, first):bisect_left(ticks, end)].tolist()
+        position = before  # After the tick before the segment; a keyframe replaces it
+        for start, stop in zip([first] + marks, marks + [end]):
+            if start == stop:
+                continue  # first is a keyframe itself
+            if start in self.keyframes:
+                positions[start - first] = position = self.keyframes[start]
+                start += 1
+            if stop > start:
+                steps = deltas[start - first:stop - first]
+                positions[start - first:stop - first] = position + np.cumsum(steps, axis=0)
+                position = positions[stop - first - 1]
+        return positions[begin - first:]
 
 # Player class
 class Player:
-    def __init__(self, x, y, size=20):
+    __slots__ = ('x', 'y', 'prev_x', 'prev_y', 'size', 'speed', 'recording', 'particles', 'trail',
+                 'trail_timer', 'trail_interval', 'is_moving', 'animation_frame', 'animation_speed', 'world')
+    
+    def __init__(self, x, y, size=20, particles=None):
         self.x = x
         self.y = y
+        self.prev_x = x  # Position at the start of the current tick, for interpolation
+        self.prev_y = y
         self.size = size
         self.speed = 5
-        self.actions = []  # Store actions for this loop
-        self.particles = []
-        self.trail = []
+        self.recording = LoopRecording((x, y), self.speed)  # This loop's input and movement
+        self.particles = particles if particles is not None else ParticlePool()
+        self.trail = deque(maxlen=10)  # Recent centers, oldest first
         self.trail_timer = 0
         self.trail_interval = 5  # Frames between trail points
         self.is_moving = False
         self.animation_frame = 0
         self.animation_speed = 0.2
+        self.world = pygame.Rect(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)  # Area the player is kept inside
+        
+    def rect(self):
+        return pygame.Rect(self.x, self.y, self.size, self.size)
         
     def move(self, dx, dy):
         self.is_moving = dx != 0 or dy != 0
@@ -78,32 +869,26 @@ class Player:
         new_x = self.x + dx * self.speed
         new_y = self.y + dy * self.speed
         
-        if 0 <= new_x <= SCREEN_WIDTH - self.size:
+        if self.world.left <= new_x <= self.world.right - self.size:
             self.x = new_x
-        if 0 <= new_y <= SCREEN_HEIGHT - self.size:
+        if self.world.top <= new_y <= self.world.bottom - self.size:
             self.y = new_y
             
-        # Record the action
-        self.actions.append((self.x, self.y))
-        
         # Add trail effect
         self.trail_timer += 1
         if self.trail_timer >= self.trail_interval:
             self.trail.append((self.x + self.size/2, self.y + self.size/2))
-            if len(self.trail) > 10:  # Limit trail length
-                self.trail.pop(0)
             self.trail_timer = 0
             
         # Add movement particles
-        if self.is_moving and random.random() < 0.3:
-            self.particles.append(
-                Particle(
-                    self.x + random.uniform(0, self.size),
-                    self.y + random.uniform(0, self.size),
-                    PLAYER_COLOR,
-                    size=random.uniform(1, 3),
-                    lifetime=random.randint(10, 20)
-                )
+        rand = self.particles.random
+        if self.is_moving and rand.random() < 0.3 * quality.particles:
+            self.particles.emit(
+                self.x + rand.uniform(0, self.size),
+                self.y + rand.uniform(0, self.size),
+                PLAYER_COLOR,
+                size=rand.uniform(1, 3),
+                lifetime=rand.randint(10, 20)
             )
             
     def update(self):
@@ -113,428 +898,1656 @@ class Player:
             if self.animation_frame >= 4:
                 self.animation_frame = 0
                 
-        # Update particles
-        for particle in self.particles[:]:
-            particle.update()
-            if particle.lifetime <= 0:
-                self.particles.remove(particle)
-                
-    def draw(self, screen):
-        # Draw trail
-        for i, (tx, ty) in enumerate(self.trail):
-            alpha = int(255 * (i / len(self.trail)) * 0.5)
-            trail_color = (*PLAYER_COLOR[:3], alpha) if len(PLAYER_COLOR) > 3 else (*PLAYER_COLOR, alpha)
-            trail_size = int(self.size * 0.5 * (i / len(self.trail)))
-            trail_surface = pygame.Surface((trail_size*2, trail_size*2), pygame.SRCALPHA)
-            pygame.draw.circle(trail_surface, trail_color, (trail_size, trail_size), trail_size)
-            screen.blit(trail_surface, (tx - trail_size, ty - trail_size))
-            
-        # Draw particles
-        for particle in self.particles:
-            particle.draw(screen)
-            
-        # Draw player with pulsing effect
-        pulse = math.sin(pygame.time.get_ticks() * 0.005) * 0.1 + 0.9
-        size_pulse = int(self.size * pulse)
-        offset = (self.size - size_pulse) // 2
+    def render_position(self, alpha=1.0):
+        """Position blended between the last two ticks"""
+        return (self.prev_x + (self.x - self.prev_x) * alpha,
+                self.prev_y + (self.y - self.prev_y) * alpha)
         
+    def draw(self, screen, alpha=1.0, offset=(0, 0)):
+        x, y = self.render_position(alpha)
+        x, y = x + offset[0], y + offset[1]
+        
+        # Draw trail
+        trail = quality.visible_trail(self.trail)
+        for i, (tx, ty) in enumerate(trail):
+            trail_alpha = int(255 * (i / len(trail)) * 0.5)
+            trail_size = int(self.size * 0.5 * (i / len(trail)))
+            sprite_cache.blit_circle(screen, PLAYER_COLOR, (tx + offset[0], ty + offset[1]),
+                                     trail_size, trail_alpha)
+            
         # Draw player shadow
-        shadow_surface = pygame.Surface((self.size, self.size), pygame.SRCALPHA)
-        pygame.draw.rect(shadow_surface, (0, 0, 0, 50), (2, 2, self.size, self.size), border_radius=5)
-        screen.blit(shadow_surface, (self.x + 2, self.y + 2))
+        if quality.shadows:
+            shadow_surface = sprite_cache.get('rect', (0, 0, 0), self.size - 2, 50, border_radius=5)
+            screen.blit(shadow_surface, (x + 4, y + 4))
         
         # Draw player with rounded corners
-        pygame.draw.rect(screen, PLAYER_COLOR, (self.x, self.y, self.size, self.size), border_radius=5)
+        pygame.draw.rect(screen, PLAYER_COLOR, (x, y, self.size, self.size), border_radius=5)
         
         # Draw highlight
         highlight_color = (min(255, PLAYER_COLOR[0] + 50), min(255, PLAYER_COLOR[1] + 50), min(255, PLAYER_COLOR[2] + 50))
-        pygame.draw.rect(screen, highlight_color, (self.x, self.y, self.size, self.size), width=2, border_radius=5)
+        pygame.draw.rect(screen, highlight_color, (x, y, self.size, self.size), width=2, border_radius=5)
+        
+    def record(self, input_mask):
+        """Record the input for this tick and where the player ended up"""
+        self.recording.record(input_mask, (self.x, self.y))
+        
+    def bounds(self, alpha=1.0):
+        """Screen area covered by the player, its shadow and its trail"""
+        x, y = self.render_position(alpha)
+        rect = pygame.Rect(x, y, self.size + 5, self.size + 5)
+        radius = self.size // 2
+        for tx, ty in quality.visible_trail(self.trail):
+            rect.union_ip(pygame.Rect(tx - radius, ty - radius, radius * 2 + 1, radius * 2 + 1))
+        return rect
         
     def reset_position(self, x, y):
         self.x = x
         self.y = y
-        self.actions = []
-        self.trail = []
-        self.particles = []
+        self.prev_x = x
+        self.prev_y = y
+        # Start a fresh recording; the old one now belongs to a ghost
+        self.recording = LoopRecording((x, y), self.speed)
+        self.trail.clear()
         
         # Create reset effect
-        for _ in range(20):
-            self.particles.append(
-                Particle(
-                    self.x + random.uniform(0, self.size),
-                    self.y + random.uniform(0, self.size),
-                    PLAYER_COLOR,
-                    size=random.uniform(2, 5),
-                    lifetime=random.randint(20, 40)
-                )
-            )
+        self.particles.burst(20, (self.x, self.y, self.size, self.size), PLAYER_COLOR,
+                             size_range=(2, 5), lifetime_range=(20, 40))
 
-# Ghost class (represents past player actions)
+# Ghost class (represents past player actions). A ghost is a handle into a
+# GhostSwarm: its playback cursor, position and trail live in the swarm's arrays.
 class Ghost:
-    def __init__(self, actions, size=20, color=None):
-        self.actions = actions.copy()  # Copy of player's actions from previous loop
+    __slots__ = ('swarm', 'index', 'recording', 'size', 'color', 'loop_number')
+    
+    def __init__(self, swarm, index, recording, size=20, color=None):
+        self.swarm = swarm
+        self.index = index  # Row in the swarm arrays; shifts when older ghosts are removed
+        self.recording = recording  # Shared with the loop it came from, never modified
         self.size = size
-        self.current_action = 0
-        self.particles = []
-        self.trail = []
-        self.trail_timer = 0
-        self.trail_interval = 5
         self.color = color or GHOST_COLOR
         self.loop_number = 0  # Will be set by the game
         
-    def update(self):
-        if self.current_action < len(self.actions) - 1:
-            self.current_action += 1
-            
-            # Add trail effect
-            self.trail_timer += 1
-            if self.trail_timer >= self.trail_interval and self.actions:
-                x, y = self.actions[self.current_action]
-                self.trail.append((x + self.size/2, y + self.size/2))
-                if len(self.trail) > 8:  # Limit trail length
-                    self.trail.pop(0)
-                self.trail_timer = 0
-                
-            # Add ghost particles
-            if random.random() < 0.1 and self.actions:
-                x, y = self.actions[self.current_action]
-                self.particles.append(
-                    Particle(
-                        x + random.uniform(0, self.size),
-                        y + random.uniform(0, self.size),
-                        self.color,
-                        size=random.uniform(1, 2),
-                        lifetime=random.randint(10, 20)
-                    )
-                )
-                
-        # Update particles
-        for particle in self.particles[:]:
-            particle.update()
-            if particle.lifetime <= 0:
-                self.particles.remove(particle)
-            
-    def draw(self, screen):
-        if not self.actions or self.current_action >= len(self.actions):
+    @property
+    def current_action(self):
+        return int(self.swarm.cursor[self.index])
+        
+    @property
+    def x(self):
+        return float(self.swarm.current[self.index, 0])
+        
+    @property
+    def y(self):
+        return float(self.swarm.current[self.index, 1])
+        
+    @property
+    def trail(self):
+        """Trail points, oldest first"""
+        return self.swarm.trail_points(self.index)
+        
+    def rect(self):
+        return pygame.Rect(self.x, self.y, self.size, self.size)
+        
+    def position(self):
+        """Current playback position, or None if there is nothing to play"""
+        if not len(self.recording):
+            return None
+        return (self.x, self.y)
+        
+    def render_position(self, alpha=1.0):
+        """Playback position blended between the last two ticks, or None if hidden"""
+        if not len(self.recording):
+            return None
+        x, y = self.swarm.current[self.index].tolist()
+        prev_x, prev_y = self.swarm.previous[self.index].tolist()
+        return (prev_x + (x - prev_x) * alpha, prev_y + (y - prev_y) * alpha)
+        
+    def draw(self, screen, alpha=1.0, offset=(0, 0)):
+        position = self.render_position(alpha)
+        if position is None:
             return
             
         # Draw trail
-        for i, (tx, ty) in enumerate(self.trail):
-            alpha = int(180 * (i / len(self.trail)) * 0.5) if self.trail else 0
-            trail_color = (*self.color[:3], alpha) if len(self.color) > 3 else (*self.color, alpha)
-            trail_size = int(self.size * 0.4 * (i / len(self.trail))) if self.trail else 0
+        trail = quality.visible_trail(self.trail)
+        for i, (tx, ty) in enumerate(trail):
+            trail_alpha = int(180 * (i / len(trail)) * 0.5)
+            trail_size = int(self.size * 0.4 * (i / len(trail)))
             if trail_size > 0:
-                trail_surface = pygame.Surface((trail_size*2, trail_size*2), pygame.SRCALPHA)
-                pygame.draw.circle(trail_surface, trail_color, (trail_size, trail_size), trail_size)
-                screen.blit(trail_surface, (tx - trail_size, ty - trail_size))
-            
-        # Draw particles
-        for particle in self.particles:
-            particle.draw(screen)
+                sprite_cache.blit_circle(screen, self.color, (tx + offset[0], ty + offset[1]),
+                                         trail_size, trail_alpha)
             
         # Draw ghost with fading effect
-        x, y = self.actions[self.current_action]
-        pulse = math.sin(pygame.time.get_ticks() * 0.003 + self.loop_number) * 0.1 + 0.9
+        x, y = position[0] + offset[0], position[1] + offset[1]
         
         # Draw ghost with rounded corners and transparency
-        ghost_surface = pygame.Surface((self.size, self.size), pygame.SRCALPHA)
-        pygame.draw.rect(ghost_surface, self.color, (0, 0, self.size, self.size), border_radius=5)
+        ghost_alpha = self.color[3] if len(self.color) > 3 else 255
+        ghost_surface = sprite_cache.get('rect', self.color, self.size, ghost_alpha, border_radius=5)
         screen.blit(ghost_surface, (x, y))
         
         # Draw loop number
-        font = pygame.font.SysFont(None, 20)
-        loop_text = font.render(str(self.loop_number), True, WHITE)
+        loop_text = text_cache.render(str(self.loop_number), 20, WHITE)
         text_rect = loop_text.get_rect(center=(x + self.size//2, y + self.size//2))
         screen.blit(loop_text, text_rect)
+        
+    def bounds(self, alpha=1.0):
+        """Screen area covered by the ghost and its trail, or None if hidden"""
+        position = self.render_position(alpha)
+        if position is None:
+            return None
+        x, y = position
+        # The loop number label can be a little wider than the ghost itself
+        rect = pygame.Rect(x - 5, y - 5, self.size + 10, self.size + 10)
+        radius = int(self.size * 0.4)
+        for tx, ty in quality.visible_trail(self.trail):
+            rect.union_ip(pygame.Rect(tx - radius, ty - radius, radius * 2 + 1, radius * 2 + 1))
+        return rect
+
+# Ghost swarm - every ghost's state is a row of preallocated NumPy columns, so
+# advancing playback, sampling trails and emitting particles are a few NumPy
+# operations per tick however many ghosts exist. A ghost keeps its loop's
+# recording and only a window of GHOST_WINDOW decoded positions around its
+# cursor, refilled from the end of the last window as playback moves on (or
+# from the recording's keyframes when seeking), so adding a ghost costs the
+# same however long its loop was. The swarm also remembers which ghosts
+# moved, so only those are reported to the triggers.
+class GhostSwarm:
+    def __init__(self, particles=None, size=20, trail_length=8, trail_interval=5, capacity=8):
+        self.particles = particles if particles is not None else ParticlePool()
+        self.size = size
+        self.trail_length = trail_length
+        self.trail_interval = trail_interval
+        self.ghosts = []
+        self.capacity = capacity
+        # name -> (shape of one row, dtype); each column is exposed as an
+        # attribute viewing its first len(self) rows
+        layout = {
+            'window': ((GHOST_WINDOW, 2), np.float32),  # Positions after ticks window_start onwards
+            'window_start': ((), np.int32),
+            'lengths': ((), np.int64),
+            'cursor': ((), np.int64),  # Hashed into replay digests, so its width is fixed
+            'current': ((2,), np.float32),
+            'previous': ((2,), np.float32),  # For render interpolation
+            'trail_timer': ((), np.int32),
+            'trail': ((trail_length, 2), np.float32),  # Ring buffers
+            'trail_head': ((), np.int32),
+            'trail_count': ((), np.int32),
+            'colors': ((3,), np.uint8),
+            'moved': ((), bool),  # Changed position since take_moved()
+        }
+        self.columns = {name: np.zeros((capacity,) + shape, dtype=dtype)
+                        for name, (shape, dtype) in layout.items()}
+        self.expose()
+        
+    def expose(self):
+        count = len(self.ghosts)
+        for name, column in self.columns.items():
+            setattr(self, name, column[:count])
+            
+    def __len__(self):
+        return len(self.ghosts)
+        
+    def __iter__(self):
+        return iter(self.ghosts)
+        
+    def __getitem__(self, index):
+        return self.ghosts[index]
+        
+    def add(self, recording, color=None):
+        """Add a ghost replaying recording; returns its Ghost handle"""
+        color = color or GHOST_COLOR
+        index = len(self.ghosts)
+        if index == self.capacity:
+            self.capacity *= 2
+            for name, column in self.columns.items():
+                grown = np.zeros((self.capacity,) + column.shape[1:], dtype=column.dtype)
+                grown[:index] = column[:index]
+                self.columns[name] = grown
+        for column in self.columns.values():
+            column[index] = 0
+        ghost = Ghost(self, index, recording, self.size, color)
+        self.ghosts.append(ghost)
+        self.expose()
+        self.lengths[index] = len(recording)
+        self.fill(index)
+        first = self.window[index, 0] if len(recording) else np.array(recording.start, dtype=np.float32)
+        self.current[index] = first
+        self.previous[index] = first
+        self.colors[index] = color[:3]
+        self.moved[index] = True  # Report where it starts
+        return ghost
+        
+    def pop(self, index=0):
+        """Remove a ghost (the oldest by default) and return its handle"""
+        ghost = self.ghosts.pop(index)
+        end = len(self.ghosts) + 1
+        for column in self.columns.values():
+            column[index:end - 1] = column[index + 1:end]
+        for i, other in enumerate(self.ghosts[index:], index):
+            other.index = i
+        self.expose()
+        return ghost
+        
+    def fill(self, index, before=None):
+        """Decode ghost index's window starting at its cursor. before is the
+        position after the tick before the cursor, if known."""
+        begin = int(self.cursor[index])
+        positions = self.ghosts[index].recording.decode(begin, GHOST_WINDOW, before)
+        self.window[index, :len(positions)] = positions
+        self.window[index, len(positions):] = 0
+        self.window_start[index] = begin
+        
+    def seek(self, cursors):
+        """Jump every ghost's playback to the given cursors"""
+        self.cursor[:] = cursors
+        for index in range(len(self.ghosts)):
+            self.fill(index)
+        count = len(self.ghosts)
+        self.current[:] = self.window[np.arange(count), self.cursor - self.window_start]
+        
+    def begin_tick(self):
+        """Remember where every ghost is before the tick, for interpolation"""
+        self.previous[:] = self.current
+        
+    def update(self, view=None):
+        """Advance playback one tick. Trails and particles, which are only
+        decoration, are suspended for ghosts outside view (when given)."""
+        count = len(self.ghosts)
+        if count == 0:
+            return
+        advancing = self.cursor < self.lengths - 1
+        self.cursor += advancing
+        for index in np.flatnonzero(self.cursor - self.window_start >= GHOST_WINDOW).tolist():
+            self.fill(index, self.window[index, -1])
+        before = self.current.copy()
+        self.current[:] = self.window[np.arange(count), self.cursor - self.window_start]
+        self.moved |= (self.current != before).any(axis=1)
+        visible = True
+        if view is not None:
+            x, y = self.current[:, 0], self.current[:, 1]
+            visible = ((x + self.size > view.left) & (x < view.right) &
+                       (y + self.size > view.top) & (y < view.bottom))
+            # A ghost's trail starts afresh when it comes back into view
+            self.trail_count[~visible] = 0
+        
+        # Add trail effect
+        self.trail_timer += advancing
+        sample = np.flatnonzero((self.trail_timer >= self.trail_interval) & visible)
+        if len(sample):
+            self.trail[sample, self.trail_head[sample]] = self.current[sample] + self.size / 2
+            self.trail_head[sample] = (self.trail_head[sample] + 1) % self.trail_length
+            self.trail_count[sample] = np.minimum(self.trail_count[sample] + 1, self.trail_length)
+            self.trail_timer[sample] = 0
+            
+        # Add ghost particles
+        rng = self.particles.rng
+        emit = np.flatnonzero(advancing & visible & (rng.random(count) < 0.1 * quality.particles))
+        if len(emit):
+            n = len(emit)
+            self.particles.emit_many(
+                self.current[emit, 0] + rng.uniform(0, self.size, n),
+                self.current[emit, 1] + rng.uniform(0, self.size, n),
+                self.colors[emit],
+                sizes=rng.uniform(1, 2, n),
+                lifetimes=rng.integers(10, 21, n)
+            )
+            
+    def trail_points(self, index):
+        count = int(self.trail_count[index])
+        start = int(self.trail_head[index]) - count
+        order = [(start + i) % self.trail_length for i in range(count)]
+        return [tuple(point) for point in self.trail[index, order].tolist()]
+        
+    def take_moved(self):
+        """Indices of the playing ghosts that moved since the last call"""
+        moved = np.flatnonzero(self.moved & (self.lengths > 0)).tolist()
+        self.moved[:] = False
+        return moved
 
-# Lever class
+# Tick scheduler - timed level logic runs off one clock instead of visiting
+# every lever, plate and wall each tick. Countdowns (lever cooldowns, plate
+# timers) are stored as the tick they run out at and read as what is left.
+# Expirations that have to do something (a plate popping up) wait in a heap
+# ordered by tick, and animations (a wall sliding away, a plate held down)
+# are tweens stepped only while they run. An idle entity costs nothing.
+class TickScheduler:
+    def __init__(self):
+        self.now = 0  # Ticks advanced so far
+        self.queue = []  # (tick, sequence, key, callback) heap
+        self.pending = {}  # key -> tick of its latest expiration; older queue entries for it are stale
+        self.tweens = {}  # key -> callback(key) stepped every tick until it returns False
+        self.sequence = 0  # Keeps expirations due on one tick in the order they were set
+        
+    def at(self, tick, key, callback):
+        """Call callback(key) once the clock reaches tick, replacing any
+        expiration key already had"""
+        self.pending[key] = tick
+        heapq.heappush(self.queue, (tick, self.sequence, key, callback))
+        self.sequence += 1
+        
+    def tween(self, key, callback):
+        """Call callback(key) every tick from the next one on, until it
+        returns False; replaces any tween key already had"""
+        self.tweens[key] = callback
+        
+    def cancel(self, key):
+        self.pending.pop(key, None)
+        self.tweens.pop(key, None)
+        
+    def clear(self):
+        """Drop every expiration and tween; the clock keeps running"""
+        self.queue = []
+        self.pending = {}
+        self.tweens = {}
+        
+    def advance(self):
+        """Move the clock on one tick, step the tweens, then run what is due"""
+        self.now += 1
+        for key, callback in list(self.tweens.items()):
+            if not callback(key) and self.tweens.get(key) is callback:
+                del self.tweens[key]
+        queue = self.queue
+        while queue and queue[0][0] <= self.now:
+            tick, _, key, callback = heapq.heappop(queue)
+            if self.pending.get(key) == tick:
+                del self.pending[key]
+                callback(key)
+
+# Entity store - levers, pressure plates and movable walls keep their state in
+# NumPy columns, one row per entity, like the particle pool and ghost swarm.
+# An entity costs a few bytes per component plus a two-slot handle, instead of
+# a dict or an instance __dict__, and nothing runs over every row per tick:
+# timed state is a Countdown on the store's TickScheduler.
+class Component:
+    """An entity attribute kept in row handle.index of the store's column of
+    the same name. With nullable, -1 in the column reads and writes as None."""
+    def __init__(self, dtype, nullable=False):
+        self.dtype = dtype
+        self.nullable = nullable
+        self.name = None
+        
+    def __set_name__(self, owner, name):
+        self.name = name
+        
+    def __get__(self, handle, owner=None):
+        if handle is None:
+            return self
+        # ndarray.item(i) skips building a NumPy scalar, several times faster than [i].item()
+        value = getattr(handle.store, self.name).item(handle.index)
+        return None if self.nullable and value < 0 else value
+        
+    def __set__(self, handle, value):
+        getattr(handle.store, self.name)[handle.index] = -1 if value is None else value
+        
+    def load(self, store, stored):
+        """Values of the column entries stored, as the handles read them"""
+        return stored
+        
+    def dump(self, store, values):
+        """Inverse of load()"""
+        return values
+
+class Countdown(Component):
+    """Ticks left until something runs out, counting down by itself: the
+    column holds the store clock's tick at which it reaches zero"""
+    def __init__(self):
+        super().__init__(np.int64)
+        
+    def __get__(self, handle, owner=None):
+        if handle is None:
+            return self
+        return max(0, getattr(handle.store, self.name).item(handle.index) - handle.store.clock.now)
+        
+    def __set__(self, handle, value):
+        getattr(handle.store, self.name)[handle.index] = handle.store.clock.now + value
+        
+    def deadline(self, handle):
+        return getattr(handle.store, self.name).item(handle.index)
+        
+    def load(self, store, stored):
+        return np.maximum(stored - store.clock.now, 0)
+        
+    def dump(self, store, values):
+        return np.asarray(values, dtype=np.int64) + store.clock.now
+
+class EntityStore:
+    def __init__(self, handle, capacity=16, clock=None):
+        """handle is the entity class; each of its Components gets a column.
+        clock is the TickScheduler its Countdowns run on."""
+        self.handle = handle
+        self.components = [(name, value) for name, value in vars(handle).items()
+                           if isinstance(value, Component)]
+        self.fields = dict(self.components)
+        self.clock = clock
+        self.count = 0  # Live entities occupy rows [0, count)
+        self.capacity = capacity
+        self.handles = []
+        for name, component in self.components:
+            setattr(self, name, np.zeros(capacity, dtype=component.dtype))
+            
+    def __len__(self):
+        return self.count
+        
+    def __iter__(self):
+        return iter(self.handles)
+        
+    def __getitem__(self, index):
+        return self.handles[index]
+        
+    def _reserve(self, n):
+        needed = self.count + n
+        if needed > self.capacity:
+            new_capacity = max(needed, self.capacity * 2)
+            for name, component in self.components:
+                grown = np.zeros(new_capacity, dtype=component.dtype)
+                grown[:self.count] = getattr(self, name)[:self.count]
+                setattr(self, name, grown)
+            self.capacity = new_capacity
+            
+    def extend(self, count, **columns):
+        """Add count entities; each keyword is a component's values (or one
+        value for all of them), components left out are zero. Returns the
+        new handles."""
+        self._reserve(count)
+        start, end = self.count, self.count + count
+        for name, component in self.components:
+            getattr(self, name)[start:end] = component.dump(self, columns.get(name, 0))
+        self.count = end
+        handles = [self.handle(self, i) for i in range(start, end)]
+        self.handles.extend(handles)
+        return handles
+        
+    def add(self, **values):
+        return self.extend(1, **values)[0]
+        
+    def pop(self, index):
+        """Remove an entity, keeping the others in order; returns its handle,
+        which no longer refers to anything"""
+        handle = self.handles.pop(index)
+        end = self.count
+        for name, component in self.components:
+            column = getattr(self, name)
+            column[index:end - 1] = column[index + 1:end]
+        self.count -= 1
+        for i in range(index, self.count):
+            self.handles[i].index = i
+        return handle
+        
+    def values(self, name, rows=slice(None)):
+        """A component's values for some rows (all by default) as an array,
+        as the handles read them"""
+        return self.fields[name].load(self, getattr(self, name)[:self.count][rows])
+        
+    def rows(self, *names, which=slice(None)):
+        """Every entity's (or those in which's) values of some components, as
+        tuples of Python values"""
+        return list(zip(*[self.values(name, which).tolist() for name in names]))
+        
+    def set_rows(self, names, rows):
+        """Inverse of rows()"""
+        for name, values in zip(names, zip(*rows)):
+            getattr(self, name)[:self.count] = self.fields[name].dump(self, values)
+
+# Lever class - a handle into the level's lever store
 class Lever:
-    def __init__(self, x, y, linked_wall=None):
-        self.x = x
-        self.y = y
-        self.width = 30
-        self.height = 15
-        self.activated = False
-        self.linked_wall = linked_wall
-        self.cooldown = 0
-        self.cooldown_max = 30  # Half second at 60 FPS
-        self.particles = []
+    __slots__ = ('store', 'index')
+    width = 30
+    height = 15
+    cooldown_max = 30  # Half second at 60 FPS
+    x = Component(np.int32)
+    y = Component(np.int32)
+    activated = Component(np.bool_)
+    cooldown = Countdown()
+    linked_wall = Component(np.int32, nullable=True)  # Index of the movable wall it toggles
+    
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+        
+    @property
+    def rect(self):
+        """Trigger area"""
+        return pygame.Rect(self.x - 5, self.y - 5, self.width + 10, self.height + 15)
+        
+    def bounds(self):
+        return pygame.Rect(self.x - 5, self.y - 5, self.width + 10, self.height + 20)
+        
+    def activate(self, particles):
+        # Straight on the columns, this runs whenever the player touches a lever
+        store, i, now = self.store, self.index, self.store.clock.now
+        if store.cooldown.item(i) <= now:
+            store.activated[i] = not store.activated.item(i)
+            store.cooldown[i] = now + self.cooldown_max
+            
+            # Create particles
+            particles.burst(10, (store.x.item(i), store.y.item(i), self.width, self.height), (255, 255, 100),
+                            size_range=(1, 3), lifetime_range=(10, 30))
+            return True
+        return False
+
+# Movable wall - a handle into the level's movable wall store. Levers and
+# plates toggle active; an inactive wall slides down out of the world.
+class MovableWall:
+    __slots__ = ('store', 'index')
+    x = Component(np.int32)
+    y = Component(np.int32)
+    width = Component(np.int32)
+    height = Component(np.int32)
+    home_y = Component(np.int32)  # Where the level places it, for saving
+    speed = Component(np.int32)
+    active = Component(np.bool_)
+    
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+        
+    @property
+    def rect(self):
+        return pygame.Rect(self.x, self.y, self.width, self.height)
+
+# Pressure plate - a handle into the level's plate store. A plate stays down
+# while anyone stands on it and for duration ticks after.
+class PressurePlate:
+    __slots__ = ('store', 'index')
+    color = RED
+    active_color = GREEN
+    x = Component(np.int32)
+    y = Component(np.int32)
+    width = Component(np.int32)
+    height = Component(np.int32)
+    activated = Component(np.bool_)
+    timer = Countdown()  # Runs while nobody stands on the plate
+    duration = Component(np.int32)  # Ticks the plate stays down
+    
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+        
+    @property
+    def rect(self):
+        return pygame.Rect(self.x, self.y, self.width, self.height)
+
+# Collision entry - one rect registered in a SpatialHash
+class CollisionEntry:
+    __slots__ = ('rect', 'kind', 'entity', 'cells')
+    
+    def __init__(self, rect, kind, entity):
+        self.rect = pygame.Rect(rect)
+        self.kind = kind  # 'wall' or 'movable_wall'; 'lever', 'plate' or 'goal' for triggers
+        self.entity = entity
+        self.cells = ()
+        
+# Spatial hash - a uniform grid broadphase so collision queries only test the
+# handful of rects that share a cell with the query instead of every entity
+class SpatialHash:
+    def __init__(self, cell_size=64):
+        self.cell_size = cell_size
+        self.cells = {}  # (column, row) -> list of CollisionEntry
+        self.tests = 0  # Narrow-phase rect tests performed, for profiling
+        
+    def cell_range(self, rect):
+        size = self.cell_size
+        return [(column, row)
+                for column in range(rect.left // size, (rect.right - 1) // size + 1)
+                for row in range(rect.top // size, (rect.bottom - 1) // size + 1)]
+        
+    def insert(self, rect, kind, entity):
+        entry = CollisionEntry(rect, kind, entity)
+        entry.cells = self.cell_range(entry.rect)
+        for cell in entry.cells:
+            self.cells.setdefault(cell, []).append(entry)
+        return entry
+        
+    def insert_bucketed(self, rects, kind, entities, buckets, refs):
+        """Insert many entries whose cells are already known: buckets is a list
+        of (column, row, count) and refs the indices into rects/entities for
+        each bucket in turn, as written by the level compiler"""
+        entries = [CollisionEntry(rect, kind, entity) for rect, entity in zip(rects, entities)]
+        cells = [[] for _ in entries]
+        position = 0
+        for column, row, count in buckets:
+            bucket = self.cells.setdefault((column, row), [])
+            for i in refs[position:position + count]:
+                bucket.append(entries[i])
+                cells[i].append((column, row))
+            position += count
+        for entry, entry_cells in zip(entries, cells):
+            entry.cells = entry_cells
+        return entries
+        
+    def remove(self, entry):
+        for cell in entry.cells:
+            bucket = self.cells[cell]
+            bucket.remove(entry)
+            if not bucket:
+                del self.cells[cell]
+        entry.cells = ()
+        
+    def move(self, entry, rect):
+        """Update an entry's rect, touching only the cells it enters or leaves"""
+        entry.rect = pygame.Rect(rect)
+        cells = self.cell_range(entry.rect)
+        if cells == entry.cells:
+            return
+        old, new = set(entry.cells), set(cells)
+        for cell in old - new:
+            bucket = self.cells[cell]
+            bucket.remove(entry)
+            if not bucket:
+                del self.cells[cell]
+        for cell in new - old:
+            self.cells.setdefault(cell, []).append(entry)
+        entry.cells = cells
+        
+    def query(self, rect, kinds=None, accept=None):
+        """Return every entry colliding with rect, optionally limited to some
+        kinds and to entries for which accept(entry) is true"""
+        hits = []
+        seen = set()
+        for cell in self.cell_range(rect):
+            for entry in self.cells.get(cell, ()):
+                if id(entry) in seen:
+                    continue
+                seen.add(id(entry))
+                if kinds is not None and entry.kind not in kinds:
+                    continue
+                self.tests += 1
+                if entry.rect.colliderect(rect) and (accept is None or accept(entry)):
+                    hits.append(entry)
+        return hits
+        
+    def first(self, rect, kinds=None, accept=None):
+        """Return the first colliding entry, or None"""
+        for cell in self.cell_range(rect):
+            for entry in self.cells.get(cell, ()):
+                if kinds is not None and entry.kind not in kinds:
+                    continue
+                self.tests += 1
+                if entry.rect.colliderect(rect) and (accept is None or accept(entry)):
+                    return entry
+        return None
+
+# Trigger system - levers, plates and the goal register trigger volumes in a
+# spatial hash of their own. Movers (the player and each ghost) report their
+# rect only when they move, and a report re-tests just that mover against the
+# volumes around it, firing 'enter', 'stay' and 'exit' events to the callbacks
+# subscribed to that (event, kind). A tick costs in proportion to how many
+# movers moved, not to volumes x movers.
+class TriggerSystem:
+    def __init__(self, cell_size=64):
+        self.index = SpatialHash(cell_size)
+        self.inside = {}  # mover -> {id(entry): entry} for the volumes it overlaps
+        self.occupants = {}  # id(entry) -> number of movers inside
+        self.handlers = {}  # (event, kind) -> callbacks taking (entity, mover)
+        
+    def add_volume(self, rect, kind, entity):
+        return self.index.insert(rect, kind, entity)
+        
+    def subscribe(self, event, kind, callback):
+        self.handlers.setdefault((event, kind), []).append(callback)
+        
+    def emit(self, event, kind, entity, mover):
+        for callback in self.handlers.get((event, kind), ()):
+            callback(entity, mover)
+            
+    def move(self, mover, rect, silent=False):
+        """Report that mover now covers rect. Fires exit, enter and stay
+        events unless silent, which only updates who is inside what."""
+        old = self.inside.get(mover, {})
+        new = {id(entry): entry for entry in self.index.query(rect)}
+        for key, entry in old.items():
+            if key not in new:
+                self.occupants[key] -= 1
+                if not silent:
+                    self.emit('exit', entry.kind, entry.entity, mover)
+        for key, entry in new.items():
+            if key not in old:
+                self.occupants[key] = self.occupants.get(key, 0) + 1
+                if not silent:
+                    self.emit('enter', entry.kind, entry.entity, mover)
+            elif not silent:
+                self.emit('stay', entry.kind, entry.entity, mover)
+        if new:
+            self.inside[mover] = new
+        else:
+            self.inside.pop(mover, None)
+            
+    def move_volume(self, entry, rect):
+        """Move a volume; movers find out the next time they report"""
+        self.index.move(entry, rect)
+        
+    def remove_volume(self, entry):
+        """Unregister a volume; movers inside it leave without an exit event"""
+        self.index.remove(entry)
+        self.occupants.pop(id(entry), None)
+        for mover, inside in list(self.inside.items()):
+            if inside.pop(id(entry), None) is not None and not inside:
+                del self.inside[mover]
+                
+    def remove_mover(self, mover, silent=False):
+        """Forget a mover, firing exit for every volume it was in"""
+        for key, entry in self.inside.pop(mover, {}).items():
+            self.occupants[key] -= 1
+            if not silent:
+                self.emit('exit', entry.kind, entry.entity, mover)
+            
+    def occupied(self, entry):
+        return self.occupants.get(id(entry), 0) > 0
+
+# Level packs - levels are written as JSON (see levels/main.json) and compiled
+# into a binary pack: magic, version, CRC32 of the JSON source, level count,
+# an index of (name, offset, length), then one blob per level made of a fixed
+# header and little-endian int32 columns. The static walls' spatial-hash
+# buckets are computed at compile time. Packs are memory-mapped and a level is
+# only decoded when it is loaded, so opening a pack of hundreds of levels
+# costs almost nothing.
+LEVEL_HEADER = struct.Struct('<2i4iiI6I')  # start, goal, cell size, static layer key, column lengths
+LEVEL_COLUMNS = (('walls', 4), ('movable_walls', 5), ('levers', 3), ('plates', 5),
+                 ('buckets', 3), ('bucket_refs', 1))
+
+class LevelData:
+    """One decoded level. Columns are int32 arrays viewing the pack:
+    walls (x, y, w, h), movable_walls (x, y, w, h, speed), levers (x, y, wall),
+    plates (x, y, w, h, duration), buckets (column, row, count) and
+    bucket_refs (wall indices, bucket after bucket). wall is -1 when unlinked."""
+    def __init__(self, name, start, goal, cell_size, layer_key, columns):
+        self.name = name
+        self.start = start
+        self.goal = goal
+        self.cell_size = cell_size
+        self.layer_key = layer_key  # Identifies the static layer the walls render to
+        for column, values in columns.items():
+            setattr(self, column, values)
+            
+def compile_level(level, cell_size=64):
+    """Pack one level from the JSON source into its binary blob"""
+    name = level.get('name', '?')
+    try:
+        def link(index):
+            if index is None:
+                return -1
+            if not 0 <= index < len(level.get('movable_walls', [])):
+                raise ValueError(f"no movable wall {index}")
+            return index
+        columns = {
+            'walls': [tuple(rect) for rect in level['walls']],
+            'movable_walls': [tuple(wall['rect']) + (wall.get('speed', 2),)
+                              for wall in level.get('movable_walls', [])],
+            'levers': [tuple(lever['pos']) + (link(lever.get('wall')),)
+                       for lever in level.get('levers', [])],
+            'plates': [tuple(plate['rect']) + (plate.get('duration', 180),)
+                       for plate in level.get('plates', [])],
+        }
+        start, goal = tuple(level['start']), tuple(level['goal'])
+        for column, width in LEVEL_COLUMNS[:4]:
+            if any(len(row) != width for row in columns[column]):
+                raise ValueError(f"bad {column} entry")
+        if len(start) != 2 or len(goal) != 4:
+            raise ValueError("bad start or goal")
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"level {name!r}: {e}") from None
+        
+    # Bucket the static walls exactly as SpatialHash.insert would
+    grid = SpatialHash(cell_size)
+    cells = {}
+    for i, wall in enumerate(columns['walls']):
+        for cell in grid.cell_range(pygame.Rect(wall)):
+            cells.setdefault(cell, []).append(i)
+    columns['buckets'] = [(column, row, len(cells[(column, row)])) for column, row in sorted(cells)]
+    columns['bucket_refs'] = [(i,) for cell in sorted(cells) for i in cells[cell]]
+    
+    walls = np.array(columns['walls'], dtype='<i4').reshape(-1, 4)
+    header = LEVEL_HEADER.pack(*start, *goal, cell_size, zlib.crc32(walls.tobytes()),
+                               *(len(columns[column]) for column, _ in LEVEL_COLUMNS))
+    body = b''.join(np.array(columns[column], dtype='<i4').reshape(-1, width).tobytes()
+                    for column, width in LEVEL_COLUMNS)
+    return header + body
+    
+def compile_level_pack(source, dest=None):
+    """Compile a JSON level source into a binary pack; returns the pack path"""
+    dest = dest or os.path.splitext(source)[0] + '.tlpack'
+    with open(source, 'rb') as f:
+        raw = f.read()
+    levels = json.loads(raw)['levels']
+    names = [level.get('name', '?') for level in levels]
+    if len(set(names)) != len(names):
+        raise ValueError(f"{source}: level names must be unique")
+    blobs = [compile_level(level) for level in levels]
+    
+    encoded = [name.encode('utf-8') for name in names]
+    offset = len(LEVEL_PACK_MAGIC) + 12 + sum(2 + len(name) + 8 for name in encoded)
+    index = b''
+    for name, blob in zip(encoded, blobs):
+        index += struct.pack('<H', len(name)) + name + struct.pack('<II', offset, len(blob))
+        offset += len(blob)
+        
+    # Write next to the destination and swap in, so a reader never sees half a pack
+    with open(dest + '.tmp', 'wb') as f:
+        f.write(LEVEL_PACK_MAGIC + struct.pack('<III', LEVEL_PACK_VERSION, zlib.crc32(raw), len(blobs)))
+        f.write(index)
+        f.writelines(blobs)
+    os.replace(dest + '.tmp', dest)
+    return dest
+    
+def format_level_source(value, indent=0):
+    """JSON laid out like levels/main.json: anything holding only numbers
+    (or flat lists of them) goes on one line, everything else is indented"""
+    def flat(item):
+        if isinstance(item, dict):
+            return all(not isinstance(v, (dict, list)) or (isinstance(v, list) and flat(v))
+                       for v in item.values())
+        if isinstance(item, list):
+            return not any(isinstance(v, (dict, list)) for v in item)
+        return True
+        
+    if flat(value) or not value:
+        return json.dumps(value)
+    pad = '  ' * (indent + 1)
+    if isinstance(value, dict):
+        items = [f'{pad}{json.dumps(key)}: {format_level_source(item, indent + 1)}'
+                 for key, item in value.items()]
+        return '{\n' + ',\n'.join(items) + '\n' + '  ' * indent + '}'
+    items = [pad + format_level_source(item, indent + 1) for item in value]
+    return '[\n' + ',\n'.join(items) + '\n' + '  ' * indent + ']'
+    
+def save_level_source(source, level):
+    """Write a level (as from Level.to_json) into a JSON level source,
+    replacing the level of the same name or adding it at the end"""
+    with open(source) as f:
+        document = json.load(f)
+    levels = document['levels']
+    names = [entry.get('name') for entry in levels]
+    if level['name'] in names:
+        levels[names.index(level['name'])] = level
+    else:
+        levels.append(level)
+    with open(source + '.tmp', 'w') as f:
+        f.write(format_level_source(document) + '\n')
+    os.replace(source + '.tmp', source)
+    level_packs.pop(source, None)  # Recompiled on next open
+    
+class LevelPack:
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            self.data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        start = len(LEVEL_PACK_MAGIC)
+        if self.data[:start] != LEVEL_PACK_MAGIC:
+            raise ValueError(f"{path} is not a level pack")
+        version, self.source_crc, count = struct.unpack_from('<III', self.data, start)
+        if version != LEVEL_PACK_VERSION:
+            raise ValueError(f"{path}: unsupported level pack version {version}")
+            
+        # Only the index is read up front
+        self.names = []
+        self.entries = {}  # name -> (offset, length)
+        position = start + 12
+        for _ in range(count):
+            length, = struct.unpack_from('<H', self.data, position)
+            name = self.data[position + 2:position + 2 + length].decode('utf-8')
+            self.entries[name] = struct.unpack_from('<II', self.data, position + 2 + length)
+            self.names.append(name)
+            position += 2 + length + 8
+            
+    def __len__(self):
+        return len(self.names)
+        
+    def __contains__(self, name):
+        return name in self.entries
+        
+    def load(self, level):
+        """Decode one level, by name or by position in the pack"""
+        name = self.names[level] if isinstance(level, int) else level
+        if name not in self.entries:
+            raise KeyError(f"no level {name!r} in {self.path}")
+        offset, _ = self.entries[name]
+        values = LEVEL_HEADER.unpack_from(self.data, offset)
+        offset += LEVEL_HEADER.size
+        columns = {}
+        for (column, width), rows in zip(LEVEL_COLUMNS, values[8:]):
+            columns[column] = np.frombuffer(self.data, dtype='<i4', count=rows * width,
+                                            offset=offset).reshape(rows, width)
+            offset += rows * width * 4
+        return LevelData(name, values[0:2], values[2:6], values[6], values[7], columns)
+        
+level_packs = {}  # Open packs by source path
+
+def open_level_pack(source=DEFAULT_LEVEL_PACK):
+    """Open a level pack. A JSON source is compiled to a .tlpack beside it
+    first if that pack is missing or was built from a different source."""
+    if source in level_packs:
+        return level_packs[source]
+    path = source
+    if source.endswith('.json'):
+        path = os.path.splitext(source)[0] + '.tlpack'
+        with open(source, 'rb') as f:
+            crc = zlib.crc32(f.read())
+        try:
+            pack = LevelPack(path)
+            stale = pack.source_crc != crc
+        except (OSError, ValueError, struct.error):
+            stale = True
+        if stale:
+            compile_level_pack(source, path)
+    pack = level_packs[source] = LevelPack(path)
+    return pack
+
+# Camera - the part of the world on screen. A level can be many screens wide;
+# the view is centered on the player and stops at the edges of the world.
+class Camera:
+    def __init__(self):
+        self.view = pygame.Rect(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)  # Follows the player tick by tick
+        self.shown = self.view.copy()  # View of the last frame drawn, which follows the interpolated player
+        
+    def follow(self, center, world):
+        self.view = self.view_around(center, world)
+        
+    @staticmethod
+    def view_around(center, world, size=(SCREEN_WIDTH, SCREEN_HEIGHT)):
+        """A view of size centered on center, moved inside world"""
+        view = pygame.Rect((0, 0), size)
+        view.center = (int(round(center[0])), int(round(center[1])))
+        return view.clamp(world)
+        
+    def to_world(self, pos):
+        """World position of a point on the screen last drawn"""
+        return (pos[0] + self.shown.x, pos[1] + self.shown.y)
+
+thin_wall_extents = {}  # (width, height) -> area draw_wall paints, for walls 3px thin or less
+# (static layer key, world, grid, cell) -> chunk baked by a level with that
+# layout, so rebuilding a level (or one laid out the same) bakes nothing again
+shared_chunks = OrderedDict()
+
+# Level class
+class Level:
+    def __init__(self, particles=None, data=None):
+        """data is a LevelData from a level pack; the first level of the
+        default pack is used when it is None"""
+        self.walls = []
+        self.scheduler = TickScheduler()  # Lever cooldowns, plate timers and wall slides
+        self.movable_walls = EntityStore(MovableWall)  # Walls that can be moved by levers
+        self.goal = (700, 500, 50, 50)  # (x, y, width, height)
+        self.start_pos = (50, 50)
+        self.levers = EntityStore(Lever, clock=self.scheduler)
+        self.pressure_plates = EntityStore(PressurePlate, clock=self.scheduler)
+        self.down_plates = set()  # Activated plates
+        self.particles = particles if particles is not None else ParticlePool()
+        self.name = 'default'  # Level id written to replays
+        self.goal_glow_frames = {}  # glow radius -> pre-rendered gradient
+        self.goal_glow_key = None  # (goal, GOAL_COLOR) the frames were built for
+        self.world = pygame.Rect(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT)  # Everything the level holds
+        self.chunks = OrderedDict()  # (column, row) -> baked static surface, least recently used first
+        self.static_layer = None  # Background, grid and walls under static_view, composed from chunks
+        self.static_view = None
+        self.view_layers = []  # The two surfaces static_layer alternates between
+        self.baked_grid = None  # quality.grid the cached chunks were baked with
+        self.static_layer_key = None  # Written by the level compiler, keys shared_chunks; None once walls change
+        self.static_damage = []  # Screen areas of the static layer re-baked since the last frame
+        self.collision_index = SpatialHash()
+        self.wall_entries = []  # CollisionEntry per static wall, same order
+        self.wall_order = {}  # id(entry) -> drawing order of its wall, kept in step with walls
+        self.wall_reach = None  # Furthest any wall paints past its rect, found on the first repair
+        self.movable_wall_entries = []  # CollisionEntry per movable wall, same order
+        self.chunk_index = SpatialHash(CHUNK_SIZE)  # Goal, movable walls, levers and plates by drawn area
+        self.drawables = {}  # id(entity) -> its CollisionEntry in chunk_index
+        self.drawable_order = {}  # id(entry) -> drawing order within its kind
+        self.drawables_added = 0
+        self.triggers = TriggerSystem()
+        self.lever_triggers = []  # Trigger volume per lever, same order
+        self.plate_triggers = []  # Trigger volume per plate, same order
+        self.goal_trigger = None
+        self.player_at_goal = False
+        self.triggers.subscribe('enter', 'lever', self.on_lever_enter)
+        self.triggers.subscribe('enter', 'plate', self.on_plate_enter)
+        self.triggers.subscribe('enter', 'goal', self.on_goal_enter)
+        self.triggers.subscribe('exit', 'goal', self.on_goal_exit)
+        if data is None:
+            data = open_level_pack().load(0)
+        self.setup_level(data)
+        self.build_collision_index(data)
+        self.build_triggers()
+        self.build_drawables()
+        
+    def setup_level(self, data):
+        """Create walls, levers and plates from a decoded level"""
+        self.name = data.name
+        self.start_pos = tuple(data.start)
+        self.goal = tuple(data.goal)
+        self.walls = [tuple(wall) for wall in data.walls.tolist()]
+        self.static_layer_key = data.layer_key
+        
+        walls = data.movable_walls
+        self.movable_walls.extend(len(walls), x=walls[:, 0], y=walls[:, 1], width=walls[:, 2],
+                                  height=walls[:, 3], home_y=walls[:, 1], speed=walls[:, 4], active=True)
+        
+        # Levers toggle the movable wall at their wall index (-1 for none)
+        levers = data.levers
+        self.levers.extend(len(levers), x=levers[:, 0], y=levers[:, 1], linked_wall=levers[:, 2])
+        
+        plates = data.plates
+        self.pressure_plates.extend(len(plates), x=plates[:, 0], y=plates[:, 1], width=plates[:, 2],
+                                    height=plates[:, 3], duration=plates[:, 4])
+        self.world = self.measure_world()
+        
+    def measure_world(self):
+        """The area the level spans: the screen at the origin and every element"""
+        rects = [pygame.Rect(wall) for wall in self.walls]
+        rects += [pygame.Rect(wall.x, wall.home_y, wall.width, wall.height) for wall in self.movable_walls]
+        rects += [lever.bounds() for lever in self.levers]
+        rects += [plate.rect for plate in self.pressure_plates]
+        rects += [pygame.Rect(self.goal), pygame.Rect(self.start_pos, (20, 20))]
+        return pygame.Rect(0, 0, SCREEN_WIDTH, SCREEN_HEIGHT).unionall(rects)
+        
+    def start_view(self):
+        """The view the level is first seen through"""
+        return Camera.view_around(pygame.Rect(self.start_pos, (20, 20)).center, self.world)
+        
+    def update(self, view=None):
+        """Advance one tick; decoration (plate particles) is only added inside
+        view, or everywhere when view is None"""
+        # Plates that were down at the start of the tick sparkle, even if they pop up now
+        plates = self.pressure_plates
+        down = np.flatnonzero(plates.activated[:len(plates)]) if self.down_plates else ()
+        
+        # Sliding walls and held plates step, plates whose timer ran out pop
+        # up; lever cooldowns run out by themselves
+        self.scheduler.advance()
+        if not len(down):
+            return
+        
+        # Add particles, unless nobody can see them
+        x, y, width, height = plates.x[down], plates.y[down], plates.width[down], plates.height[down]
+        rng = self.particles.rng
+        emit = rng.random(len(down)) < 0.1 * quality.particles
+        if view is not None:
+            emit &= (x + width > view.left) & (x < view.right) & (y + height > view.top) & (y < view.bottom)
+        n = int(np.count_nonzero(emit))
+        if n:
+            self.particles.emit_many(
+                x[emit] + rng.uniform(0, 1, n) * width[emit],
+                y[emit] + rng.uniform(0, 1, n) * height[emit],
+                np.tile(np.array(PressurePlate.active_color, dtype=np.uint8), (n, 1)),
+                sizes=rng.uniform(1, 3, n),
+                lifetimes=rng.integers(10, 21, n)
+            )
+            
+    def slide_walls(self, walls):
+        """Tween over the whole store: inactive walls slide out of the world,
+        active ones stay where they are"""
+        count = len(walls)
+        target = self.world.bottom + 50
+        y = walls.y[:count]
+        sliding = np.flatnonzero(~walls.active[:count] & (y != target))
+        if not len(sliding):
+            return False
+        speed = walls.speed[sliding]
+        y[sliding] += np.clip(target - y[sliding], -speed, speed)
+        for index in sliding[speed != 0].tolist():
+            self.wall_moved(index)
+        return True
+        
+    def hold_plate(self, plate):
+        """Tween: a plate's timer stays full while anyone stands on it, then
+        runs out by itself"""
+        plates, i = self.pressure_plates, plate.index
+        if self.triggers.occupied(self.plate_triggers[i]):
+            plates.timer[i] = self.scheduler.now + plates.duration.item(i)
+            return True
+        self.scheduler.at(plates.timer.item(i), plate, self.release_plate)
+        return False
+        
+    def release_plate(self, plate):
+        plates, i = self.pressure_plates, plate.index
+        if plates.timer.item(i) <= self.scheduler.now:
+            plates.activated[i] = False
+            self.down_plates.discard(plate)
+            
+    def reschedule(self):
+        """Rebuild the wall slides and plate timers from the stores, after
+        their state was written directly (e.g. restoring a snapshot)"""
+        self.scheduler.clear()
+        walls, plates = self.movable_walls, self.pressure_plates
+        if not walls.active[:len(walls)].all():
+            self.scheduler.tween(walls, self.slide_walls)
+        self.down_plates = {plates[i] for i in np.flatnonzero(plates.activated[:len(plates)]).tolist()}
+        for plate in self.down_plates:
+            self.scheduler.tween(plate, self.hold_plate)
+            
+    def wall_moved(self, index):
+        """Re-index movable wall index after its y changed"""
+        walls = self.movable_walls
+        x, y, width, height = walls.rows('x', 'y', 'width', 'height', which=[index])[0]
+        self.collision_index.move(self.movable_wall_entries[index], (x, y, width, height))
+        self.chunk_index.move(self.drawables[id(walls[index])], (x, y, width + 3, height + 3))
+        
+    def draw(self, screen, view=None):
+        """Draw what is inside view (the screen at the origin by default)"""
+        view = pygame.Rect(view or (0, 0, SCREEN_WIDTH, SCREEN_HEIGHT))
+        # Background, grid and static walls come from the cached chunks
+        screen.blit(self.get_static_layer(view), (0, 0))
+        for key, state, rect, draw in self.dirty_layers(view):
+            draw(screen)
+            
+    def get_static_layer(self, view=None):
+        """Return the background, grid and static walls under view (the screen
+        at the origin by default) as one screen-sized surface. A new view is
+        composed from the cached chunks into the other of two surfaces, so the
+        Renderer sees a different layer whenever the view moves."""
+        view = pygame.Rect(view or (0, 0, SCREEN_WIDTH, SCREEN_HEIGHT))
+        if self.baked_grid != quality.grid:
+            self.invalidate_static_layer()
+            self.baked_grid = quality.grid
+        if self.static_layer is not None and view == self.static_view:
+            return self.static_layer
+        if len(self.view_layers) < 2:
+            layer = pygame.Surface(view.size)
+            if pygame.display.get_surface() is not None:
+                layer = layer.convert()
+            self.view_layers.append(layer)
+        layer = self.view_layers[0] if self.view_layers[0] is not self.static_layer else self.view_layers[1]
+        for column, row in self.chunk_index.cell_range(view):
+            layer.blit(self.get_chunk((column, row)), (column * CHUNK_SIZE - view.x, row * CHUNK_SIZE - view.y))
+        # Bake the chunks around the view before they scroll into it
+        for cell in self.chunk_index.cell_range(view.inflate(2 * VIEW_MARGIN, 2 * VIEW_MARGIN)):
+            self.get_chunk(cell)
+        self.static_layer = layer
+        self.static_view = view
+        return layer
+        
+    def get_chunk(self, cell):
+        """The static surface of one chunk, baked on first use"""
+        chunk = self.chunks.get(cell)
+        if chunk is None:
+            chunk = self.chunks[cell] = self.bake_chunk(cell)
+            if len(self.chunks) > MAX_CHUNKS:
+                self.chunks.popitem(last=False)
+        else:
+            self.chunks.move_to_end(cell)
+        return chunk
+        
+    def bake_chunk(self, cell):
+        """Bake one chunk, or take it from shared_chunks when another level
+        with the same compiled walls and world already baked it"""
+        if self.static_layer_key is None:
+            return self.bake(self.chunk_rect(cell))
+        key = (self.static_layer_key, tuple(self.world), quality.grid, cell)
+        chunk = shared_chunks.get(key)
+        if chunk is None:
+            chunk = shared_chunks[key] = self.bake(self.chunk_rect(cell))
+            if len(shared_chunks) > MAX_CHUNKS:
+                shared_chunks.popitem(last=False)
+        else:
+            shared_chunks.move_to_end(key)
+        return chunk
+        
+    def chunk_rect(self, cell):
+        return pygame.Rect(cell[0] * CHUNK_SIZE, cell[1] * CHUNK_SIZE, CHUNK_SIZE, CHUNK_SIZE)
+        
+    def invalidate_static_layer(self):
+        """Call after changing self.walls so the static layer is rebuilt"""
+        self.chunks.clear()
+        self.static_layer = None
+        
+    def bake(self, area):
+        """Render the static layer under area into a new surface. pygame rounds
+        clipped rects slightly differently, so the walls reaching area are
+        drawn whole onto a scratch surface and only area is copied out. Chunks
+        and repaired areas then join up pixel for pixel, as if the whole world
+        had been drawn at once."""
+        surface = pygame.Surface(area.size)
+        if pygame.display.get_surface() is not None:
+            surface = surface.convert()
+        inside = area.clip(self.world)
+        if inside != area:
+            surface.fill(BACKGROUND_COLOR)  # Beyond the edge of the world
+        if not inside.width or not inside.height:
+            return surface
+        if self.wall_reach is None:
+            self.wall_reach = max([self.wall_overshoot(wall) for wall in self.walls if min(wall[2:]) <= 3],
+                                  default=0)
+        # Any wall whose painted area meets inside has its rect in reach
+        reach = inside.union(inside.move(-3, -3)).inflate(2 * self.wall_reach, 2 * self.wall_reach)
+        # Walls overlap in list order, as in a full build
+        entries = sorted(self.collision_index.query(reach, ('wall',)),
+                         key=lambda entry: self.wall_order[id(entry)])
+        # Walls cut off by the edge of the world are cut off there in the canvas too
+        canvas_rect = inside.unionall([self.wall_bounds(entry.entity) for entry in entries])
+        canvas_rect = canvas_rect.clip(self.world)
+        canvas = pygame.Surface(canvas_rect.size)
+        if pygame.display.get_surface() is not None:
+            canvas = canvas.convert()
+        self.draw_background(canvas, canvas_rect.topleft)
+        for entry in entries:
+            self.draw_wall(canvas, pygame.Rect(entry.entity).move(-canvas_rect.x, -canvas_rect.y))
+        surface.blit(canvas, inside.move(-area.x, -area.y), inside.move(-canvas_rect.x, -canvas_rect.y))
+        return surface
+        
+    def draw_background(self, layer, origin=(0, 0)):
+        """Background and grid; origin is the world position of layer's corner"""
+        ox, oy = origin
+        width, height = layer.get_size()
+        # Draw background with subtle pattern
+        layer.fill(BACKGROUND_COLOR)
+        
+        # Draw subtle grid pattern
+        if not quality.grid:
+            return
+        for x in range(ox + -ox % 40, ox + width, 40):
+            pygame.draw.line(layer, (230, 230, 235), (x - ox, 0), (x - ox, height), 1)
+        for y in range(oy + -oy % 40, oy + height, 40):
+            pygame.draw.line(layer, (230, 230, 235), (0, y - oy), (width, y - oy), 1)
+            
+    def draw_wall(self, layer, wall):
+        """Draw a static wall; returns the area painted"""
+        # Draw walls with shadow effect
+        wall_rect = pygame.Rect(wall)
+        # Shadow
+        shadow_rect = pygame.Rect(wall_rect.x + 3, wall_rect.y + 3, wall_rect.width, wall_rect.height)
+        painted = pygame.draw.rect(layer, (30, 30, 30), shadow_rect, border_radius=3)
+        # Wall
+        painted.union_ip(pygame.draw.rect(layer, WALL_COLOR, wall_rect, border_radius=3))
+        # Highlight
+        painted.union_ip(pygame.draw.rect(layer, (80, 80, 80), wall_rect, width=2, border_radius=3))
+        return painted
+        
+    def wall_bounds(self, wall):
+        """Area draw_wall paints for a wall, shadow included. pygame paints
+        rounded rects 3px thin or less well past their edges, so the area for
+        those sizes is measured once on a scratch surface."""
+        rect = pygame.Rect(wall)
+        if min(rect.size) > 3:
+            return rect.union(rect.move(3, 3))
+        extent = thin_wall_extents.get(rect.size)
+        if extent is None:
+            pad = max(rect.size) + 16
+            scratch = pygame.Surface((rect.width + 2 * pad, rect.height + 2 * pad))
+            extent = self.draw_wall(scratch, (pad, pad) + rect.size).move(-pad, -pad)
+            thin_wall_extents[rect.size] = extent
+        return extent.move(rect.topleft)
+        
+    def wall_overshoot(self, wall):
+        """How far past its rect (and shadow) a wall paints"""
+        rect, bounds = pygame.Rect(wall), self.wall_bounds(wall)
+        return max(rect.left - bounds.left, rect.top - bounds.top,
+                   bounds.right - rect.right - 3, bounds.bottom - rect.bottom - 3, 0)
+        
+    def repair_static_layer(self, area):
+        """Re-bake the part of the static layer under area after a wall edit,
+        in the cached chunks and the view on screen"""
+        if self.static_layer_key is not None:
+            # The first edit: chunks patched in place must stop being shared
+            self.chunks = OrderedDict((cell, chunk.copy()) for cell, chunk in self.chunks.items())
+            self.static_layer_key = None
+        area = pygame.Rect(area).clip(self.world)
+        if not self.chunks or not area.width or not area.height:
+            return  # Baked on first draw
+        patch = self.bake(area)
+        for cell in self.chunk_index.cell_range(area):
+            chunk = self.chunks.get(cell)
+            if chunk is not None:
+                chunk_rect = self.chunk_rect(cell)
+                clipped = area.clip(chunk_rect)
+                chunk.blit(patch, clipped.move(-chunk_rect.x, -chunk_rect.y), clipped.move(-area.x, -area.y))
+        if self.static_layer is not None and area.colliderect(self.static_view):
+            clipped = area.clip(self.static_view)
+            on_screen = clipped.move(-self.static_view.x, -self.static_view.y)
+            self.static_layer.blit(patch, on_screen, clipped.move(-area.x, -area.y))
+            self.static_damage.append(on_screen)
+            
+    def take_static_damage(self):
+        """Screen areas of the static layer changed in place since the last call"""
+        damage, self.static_damage = self.static_damage, []
+        return damage
+        
+    def goal_pulse_size(self):
+        """Radius of the goal glow this frame; 0 when it is switched off"""
+        if quality.glow is None:
+            return 0
+        goal_rect = pygame.Rect(self.goal)
+        pulse = math.sin(animation_ms() * 0.005) * 0.2 + 0.8 if quality.glow == 'pulse' else 1.0
+        return int(max(goal_rect.width, goal_rect.height) * 1.2 * pulse)
+        
+    def goal_bounds(self):
+        """Area the goal and its largest glow frame can cover"""
+        goal_rect = pygame.Rect(self.goal)
+        glow_size = int(max(goal_rect.width, goal_rect.height) * 1.2)
+        glow_rect = pygame.Rect(0, 0, glow_size * 2, glow_size * 2)
+        glow_rect.center = goal_rect.center
+        return glow_rect.union(goal_rect)
+        
+    def draw_goal(self, screen, offset=(0, 0)):
+        # Draw goal with glow effect
+        goal_rect = pygame.Rect(self.goal).move(offset)
+        glow_size = self.goal_pulse_size()
+        glow_surface = self.get_goal_glow(glow_size)
+        if glow_surface is not None:
+            screen.blit(glow_surface, 
+                       (goal_rect.centerx - glow_size, goal_rect.centery - glow_size))
+        
+        # Draw goal
+        pygame.draw.rect(screen, GOAL_COLOR, goal_rect, border_radius=10)
+        pygame.draw.rect(screen, (255, 255, 255), goal_rect, width=2, border_radius=10)
+        
+    def movable_wall_bounds(self, wall):
+        return pygame.Rect(wall.x, wall.y, wall.width + 3, wall.height + 3)
         
-    def update(self):
-        if self.cooldown > 0:
-            self.cooldown -= 1
-            
-        # Update particles
-        for particle in self.particles[:]:
-            particle.update()
-            if particle.lifetime <= 0:
-                self.particles.remove(particle)
-                
-    def draw(self, screen):
+    def draw_movable_wall(self, screen, rect, active, offset=(0, 0)):
+        rect = pygame.Rect(rect).move(offset)
+        # Shadow
+        if quality.shadows:
+            shadow_rect = pygame.Rect(rect.x + 3, rect.y + 3, rect.width, rect.height)
+            pygame.draw.rect(screen, (30, 30, 30, 150), shadow_rect, border_radius=3)
+        
+        # Wall with slight transparency
+        wall_color = (100, 100, 200) if active else (200, 100, 100)
+        wall_surface = sprite_cache.get('rect', wall_color, rect.size, 200, border_radius=3)
+        screen.blit(wall_surface, (rect.x, rect.y))
+        
+        # Highlight
+        pygame.draw.rect(screen, (150, 150, 255) if active else (255, 150, 150), 
+                        rect, width=2, border_radius=3)
+        
+    def plate_bounds(self, plate):
+        return pygame.Rect(plate.x, plate.y - 5, plate.width, plate.height + 5)
+        
+    def draw_plate(self, screen, rect, activated, indicator_width, offset=(0, 0)):
+        """indicator_width is how much of the plate's width the timer bar spans"""
+        rect = pygame.Rect(rect).move(offset)
+        color = PressurePlate.active_color if activated else PressurePlate.color
+        pygame.draw.rect(screen, color, rect, border_radius=5)
+        pygame.draw.rect(screen, (255, 255, 255), rect, width=2, border_radius=5)
+        
+        # Draw activation indicator
+        if activated:
+            indicator_rect = pygame.Rect(rect.x, rect.y - 5, indicator_width, 3)
+            pygame.draw.rect(screen, PressurePlate.active_color, indicator_rect)
+            
+    def draw_lever(self, screen, position, activated, offset=(0, 0)):
+        x, y = position[0] + offset[0], position[1] + offset[1]
+        width, height = Lever.width, Lever.height
         # Draw lever base
         pygame.draw.rect(screen, (100, 100, 100), 
-                        (self.x - 5, self.y + 10, self.width + 10, 5), border_radius=2)
+                        (x - 5, y + 10, width + 10, 5), border_radius=2)
         
         # Draw lever handle
-        if self.activated:
+        if activated:
             # Activated position (right)
             pygame.draw.rect(screen, (200, 200, 100), 
-                            (self.x + self.width//2, self.y - 5, self.width//2, self.height + 10), 
+                            (x + width//2, y - 5, width//2, height + 10), 
                             border_radius=5)
         else:
             # Deactivated position (left)
             pygame.draw.rect(screen, (200, 200, 100), 
-                            (self.x, self.y - 5, self.width//2, self.height + 10), 
+                            (x, y - 5, width//2, height + 10), 
                             border_radius=5)
-                            
-        # Draw particles
-        for particle in self.particles:
-            particle.draw(screen)
             
-    def check_collision(self, player):
-        player_rect = pygame.Rect(player.x, player.y, player.size, player.size)
-        lever_rect = pygame.Rect(self.x - 5, self.y - 5, self.width + 10, self.height + 15)
-        return player_rect.colliderect(lever_rect)
+    def dirty_layers(self, view=None):
+        """Dynamic level elements inside view (the screen at the origin by
+        default) as (key, state, rect, draw) for the Renderer, in screen
+        coordinates. Only the chunks under view are looked at."""
+        view = pygame.Rect(view or (0, 0, SCREEN_WIDTH, SCREEN_HEIGHT))
+        offset = (-view.x, -view.y)
+        found = {kind: [] for kind in LAYER_ORDER}
+        for entry in self.chunk_index.query(view):
+            found[entry.kind].append(entry)
+        layers = []
+        for kind in sorted(LAYER_ORDER, key=LAYER_ORDER.get):
+            entries = sorted(found[kind], key=lambda entry: self.drawable_order[id(entry)])
+            if not entries:
+                continue
+            if kind == 'goal':
+                layers.append(('goal', self.goal_pulse_size(), entries[0].rect.move(offset),
+                               lambda screen: self.draw_goal(screen, offset)))
+                continue
+            # Every visible entity's state is read from the store's columns at
+            # once, and handed to its draw call as is
+            rows = np.fromiter([entry.entity.index for entry in entries], dtype=np.intp, count=len(entries))
+            if kind == 'movable_wall':
+                # A movable wall's state is its rect too
+                walls = self.movable_walls
+                states = list(zip(walls.rows('x', 'y', 'width', 'height', which=rows), walls.active[rows].tolist()))
+                args = states
+                draw = self.draw_movable_wall
+            elif kind == 'lever':
+                levers = self.levers
+                states = levers.activated[rows].tolist()
+                args = list(zip(levers.rows('x', 'y', which=rows), states))
+                draw = self.draw_lever
+            else:
+                plates = self.pressure_plates
+                activated = plates.activated[rows]
+                indicator = np.where(activated, plates.width[rows] * plates.values('timer', rows) / plates.duration[rows], 0)
+                states = list(zip(activated.tolist(), indicator.astype(int).tolist()))
+                args = [(rect, *state) for rect, state in zip(plates.rows('x', 'y', 'width', 'height', which=rows), states)]
+                draw = self.draw_plate
+            for entry, state, arg in zip(entries, states, args):
+                layers.append(((kind, id(entry.entity)), state, entry.rect.move(offset),
+                               lambda screen, arg=arg, draw=draw: draw(screen, *arg, offset)))
+        return layers
         
-    def activate(self):
-        if self.cooldown <= 0:
-            self.activated = not self.activated
-            self.cooldown = self.cooldown_max
+    def get_goal_glow(self, glow_size):
+        """Return the goal glow for a radius, building the frame table if the
+        goal or its color changed since it was last built"""
+        key = (tuple(self.goal), GOAL_COLOR)
+        if key != self.goal_glow_key:
+            self.build_goal_glow_frames()
+        return self.goal_glow_frames.get(glow_size)
+        
+    def build_goal_glow_frames(self):
+        # The pulse only spans 0.6-1.0, so every radius it can produce is a
+        # small integer range; render each one once up front
+        goal_rect = pygame.Rect(self.goal)
+        base = max(goal_rect.width, goal_rect.height) * 1.2
+        self.goal_glow_frames = {}
+        for glow_size in range(int(base * 0.6), int(base) + 1):
+            if glow_size <= 0:
+                continue
+            glow_surface = pygame.Surface((glow_size*2, glow_size*2), pygame.SRCALPHA)
             
-            # Create particles
-            for _ in range(10):
-                self.particles.append(
-                    Particle(
-                        self.x + random.uniform(0, self.width),
-                        self.y + random.uniform(0, self.height),
-                        (255, 255, 100),
-                        size=random.uniform(1, 3),
-                        lifetime=random.randint(10, 30)
-                    )
-                )
-            return True
-        return False
-
-# Level class
-class Level:
-    def __init__(self):
-        self.walls = []
-        self.movable_walls = []  # Walls that can be moved by levers
-        self.goal = (700, 500, 50, 50)  # (x, y, width, height)
-        self.start_pos = (50, 50)
-        self.levers = []
-        self.pressure_plates = []
-        self.particles = []
-        self.setup_level()
-        
-    def setup_level(self):
-        # Add some walls (x, y, width, height)
-        self.walls = [
-            (100, 100, 600, 20),   # Top wall
-            (100, 300, 600, 20),   # Middle wall
-            (100, 500, 400, 20),   # Bottom partial wall
-            (300, 200, 20, 100),   # Vertical wall 1
-            (500, 320, 20, 180),   # Vertical wall 2
-        ]
-        
-        # Add a movable wall
-        movable_wall = pygame.Rect(400, 320, 20, 180)
-        self.movable_walls.append({
-            'rect': movable_wall,
-            'active': True,
-            'target_y': movable_wall.y,
-            'current_y': movable_wall.y,
-            'speed': 2
-        })
+            # Create radial gradient for glow
+            for i in range(glow_size, 0, -1):
+                alpha = int(100 * (i / glow_size))
+                pygame.draw.circle(glow_surface, (*GOAL_COLOR[:3], alpha), (glow_size, glow_size), i)
+                
+            if pygame.display.get_surface() is not None:
+                glow_surface = glow_surface.convert_alpha()
+            self.goal_glow_frames[glow_size] = glow_surface
+        self.goal_glow_key = (tuple(self.goal), GOAL_COLOR)
         
-        # Add a lever linked to the movable wall
-        self.levers.append(Lever(200, 350, linked_wall=0))  # 0 is the index of the movable wall
-        
-        # Add pressure plates
-        self.pressure_plates.append({
-            'rect': pygame.Rect(600, 400, 40, 40),
-            'activated': False,
-            'color': RED,
-            'active_color': GREEN,
-            'linked_wall': None,
-            'timer': 0,
-            'duration': 180  # 3 seconds at 60 FPS
-        })
+    def build_collision_index(self, data=None):
+        """(Re)build the spatial index from the current walls, levers, plates and
+        goal. data, when given, supplies the static walls' precompiled buckets."""
+        if data is not None:
+            self.collision_index = SpatialHash(data.cell_size)
+            self.wall_entries = self.collision_index.insert_bucketed(
+                self.walls, 'wall', self.walls, data.buckets.tolist(), data.bucket_refs[:, 0].tolist())
+        else:
+            self.collision_index = SpatialHash()
+            self.wall_entries = [self.collision_index.insert(wall, 'wall', wall) for wall in self.walls]
+        self.wall_order = {id(entry): i for i, entry in enumerate(self.wall_entries)}
+        self.movable_wall_entries = [self.collision_index.insert(wall.rect, 'movable_wall', wall)
+                                     for wall in self.movable_walls]
         
-    def update(self):
-        # Update movable walls
+    def build_triggers(self):
+        """Register the trigger volumes of the levers, plates and goal"""
+        self.lever_triggers = [self.triggers.add_volume(lever.rect, 'lever', lever)
+                               for lever in self.levers]
+        self.plate_triggers = [self.triggers.add_volume(plate.rect, 'plate', plate)
+                               for plate in self.pressure_plates]
+        self.goal_rect = pygame.Rect(self.goal)
+        self.goal_trigger = self.triggers.add_volume(self.goal_rect, 'goal', self.goal)
+        
+    def build_drawables(self):
+        """Index the goal, movable walls, levers and plates by the area they
+        draw over, so drawing only visits the ones in view"""
+        self.chunk_index = SpatialHash(CHUNK_SIZE)
+        self.drawables = {}
+        self.drawable_order = {}
+        self.drawables_added = 0
+        self.add_drawable('goal', self.goal_rect, self.goal_bounds())
         for wall in self.movable_walls:
-            if wall['active']:
-                wall['target_y'] = wall['rect'].y
-            else:
-                wall['target_y'] = SCREEN_HEIGHT + 50  # Move below screen
-                
-            # Smooth movement
-            if wall['current_y'] < wall['target_y']:
-                wall['current_y'] = min(wall['current_y'] + wall['speed'], wall['target_y'])
-            elif wall['current_y'] > wall['target_y']:
-                wall['current_y'] = max(wall['current_y'] - wall['speed'], wall['target_y'])
-                
-            wall['rect'].y = wall['current_y']
-            
-        # Update levers
+            self.add_drawable('movable_wall', wall, self.movable_wall_bounds(wall))
         for lever in self.levers:
-            lever.update()
-            
-        # Update pressure plates
+            self.add_drawable('lever', lever, lever.bounds())
         for plate in self.pressure_plates:
-            if plate['activated']:
-                plate['timer'] -= 1
-                if plate['timer'] <= 0:
-                    plate['activated'] = False
-                    
-                # Add particles
-                if random.random() < 0.1:
-                    self.particles.append(
-                        Particle(
-                            random.uniform(plate['rect'].left, plate['rect'].right),
-                            random.uniform(plate['rect'].top, plate['rect'].bottom),
-                            plate['active_color'],
-                            size=random.uniform(1, 3),
-                            lifetime=random.randint(10, 20)
-                        )
-                    )
-                    
-        # Update particles
-        for particle in self.particles[:]:
-            particle.update()
-            if particle.lifetime <= 0:
-                self.particles.remove(particle)
-        
-    def draw(self, screen):
-        # Draw particles
-        for particle in self.particles:
-            particle.draw(screen)
+            self.add_drawable('plate', plate, self.plate_bounds(plate))
             
-        # Draw goal with glow effect
-        goal_rect = pygame.Rect(self.goal)
-        pulse = math.sin(pygame.time.get_ticks() * 0.005) * 0.2 + 0.8
-        glow_size = int(max(goal_rect.width, goal_rect.height) * 1.2 * pulse)
-        glow_surface = pygame.Surface((glow_size*2, glow_size*2), pygame.SRCALPHA)
+    def add_drawable(self, kind, entity, bounds):
+        entry = self.chunk_index.insert(bounds, kind, entity)
+        # Drawn over everything of its kind already there
+        self.drawable_order[id(entry)] = self.drawables_added
+        self.drawables_added += 1
+        self.drawables[id(entity)] = entry
         
-        # Create radial gradient for glow
-        for i in range(glow_size, 0, -1):
-            alpha = int(100 * (i / glow_size))
-            pygame.draw.circle(glow_surface, (*GOAL_COLOR[:3], alpha), (glow_size, glow_size), i)
-            
-        screen.blit(glow_surface, 
-                   (goal_rect.centerx - glow_size, goal_rect.centery - glow_size))
+    def remove_drawable(self, entity):
+        entry = self.drawables.pop(id(entity))
+        self.chunk_index.remove(entry)
+        del self.drawable_order[id(entry)]
         
-        # Draw goal
-        pygame.draw.rect(screen, GOAL_COLOR, goal_rect, border_radius=10)
-        pygame.draw.rect(screen, (255, 255, 255), goal_rect, width=2, border_radius=10)
+    def set_walls(self, walls):
+        """Replace the static walls, refreshing the collision index and static layer"""
+        self.walls = list(walls)
+        self.world.update(self.measure_world())  # In place, the player keeps a reference
+        self.wall_reach = None
+        self.static_layer_key = None
+        self.build_collision_index()
+        self.invalidate_static_layer()
+        # Walls out of play slide on to below the new world
+        walls = self.movable_walls
+        if not walls.active[:len(walls)].all():
+            self.scheduler.tween(walls, self.slide_walls)
         
-        # Draw walls with shadow effect
-        for wall in self.walls:
-            wall_rect = pygame.Rect(wall)
-            # Shadow
-            shadow_rect = pygame.Rect(wall_rect.x + 3, wall_rect.y + 3, wall_rect.width, wall_rect.height)
-            pygame.draw.rect(screen, (30, 30, 30), shadow_rect, border_radius=3)
-            # Wall
-            pygame.draw.rect(screen, WALL_COLOR, wall_rect, border_radius=3)
-            # Highlight
-            pygame.draw.rect(screen, (80, 80, 80), wall_rect, width=2, border_radius=3)
-            
-        # Draw movable walls
-        for wall in self.movable_walls:
-            # Shadow
-            shadow_rect = pygame.Rect(wall['rect'].x + 3, wall['rect'].y + 3, 
-                                     wall['rect'].width, wall['rect'].height)
-            pygame.draw.rect(screen, (30, 30, 30, 150), shadow_rect, border_radius=3)
-            
-            # Wall with slight transparency
-            wall_surface = pygame.Surface((wall['rect'].width, wall['rect'].height), pygame.SRCALPHA)
-            wall_color = (100, 100, 200, 200) if wall['active'] else (200, 100, 100, 200)
-            pygame.draw.rect(wall_surface, wall_color, 
-                            (0, 0, wall['rect'].width, wall['rect'].height), border_radius=3)
-            screen.blit(wall_surface, (wall['rect'].x, wall['rect'].y))
-            
-            # Highlight
-            pygame.draw.rect(screen, (150, 150, 255) if wall['active'] else (255, 150, 150), 
-                            wall['rect'], width=2, border_radius=3)
-            
-        # Draw levers
-        for lever in self.levers:
-            lever.draw(screen)
-            
-        # Draw pressure plates
-        for plate in self.pressure_plates:
-            color = plate['active_color'] if plate['activated'] else plate['color']
-            pygame.draw.rect(screen, color, plate['rect'], border_radius=5)
-            pygame.draw.rect(screen, (255, 255, 255), plate['rect'], width=2, border_radius=5)
-            
-            # Draw activation indicator
-            if plate['activated']:
-                progress = plate['timer'] / plate['duration']
-                indicator_width = plate['rect'].width * progress
-                indicator_rect = pygame.Rect(plate['rect'].x, plate['rect'].y - 5, 
-                                           indicator_width, 3)
-                pygame.draw.rect(screen, plate['active_color'], indicator_rect)
+    # Editing - each edit touches only the spatial-hash cells and trigger
+    # volumes of what changed and re-bakes only the damaged part of the static
+    # layer. Movers should report their position again afterwards.
+    def add_wall(self, rect):
+        wall = tuple(pygame.Rect(rect))
+        entry = self.collision_index.insert(wall, 'wall', wall)
+        if self.wall_reach is not None:
+            self.wall_reach = max(self.wall_reach, self.wall_overshoot(wall))
+        # Drawn over every wall already there
+        self.wall_order[id(entry)] = self.wall_order[id(self.wall_entries[-1])] + 1 if self.wall_entries else 0
+        self.walls.append(wall)
+        self.wall_entries.append(entry)
+        self.repair_static_layer(self.wall_bounds(wall))
         
-    def check_collision(self, player):
-        player_rect = pygame.Rect(player.x, player.y, player.size, player.size)
+    def remove_wall(self, index):
+        wall = self.walls.pop(index)
+        entry = self.wall_entries.pop(index)
+        self.collision_index.remove(entry)
+        del self.wall_order[id(entry)]
+        self.repair_static_layer(self.wall_bounds(wall))
         
-        # Check wall collisions
-        for wall in self.walls:
-            if player_rect.colliderect(pygame.Rect(wall)):
-                return True
-                
-        # Check movable wall collisions
-        for wall in self.movable_walls:
-            if wall['active'] and player_rect.colliderect(wall['rect']):
-                return True
-                
-        return False
+    def add_lever(self, x, y, linked_wall=None):
+        lever = self.levers.add(x=x, y=y, linked_wall=-1 if linked_wall is None else linked_wall)
+        self.lever_triggers.append(self.triggers.add_volume(lever.rect, 'lever', lever))
+        self.add_drawable('lever', lever, lever.bounds())
         
-    def check_goal(self, player):
-        player_rect = pygame.Rect(player.x, player.y, player.size, player.size)
-        goal_rect = pygame.Rect(self.goal)
+    def remove_lever(self, index):
+        self.remove_drawable(self.levers.pop(index))
+        self.triggers.remove_volume(self.lever_triggers.pop(index))
         
-        return player_rect.colliderect(goal_rect)
+    def add_plate(self, rect, duration=180):
+        x, y, width, height = pygame.Rect(rect)
+        plate = self.pressure_plates.add(x=x, y=y, width=width, height=height, duration=duration)
+        self.plate_triggers.append(self.triggers.add_volume(plate.rect, 'plate', plate))
+        self.add_drawable('plate', plate, self.plate_bounds(plate))
         
-    def check_lever_interactions(self, player):
-        player_rect = pygame.Rect(player.x, player.y, player.size, player.size)
+    def remove_plate(self, index):
+        plate = self.pressure_plates.pop(index)
+        self.scheduler.cancel(plate)
+        self.down_plates.discard(plate)
+        self.remove_drawable(plate)
+        self.triggers.remove_volume(self.plate_triggers.pop(index))
         
-        for i, lever in enumerate(self.levers):
-            if lever.check_collision(player):
-                if lever.activate():
-                    # Toggle linked wall if exists
-                    if lever.linked_wall is not None and lever.linked_wall < len(self.movable_walls):
-                        self.movable_walls[lever.linked_wall]['active'] = not self.movable_walls[lever.linked_wall]['active']
-                    return True
-        return False
+    def move_goal(self, rect):
+        self.goal = tuple(pygame.Rect(rect))
+        self.goal_rect.update(self.goal)
+        self.triggers.move_volume(self.goal_trigger, self.goal_rect)
+        self.chunk_index.move(self.drawables[id(self.goal_rect)], self.goal_bounds())
+        self.player_at_goal = False
+        
+    def element_at(self, point):
+        """The topmost editable element under point as (kind, index), or None"""
+        for kind, rects in (('lever', [lever.rect for lever in self.levers]),
+                            ('plate', [plate.rect for plate in self.pressure_plates])):
+            for index in range(len(rects) - 1, -1, -1):
+                if rects[index].collidepoint(point):
+                    return kind, index
+        entries = self.collision_index.query(pygame.Rect(point, (1, 1)), ('wall',))
+        if entries:
+            top = max(entries, key=lambda entry: self.wall_order[id(entry)])
+            return 'wall', self.wall_entries.index(top)
+        return None
         
-    def check_pressure_plate_interactions(self, player, ghosts):
+    def to_json(self):
+        """The level in the JSON source format (see levels/main.json)"""
+        return {
+            'name': self.name,
+            'start': list(self.start_pos),
+            'goal': list(self.goal),
+            'walls': [list(wall) for wall in self.walls],
+            'movable_walls': [{'rect': [wall.x, wall.home_y, wall.width, wall.height], 'speed': wall.speed}
+                              for wall in self.movable_walls],
+            'levers': [{'pos': [lever.x, lever.y], 'wall': lever.linked_wall} for lever in self.levers],
+            'plates': [{'rect': list(plate.rect), 'duration': plate.duration} for plate in self.pressure_plates],
+        }
+        
+    def check_collision(self, player):
+        """Return the wall (static tuple or MovableWall) the player overlaps, or None"""
         player_rect = pygame.Rect(player.x, player.y, player.size, player.size)
+        entry = self.collision_index.first(
+            player_rect, ('wall', 'movable_wall'),
+            lambda entry: entry.kind == 'wall' or entry.entity.active)
+        return entry.entity if entry else None
         
-        for plate in self.pressure_plates:
-            # Check player collision
-            if player_rect.colliderect(plate['rect']):
-                plate['activated'] = True
-                plate['timer'] = plate['duration']
-                return True
-                
-            # Check ghost collisions
-            for ghost in ghosts:
-                if ghost.actions and ghost.current_action < len(ghost.actions):
-                    x, y = ghost.actions[ghost.current_action]
-                    ghost_rect = pygame.Rect(x, y, ghost.size, ghost.size)
-                    if ghost_rect.colliderect(plate['rect']):
-                        plate['activated'] = True
-                        plate['timer'] = plate['duration']
-                        return True
-                        
-        return False
+    def move_player(self, player, dx, dy):
+        """Move the player one step, undoing it if that runs into a wall.
+        Returns True when the player ended up somewhere new; levers, plates
+        and the goal then react through trigger events."""
+        prev_x, prev_y = player.x, player.y
+        player.move(dx, dy)
+        
+        # Check for collisions with walls
+        if self.check_collision(player):
+            # Move back (simple collision resolution)
+            player.move(-dx, -dy)
+            return False
+        if prev_x == player.x and prev_y == player.y:
+            return False
+        self.triggers.move('player', player.rect())
+        return True
+        
+    def on_lever_enter(self, lever, mover):
+        # Only the player can pull levers
+        if mover != 'player' or not lever.activate(self.particles):
+            return
+        # Toggle linked wall if exists; active walls are left alone by the slide
+        walls, index = self.movable_walls, self.levers.linked_wall.item(lever.index)
+        if 0 <= index < len(walls):
+            walls.active[index] = not walls.active.item(index)
+            if not walls.active.item(index):
+                self.scheduler.tween(walls, self.slide_walls)
+        self.triggers.emit('activate', 'lever', lever, mover)
+        
+    def on_plate_enter(self, plate, mover):
+        # The player and ghosts alike hold plates down
+        plates, i = self.pressure_plates, plate.index
+        plates.activated[i] = True
+        plates.timer[i] = self.scheduler.now + plates.duration.item(i)
+        self.down_plates.add(plate)
+        self.scheduler.tween(plate, self.hold_plate)
+        
+    def on_goal_enter(self, goal, mover):
+        if mover == 'player':
+            self.player_at_goal = True
+            
+    def on_goal_exit(self, goal, mover):
+        if mover == 'player':
+            self.player_at_goal = False
 
 # HUD class
 class HUD:
     def __init__(self):
-        self.font = pygame.font.SysFont(None, 24)
+        self.loop_label = TextLabel(24, (50, 50, 50))
+        self.ghost_label = TextLabel(24, (50, 50, 50))
         self.buttons = []
         self.setup_buttons()
         
@@ -544,7 +2557,8 @@ class HUD:
             'rect': pygame.Rect(SCREEN_WIDTH - 100, 10, 80, 30),
             'text': 'Restart',
             'action': 'restart',
-            'hover': False
+            'hover': False,
+            'label': TextLabel(24, (255, 255, 255))
         })
         
     def update(self, mouse_pos):
@@ -559,105 +2573,1022 @@ class HUD:
         return None
         
     def draw(self, screen, loop_count, ghost_count, max_ghosts):
+        self.draw_counters(screen, loop_count, ghost_count, max_ghosts)
+        
+        # Draw buttons
+        for button in self.buttons:
+            self.draw_button(screen, button)
+            
+    def draw_counters(self, screen, loop_count, ghost_count, max_ghosts):
         # Draw loop counter
-        loop_text = self.font.render(f"Loop: {loop_count}", True, (50, 50, 50))
-        screen.blit(loop_text, (10, 10))
+        self.loop_label.draw(screen, f"Loop: {loop_count}", (10, 10))
         
         # Draw ghost counter
-        ghost_text = self.font.render(f"Ghosts: {ghost_count}/{max_ghosts}", True, (50, 50, 50))
-        screen.blit(ghost_text, (10, 40))
+        self.ghost_label.draw(screen, f"Ghosts: {ghost_count}/{max_ghosts}", (10, 40))
         
-        # Draw buttons
-        for button in self.buttons:
-            color = BUTTON_HOVER_COLOR if button['hover'] else BUTTON_COLOR
-            pygame.draw.rect(screen, color, button['rect'], border_radius=5)
-            pygame.draw.rect(screen, (255, 255, 255), button['rect'], width=2, border_radius=5)
+    def draw_button(self, screen, button):
+        color = BUTTON_HOVER_COLOR if button['hover'] else BUTTON_COLOR
+        pygame.draw.rect(screen, color, button['rect'], border_radius=5)
+        pygame.draw.rect(screen, (255, 255, 255), button['rect'], width=2, border_radius=5)
+        
+        button['label'].draw(screen, button['text'], center=button['rect'].center)
+        
+    def dirty_layers(self, loop_count, ghost_count, max_ghosts):
+        """HUD widgets as (key, state, rect, draw) for the Renderer"""
+        counters = (loop_count, ghost_count, max_ghosts)
+        layers = [('hud_counters', counters, pygame.Rect(10, 10, 200, 50),
+                   lambda screen: self.draw_counters(screen, *counters))]
+        for i, button in enumerate(self.buttons):
+            layers.append((('hud_button', i), (button['text'], button['hover']), button['rect'],
+                           lambda screen, button=button: self.draw_button(screen, button)))
+        return layers
+
+# Level editor - press E to edit the level being played, without pausing it.
+# 1-4 pick a tool (wall, lever, plate, goal): drag with the left button to draw
+# a wall or plate, click to place a lever or move the goal. Right click deletes
+# the lever, plate or wall under the cursor and Ctrl+S writes the level back
+# to its JSON source. Edits go through Level's incremental methods, so even
+# on levels with thousands of walls an edit costs about as much as a frame.
+class LevelEditor:
+    TOOLS = ('wall', 'lever', 'plate', 'goal')
+    
+    def __init__(self, game):
+        self.game = game
+        self.active = False
+        self.tool = 'wall'
+        self.snap = 10  # Grid everything is placed on
+        self.drag_start = None  # World position, snapped
+        self.cursor = (0, 0)  # Screen position
+        self.unsaved = False
+        self.message = ""
+        
+    def toggle(self):
+        # Edits are not part of replays, so a recorded or replayed session stays as it is
+        if self.game.recorder or self.game.replay:
+            print("Warning: the level editor is not available while recording or replaying")
+            return
+        self.active = not self.active
+        self.drag_start = None
+        
+    def snapped(self, pos):
+        """World position under a point on the screen, snapped to the grid"""
+        x, y = self.game.camera.to_world(pos)
+        return (x // self.snap * self.snap, y // self.snap * self.snap)
+        
+    def drag_rect(self):
+        """The rect being dragged out, from the drag start to the cursor"""
+        (x1, y1), (x2, y2) = self.drag_start, self.snapped(self.cursor)
+        return pygame.Rect(min(x1, x2), min(y1, y2), abs(x2 - x1) + self.snap, abs(y2 - y1) + self.snap)
+        
+    def handle_event(self, event):
+        """Handle an input event; returns True if the editor used it"""
+        if event.type == pygame.KEYDOWN and event.key == pygame.K_e:
+            self.toggle()
+            return True
+        if not self.active:
+            return False
+        if event.type == pygame.KEYDOWN:
+            if pygame.K_1 <= event.key < pygame.K_1 + len(self.TOOLS):
+                self.tool = self.TOOLS[event.key - pygame.K_1]
+                return True
+            if event.key == pygame.K_s and event.mod & pygame.KMOD_CTRL:
+                self.save()
+                return True
+            return False
+        if event.type == pygame.MOUSEMOTION:
+            self.cursor = event.pos
+            return False
+        if event.type == pygame.MOUSEBUTTONDOWN:
+            # Leave clicks on HUD buttons to the HUD
+            if any(button['rect'].collidepoint(event.pos) for button in self.game.hud.buttons):
+                return False
+            self.cursor = event.pos
+            if event.button == 1:
+                self.drag_start = self.snapped(event.pos)
+            elif event.button == 3:
+                self.delete_at(self.game.camera.to_world(event.pos))
+            return True
+        if event.type == pygame.MOUSEBUTTONUP and event.button == 1 and self.drag_start:
+            self.cursor = event.pos
+            self.place(self.drag_rect())
+            self.drag_start = None
+            return True
+        return False
+        
+    def place(self, rect):
+        level = self.game.level
+        if self.tool == 'wall':
+            # Never wall in the player where they stand or respawn
+            start = pygame.Rect(level.start_pos, (self.game.player.size, self.game.player.size))
+            if rect.colliderect(self.game.player.rect()) or rect.colliderect(start):
+                return
+            level.add_wall(rect)
+        elif self.tool == 'lever':
+            level.add_lever(rect.x, rect.y, self.nearest_movable_wall(rect))
+        elif self.tool == 'plate':
+            level.add_plate(rect if rect.width > self.snap or rect.height > self.snap
+                            else pygame.Rect(rect.topleft, (40, 40)))
+        else:
+            level.move_goal(pygame.Rect(rect.topleft, pygame.Rect(level.goal).size))
+        self.edited()
+        
+    def nearest_movable_wall(self, rect):
+        """Index of the movable wall a new lever should toggle, or None"""
+        walls = self.game.level.movable_walls
+        if not walls:
+            return None
+        center = pygame.math.Vector2(rect.center)
+        return min(range(len(walls)), key=lambda i: center.distance_to(walls[i].rect.center))
+        
+    def delete_at(self, pos):
+        level = self.game.level
+        found = level.element_at(pos)
+        if found is None:
+            return
+        kind, index = found
+        {'lever': level.remove_lever, 'plate': level.remove_plate, 'wall': level.remove_wall}[kind](index)
+        self.edited()
+        
+    def edited(self):
+        self.unsaved = True
+        self.message = ""
+        self.game.retest_movers()
+        
+    def save(self):
+        source = self.game.level_source
+        if not source.endswith('.json'):
+            self.message = "Can only save to a .json level source"
+            return
+        save_level_source(source, self.game.level.to_json())
+        self.game.level_pack = open_level_pack(source)
+        self.unsaved = False
+        self.message = f"Saved to {os.path.basename(source)}"
+        
+    def status(self):
+        text = f"Editing: {self.tool}  (1-4 tools, right click deletes, Ctrl+S saves, E exits)"
+        if self.message:
+            return f"{text}  {self.message}"
+        return text + ("  *" if self.unsaved else "")
+        
+    def dirty_layers(self):
+        """The drag preview and status line as (key, state, rect, draw) layers"""
+        if not self.active:
+            return []
+        status = self.status()
+        text = text_cache.render(status, 18, (50, 50, 50))
+        status_rect = text.get_rect(bottomright=(SCREEN_WIDTH - 10, SCREEN_HEIGHT - 6))
+        layers = [('editor_status', status, status_rect, lambda screen: screen.blit(text, status_rect))]
+        if self.drag_start is not None:
+            view = self.game.camera.shown
+            preview = self.drag_rect().move(-view.x, -view.y)
+            layers.append(('editor_preview', (self.tool, tuple(preview)), preview,
+                           lambda screen: pygame.draw.rect(screen, BUTTON_COLOR, preview, width=2)))
+        return layers
+
+# Renderer - presents a frame as a cached static layer plus dynamic layers.
+# Each dynamic layer is (key, state, rect, draw); only layers whose state or
+# rect changed since the last frame mark the screen dirty, and only the dirty
+# regions are restored from the static layer, redrawn and sent to the display.
+class Renderer:
+    def __init__(self, screen, present=True, profiler=None):
+        self.screen = screen
+        self.present_to_display = present  # False when rendering offscreen
+        self.profiler = profiler or FrameProfiler()
+        self.blits = 0  # Static-layer restores and layer draws, for profiling
+        self.screen_rect = screen.get_rect()
+        self.previous = {}  # key -> (state, rect) from the last frame
+        self.static_layer = None
+        self.needs_full_redraw = True
+        self.full_redraw_area = 0.5  # Fraction of the screen that triggers a full flip
+        self.damaged = []  # Areas of the static layer changed in place
+        
+    def invalidate(self):
+        self.needs_full_redraw = True
+        
+    def damage(self, rect):
+        """Redraw rect next frame because the static layer changed there"""
+        self.damaged.append(pygame.Rect(rect))
+        
+    def present(self, static_layer, layers, overlay=None):
+        """Draw and present one frame.
+        
+        overlay, when given, is drawn over everything and forces a full-frame
+        redraw (used for fades and full-screen messages).
+        """
+        current = {}
+        dirty, self.damaged = self.damaged, []
+        for key, state, rect, draw in layers:
+            current[key] = (state, rect)
+            old = self.previous.get(key)
+            if old is None or old[0] != state or old[1] != rect:
+                if old is not None and old[1] is not None:
+                    dirty.append(old[1])
+                if rect is not None:
+                    dirty.append(rect)
+        for key, (state, rect) in self.previous.items():
+            if key not in current and rect is not None:
+                dirty.append(rect)
+        self.previous = current
+        
+        full = overlay is not None or self.needs_full_redraw or static_layer is not self.static_layer
+        if not full:
+            dirty = self.merge_rects(dirty, [rect for key, state, rect, draw in layers if rect is not None])
+            dirty_area = sum(rect.width * rect.height for rect in dirty)
+            full = dirty_area > self.screen_rect.width * self.screen_rect.height * self.full_redraw_area
+            
+        if full:
+            self.blit_static(static_layer, None)
+            for key, state, rect, draw in layers:
+                if rect is not None:
+                    self.draw_layer(key, draw)
+            if overlay is not None:
+                overlay(self.screen)
+            if self.present_to_display:
+                with self.profiler.scope('flip'):
+                    pygame.display.flip()
+            # The overlay has to be wiped by another full redraw once it is gone
+            self.needs_full_redraw = overlay is not None
+            self.static_layer = static_layer
+            return
+            
+        for dirty_rect in dirty:
+            self.screen.set_clip(dirty_rect)
+            self.blit_static(static_layer, dirty_rect)
+            for key, state, rect, draw in layers:
+                if rect is not None and rect.colliderect(dirty_rect):
+                    self.draw_layer(key, draw)
+        self.screen.set_clip(None)
+        if dirty and self.present_to_display:
+            with self.profiler.scope('flip'):
+                pygame.display.update(dirty)
+                
+    def blit_static(self, static_layer, area):
+        """Restore area (None for everything) from the static layer"""
+        self.blits += 1
+        with self.profiler.scope('draw_level'):
+            if area is None:
+                self.screen.blit(static_layer, (0, 0))
+            else:
+                self.screen.blit(static_layer, area, area)
+                
+    def draw_layer(self, key, draw):
+        self.blits += 1
+        if self.profiler.frame is None:
+            draw(self.screen)
+            return
+        with self.profiler.scope(self.layer_phase(key)):
+            draw(self.screen)
+            
+    def layer_phase(self, key):
+        """Profiler phase a layer's drawing is charged to"""
+        kind = key[0] if isinstance(key, tuple) else key
+        if kind == 'ghost':
+            return 'draw_ghosts'
+        if kind in ('player', 'particles'):
+            return 'draw_' + kind
+        if kind.startswith(('hud', 'editor')) or kind == 'profiler':
+            return 'draw_hud'
+        return 'draw_level'
             
-            text = self.font.render(button['text'], True, (255, 255, 255))
-            text_rect = text.get_rect(center=button['rect'].center)
-            screen.blit(text, text_rect)
+    def merge_rects(self, rects, bounds=()):
+        """Clip rects to the screen and merge overlapping ones.
+        
+        Each rect is also grown to fully cover any of bounds it touches, so a
+        layer is never redrawn partially (clipped rounded-rect outlines do not
+        match unclipped ones pixel for pixel).
+        """
+        bounds = [rect.clip(self.screen_rect) for rect in bounds]
+        merged = self.union_overlapping(rects)
+        while True:
+            grown = []
+            for rect in merged:
+                for bound in bounds:
+                    if bound.colliderect(rect) and not rect.contains(bound):
+                        rect = rect.union(bound)
+                grown.append(rect)
+            grown = self.union_overlapping(grown)
+            if grown == merged:
+                return merged
+            merged = grown
+            
+    def union_overlapping(self, rects):
+        merged = []
+        for rect in rects:
+            rect = rect.clip(self.screen_rect)
+            if rect.width <= 0 or rect.height <= 0:
+                continue
+            # Keep absorbing overlapping rects until the new one is disjoint
+            i = 0
+            while i < len(merged):
+                if merged[i].colliderect(rect):
+                    rect = rect.union(merged.pop(i))
+                    i = 0
+                else:
+                    i += 1
+            merged.append(rect)
+        return merged
+
+# Input sources - TimeLoopGame reads events and held keys through one of these
+class KeyboardInput:
+    """The live keyboard and mouse"""
+    def get_events(self):
+        return pygame.event.get()
+        
+    def get_pressed(self):
+        return pygame.key.get_pressed()
+        
+    def get_mouse_pos(self):
+        return pygame.mouse.get_pos()
+        
+class HeldKeys(frozenset):
+    """A set of held keys that can be indexed like pygame.key.get_pressed()"""
+    def __getitem__(self, key):
+        return key in self
+        
+class ScriptedInput:
+    """Plays back a fixed sequence of held keys, one entry per tick.
+    
+    script is a sequence of key collections, e.g. [(pygame.K_RIGHT,), (), ...].
+    events optionally maps a tick number to a list of pygame events to deliver.
+    """
+    def __init__(self, script, events=None, repeat=True):
+        self.script = [HeldKeys(keys) for keys in script] or [HeldKeys()]
+        self.events = events or {}
+        self.repeat = repeat
+        self.tick = 0
+        self.held = HeldKeys()
+        
+    def get_events(self):
+        # Called once per tick by handle_events, so this is where the script advances
+        if self.tick < len(self.script) or self.repeat:
+            self.held = self.script[self.tick % len(self.script)]
+        else:
+            self.held = HeldKeys()
+        events = self.events.get(self.tick, [])
+        self.tick += 1
+        return events
+        
+    def get_pressed(self):
+        return self.held
+        
+    def get_mouse_pos(self):
+        return (-1, -1)
+
+# Replay files - an append-only stream of framed records after a magic/version
+# prefix. Each record is a 1-byte type, a u32 payload length, the payload and a
+# CRC32, so a file cut short by a crash still reads cleanly up to the last
+# complete record. Records:
+#   H  JSON header (seed, level, tick rate, max loops)
+#   L  u32 tick, u32 loop number - a new loop started at this tick
+#   T  u32 first tick, u32 state digest after the last tick, one input byte per tick
+#   Z  clean end of recording
+class ReplayWriter:
+    def __init__(self, path, header, chunk_ticks=REPLAY_CHUNK_TICKS):
+        self.file = open(path, 'wb')
+        self.chunk_ticks = chunk_ticks
+        self.pending = bytearray()
+        self.first_tick = 0
+        self.digest = 0
+        self.file.write(REPLAY_MAGIC + struct.pack('<H', REPLAY_VERSION))
+        self.write_record(b'H', json.dumps(header).encode('utf-8'))
+        
+    def write_record(self, kind, payload):
+        self.file.write(kind + struct.pack('<I', len(payload)) + payload +
+                        struct.pack('<I', zlib.crc32(kind + payload)))
+        
+    def write_tick(self, tick, input_mask, digest):
+        if not self.pending:
+            self.first_tick = tick
+        self.pending.append(input_mask)
+        self.digest = digest
+        if len(self.pending) >= self.chunk_ticks:
+            self.flush()
+            
+    def mark_loop(self, tick, loop_number):
+        self.flush()
+        self.write_record(b'L', struct.pack('<II', tick, loop_number))
+        
+    def flush(self):
+        if self.pending:
+            self.write_record(b'T', struct.pack('<II', self.first_tick, self.digest) + bytes(self.pending))
+            self.pending = bytearray()
+        self.file.flush()
+        
+    def close(self):
+        if self.file.closed:
+            return
+        self.flush()
+        self.write_record(b'Z', b'')
+        self.file.close()
+        
+def read_replay(path):
+    """Stream (kind, payload) records from a replay file, stopping quietly at a
+    truncated or corrupt tail"""
+    with open(path, 'rb') as f:
+        prefix = f.read(len(REPLAY_MAGIC) + 2)
+        if prefix[:len(REPLAY_MAGIC)] != REPLAY_MAGIC:
+            raise ValueError(f"{path} is not a replay file")
+        version, = struct.unpack('<H', prefix[len(REPLAY_MAGIC):])
+        if version != REPLAY_VERSION:
+            raise ValueError(f"Unsupported replay version {version}")
+        while True:
+            head = f.read(5)
+            if len(head) < 5:
+                return
+            kind = head[:1]
+            length, = struct.unpack('<I', head[1:])
+            payload = f.read(length)
+            crc = f.read(4)
+            if len(payload) < length or len(crc) < 4 or struct.unpack('<I', crc)[0] != zlib.crc32(kind + payload):
+                return
+            yield kind, payload
+            
+class ReplayInput:
+    """Input source that plays a replay file back tick by tick, reading it
+    lazily so only the current chunk is ever in memory"""
+    def __init__(self, path):
+        self.records = read_replay(path)
+        kind, payload = next(self.records, (None, None))
+        if kind != b'H':
+            raise ValueError(f"{path} has no replay header")
+        self.header = json.loads(payload.decode('utf-8'))
+        self.ticks = self.iter_ticks()
+        self.held = HeldKeys()
+        self.digests = {}  # Last tick of each chunk read so far -> expected state digest
+        self.finished = False
+        
+    def iter_ticks(self):
+        for kind, payload in self.records:
+            if kind == b'T':
+                first_tick, digest = struct.unpack('<II', payload[:8])
+                inputs = payload[8:]
+                self.digests[first_tick + len(inputs) - 1] = digest
+                for mask in inputs:
+                    yield mask
+            elif kind == b'Z':
+                return
+                
+    def get_events(self):
+        mask = next(self.ticks, None)
+        if mask is None:
+            self.finished = True
+            self.held = HeldKeys()
+            return [pygame.event.Event(pygame.QUIT)]
+        keys = []
+        if mask & INPUT_LEFT:
+            keys.append(pygame.K_LEFT)
+        if mask & INPUT_RIGHT:
+            keys.append(pygame.K_RIGHT)
+        if mask & INPUT_UP:
+            keys.append(pygame.K_UP)
+        if mask & INPUT_DOWN:
+            keys.append(pygame.K_DOWN)
+        self.held = HeldKeys(keys)
+        if mask & INPUT_RESTART:
+            return [pygame.event.Event(pygame.KEYDOWN, key=pygame.K_r)]
+        return []
+        
+    def get_pressed(self):
+        return self.held
+        
+    def get_mouse_pos(self):
+        return (-1, -1)
+        
+    def expected_digest(self, tick):
+        return self.digests.pop(tick, None)
+
+# Spectator stream - live sessions are broadcast to TCP clients (a second
+# screen, a review tool) as one message per tick: a varint length, then a
+# 1-byte type and its payload:
+#   H  JSON header (level, tick rate and the state layout), before every keyframe
+#   K  keyframe: varint tick and value count, then every value and its velocity
+#   D  the next tick: (varint index gap, zigzag varint residual) per value that
+#      did not move on by its velocity since the last tick
+# The state is one vector of ints: player x and y and the loop count, then
+# cursor, x and y per ghost, activated and cooldown per lever, activated and
+# timer per plate, active and y per movable wall. Predicting every value from
+# its velocity means a ghost walking straight or a plate timer counting down
+# costs nothing, and an idle tick is two bytes.
+# The server runs its own asyncio loop on a thread. The game hands each tick
+# over without waiting, and a client whose send buffer backs up is skipped
+# until it drains and then resynced with a keyframe, so a slow spectator
+# never stalls the game loop.
+def write_varint(out, value):
+    while value > 0x7F:
+        out.append(value & 0x7F | 0x80)
+        value >>= 7
+    out.append(value)
+    
+def read_varint(data, pos):
+    """Decode the varint at data[pos]; returns (value, position after it)"""
+    value = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        value |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return value, pos
+        shift += 7
+        
+def zigzag(value):
+    return value << 1 if value >= 0 else (-value << 1) - 1
+    
+def unzigzag(value):
+    return value >> 1 if not value & 1 else -((value + 1) >> 1)
+    
+def frame_message(kind, payload=b''):
+    message = bytearray()
+    write_varint(message, len(payload) + 1)
+    return bytes(message) + kind + payload
+
+class SpectatorEncoder:
+    def __init__(self):
+        self.header = None
+        self.tick = 0
+        self.state = np.zeros(0, dtype=np.int64)
+        self.velocity = np.zeros(0, dtype=np.int64)
+        self.cached_keyframe = None
+        
+    def update(self, tick, header, state):
+        """Take one tick's state; returns its D message, or None when the
+        layout changed and only a keyframe can describe it"""
+        state = np.asarray(state, dtype=np.int64)
+        self.cached_keyframe = None
+        self.tick = tick
+        if header != self.header or len(state) != len(self.state):
+            self.header = header
+            self.state = state
+            self.velocity = np.zeros_like(state)
+            return None
+        residual = state - (self.state + self.velocity)
+        self.velocity = state - self.state
+        self.state = state
+        payload = bytearray()
+        last = -1
+        for index in np.flatnonzero(residual).tolist():
+            write_varint(payload, index - last - 1)
+            write_varint(payload, zigzag(int(residual[index])))
+            last = index
+        return frame_message(b'D', bytes(payload))
+        
+    def keyframe(self):
+        """H and K messages that bring a client up to the current tick"""
+        if self.cached_keyframe is None:
+            payload = bytearray()
+            write_varint(payload, self.tick)
+            write_varint(payload, len(self.state))
+            for value in self.state.tolist() + self.velocity.tolist():
+                write_varint(payload, zigzag(value))
+            self.cached_keyframe = (frame_message(b'H', json.dumps(self.header).encode('utf-8')) +
+                                    frame_message(b'K', bytes(payload)))
+        return self.cached_keyframe
+
+class SpectatorDecoder:
+    """Rebuilds the game state from a spectator stream, fed in whatever
+    pieces the socket hands over"""
+    def __init__(self):
+        self.buffer = bytearray()
+        self.header = None
+        self.tick = None  # None until the first keyframe
+        self.state = []
+        self.velocity = []
+        
+    def feed(self, data, on_tick=None):
+        """Consume bytes; returns how many ticks they completed. on_tick is
+        called after each of them, while the decoder holds its state."""
+        self.buffer += data
+        ticks = 0
+        pos = 0
+        while pos < len(self.buffer):
+            try:
+                length, start = read_varint(self.buffer, pos)
+            except IndexError:
+                break
+            if start + length > len(self.buffer):
+                break
+            pos = start + length
+            if self.apply(self.buffer[start:start + 1], bytes(self.buffer[start + 1:pos])):
+                ticks += 1
+                if on_tick:
+                    on_tick()
+        del self.buffer[:pos]
+        return ticks
+        
+    def apply(self, kind, payload):
+        if kind == b'H':
+            self.header = json.loads(payload.decode('utf-8'))
+            return 0
+        if kind == b'K':
+            self.tick, pos = read_varint(payload, 0)
+            count, pos = read_varint(payload, pos)
+            values = []
+            while pos < len(payload):
+                value, pos = read_varint(payload, pos)
+                values.append(unzigzag(value))
+            self.state, self.velocity = values[:count], values[count:]
+            return 1
+        if kind == b'D' and self.tick is not None:
+            predicted = [value + velocity for value, velocity in zip(self.state, self.velocity)]
+            index, pos = -1, 0
+            while pos < len(payload):
+                gap, pos = read_varint(payload, pos)
+                residual, pos = read_varint(payload, pos)
+                index += gap + 1
+                predicted[index] += unzigzag(residual)
+            self.velocity = [new - old for new, old in zip(predicted, self.state)]
+            self.state = predicted
+            self.tick += 1
+            return 1
+        return 0
+        
+    def snapshot(self):
+        """The current state as a dict, or None before the first keyframe"""
+        if self.tick is None:
+            return None
+        values = self.state
+        counts = self.header['layout']
+        snapshot = {'tick': self.tick, 'level': self.header['level'], 'player': values[0:2],
+                    'loop': values[2]}
+        pos = 3
+        for name, width in (('ghosts', 3), ('levers', 2), ('plates', 2), ('movable_walls', 2)):
+            end = pos + counts[name] * width
+            snapshot[name] = [values[i:i + width] for i in range(pos, end, width)]
+            pos = end
+        return snapshot
+
+class SpectatorServer:
+    def __init__(self, host=SPECTATOR_HOST, port=SPECTATOR_PORT, buffer_limit=SPECTATOR_BUFFER_LIMIT):
+        """Start serving on a background thread; port 0 picks a free port"""
+        self.encoder = SpectatorEncoder()
+        self.buffer_limit = buffer_limit
+        self.clients = {}  # StreamWriter -> whether it is in sync; only touched on the server loop
+        self.need_keyframe = False  # Set by the server loop when a client is waiting to sync
+        self.sent = 0  # Bytes handed to clients
+        self.lagged = 0  # Times a client fell too far behind and was resynced
+        self.loop = asyncio.new_event_loop()
+        self.server = None
+        self.error = None  # Why the server could not start, e.g. the port is taken
+        self.ready = threading.Event()
+        self.thread = threading.Thread(target=self.serve, args=(host, port), name='spectator', daemon=True)
+        self.thread.start()
+        self.ready.wait()
+        if self.error is not None:
+            self.thread.join()
+            raise self.error
+        self.port = self.server.sockets[0].getsockname()[1]
+        
+    def serve(self, host, port):
+        asyncio.set_event_loop(self.loop)
+        try:
+            self.server = self.loop.run_until_complete(asyncio.start_server(self.connected, host, port))
+        except Exception as e:
+            self.error = e
+            self.loop.close()
+            return
+        finally:
+            self.ready.set()
+        try:
+            self.loop.run_forever()
+        finally:
+            self.server.close()
+            for writer in list(self.clients):
+                writer.close()
+            self.loop.run_until_complete(self.server.wait_closed())
+            self.loop.close()
+            
+    async def connected(self, reader, writer):
+        self.clients[writer] = False
+        self.need_keyframe = True
+        try:
+            # Spectators only listen; reading just notices when they hang up
+            while await reader.read(1024):
+                pass
+        except ConnectionError:
+            pass
+        finally:
+            self.clients.pop(writer, None)
+            writer.close()
+            
+    def publish(self, tick, header, state):
+        """Broadcast one tick (called from the game loop, never blocks)"""
+        if not self.clients:
+            return
+        delta = self.encoder.update(tick, header, state)
+        keyframe = None
+        if delta is None or self.need_keyframe:
+            self.need_keyframe = False
+            keyframe = self.encoder.keyframe()
+        self.loop.call_soon_threadsafe(self.broadcast, delta, keyframe)
+        
+    def broadcast(self, delta, keyframe):
+        for writer, synced in list(self.clients.items()):
+            transport = writer.transport
+            if transport.is_closing():
+                continue
+            if transport.get_write_buffer_size() > self.buffer_limit:
+                # Stop queueing for a client that is not keeping up
+                if synced:
+                    self.clients[writer] = False
+                    self.lagged += 1
+                continue
+            if synced and delta is not None:
+                message = delta
+            elif keyframe is not None:
+                message = keyframe
+                self.clients[writer] = True
+            else:
+                self.need_keyframe = True  # Caught up again; resync next tick
+                continue
+            transport.write(message)
+            self.sent += len(message)
+            
+    def close(self):
+        if self.loop.is_running():
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join()
+
+# Asset pipeline - sounds are discovered by scanning the assets directory and
+# decoded concurrently on a thread pool. Decoded PCM, already in the mixer's
+# format, is cached by a hash of the file contents: in memory for the life of
+# the process and on disk in assets/.cache, so later launches skip decoding.
+# A sound whose file is missing is synthesized as one NumPy buffer in memory.
+class AssetPipeline:
+    def __init__(self, assets_dir=ASSETS_DIR, cache_dir=None, workers=4):
+        self.assets_dir = assets_dir
+        self.cache_dir = cache_dir or os.path.join(assets_dir, '.cache')
+        self.workers = workers
+        self.buffers = {}  # content hash -> raw PCM in the mixer's format
+        self.lock = threading.Lock()
+        self.decoded = 0
+        self.cache_hits = 0
+        self.synthesized = 0
+        
+    def discover(self, extensions=('.wav', '.ogg')):
+        """Map file name -> path for every sound file in the assets directory"""
+        try:
+            names = os.listdir(self.assets_dir)
+        except OSError:
+            return {}
+        return {name: os.path.join(self.assets_dir, name) for name in names
+                if os.path.splitext(name)[1].lower() in extensions}
+        
+    def load_sounds(self, specs=SOUND_SPECS):
+        """Return {name: Sound or None} for specs, loading every sound at once"""
+        if not pygame.mixer.get_init():
+            return {name: None for name in specs}
+        files = self.discover()
+        with ThreadPoolExecutor(self.workers, thread_name_prefix='assets') as pool:
+            futures = {name: pool.submit(self.load_sound, files.get(spec['file']), spec)
+                       for name, spec in specs.items()}
+        sounds = {}
+        for name, future in futures.items():
+            try:
+                sound = future.result()
+                sound.set_volume(specs[name]['volume'])
+            except (pygame.error, OSError, ValueError) as e:
+                print(f"Warning: Could not load sound {name}: {e}")
+                sound = None
+            sounds[name] = sound
+        return sounds
+        
+    def load_sound(self, path, spec):
+        if path is None:
+            return self.synthesize_tone(**spec.get('tone', PLACEHOLDER_TONE))
+        with open(path, 'rb') as f:
+            data = f.read()
+        # The mixer format is part of the key, as the cached PCM is stored in it
+        key = hashlib.sha1(data + repr(pygame.mixer.get_init()).encode('ascii')).hexdigest()
+        raw = self.cached_buffer(key)
+        if raw is None:
+            raw = pygame.mixer.Sound(file=io.BytesIO(data)).get_raw()
+            self.store_buffer(key, raw)
+            with self.lock:
+                self.decoded += 1
+        return pygame.mixer.Sound(buffer=raw)
+        
+    def cached_buffer(self, key):
+        with self.lock:
+            raw = self.buffers.get(key)
+        if raw is None:
+            try:
+                with open(os.path.join(self.cache_dir, key + '.pcm'), 'rb') as f:
+                    raw = f.read()
+            except OSError:
+                return None
+            with self.lock:
+                self.buffers[key] = raw
+        with self.lock:
+            self.cache_hits += 1
+        return raw
+        
+    def store_buffer(self, key, raw):
+        with self.lock:
+            self.buffers[key] = raw
+        path = os.path.join(self.cache_dir, key + '.pcm')
+        try:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            with open(path + '.tmp', 'wb') as f:
+                f.write(raw)
+            os.replace(path + '.tmp', path)
+        except OSError:
+            pass  # A read-only install just decodes every launch
+            
+    def synthesize_tone(self, frequency=440, duration=0.1, amplitude=0.3):
+        """A sine beep built as one buffer in the mixer's own format"""
+        rate, size, channels = pygame.mixer.get_init()
+        wave = amplitude * np.sin(2 * np.pi * frequency * np.arange(int(duration * rate)) / rate)
+        if size == -16:
+            samples = (wave * 32767).astype(np.int16)
+        elif size == 16:
+            samples = (wave * 32767 + 32768).astype(np.uint16)
+        elif size == -8:
+            samples = (wave * 127).astype(np.int8)
+        elif size == 8:
+            samples = (wave * 127 + 128).astype(np.uint8)
+        elif size == 32:
+            samples = wave.astype(np.float32)
+        else:
+            raise ValueError(f"unsupported mixer sample format {size}")
+        if channels > 1:
+            samples = np.repeat(samples[:, None], channels, axis=1)
+        with self.lock:
+            self.synthesized += 1
+        return pygame.sndarray.make_sound(np.ascontiguousarray(samples))
+        
+    def stats(self):
+        return {'decoded': self.decoded, 'cache_hits': self.cache_hits,
+                'synthesized': self.synthesized, 'buffers': len(self.buffers)}
+
+asset_pipeline = AssetPipeline()
+
+# Level preloader - while a level is played, the next one is built on a worker
+# thread: decoded from the pack, its collision index built, its static layer
+# and goal glow frames rendered and the text it will show rendered into the
+# text cache. The main thread takes the finished Level in one assignment
+# during the fade between levels.
+class LevelPreloader:
+    def __init__(self):
+        self.executor = None
+        self.future = None
+        self.index = None  # Level the pending build is for
+        
+    def request(self, pack, index, particles, texts=()):
+        """Start building level index of pack; texts are (text, size, color)
+        to pre-render"""
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='level-preload')
+        if self.future is not None:
+            self.future.cancel()
+        self.index = index
+        self.future = self.executor.submit(self.build, pack, index, particles, texts)
+        
+    @staticmethod
+    def build(pack, index, particles, texts):
+        level = Level(particles=particles, data=pack.load(index))
+        level.get_static_layer(level.start_view())
+        level.build_goal_glow_frames()
+        for text, size, color in texts:
+            text_cache.render(text, size, color)
+        return level
+        
+    def take(self, index):
+        """Return the preloaded level, waiting for it if it is still being
+        built, or None if level index was never requested"""
+        if self.future is None or self.index != index:
+            return None
+        future, self.future = self.future, None
+        return future.result()
+        
+    def close(self):
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+        self.future = None
 
 # Game class
 class TimeLoopGame:
-    def __init__(self):
-        self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
-        pygame.display.set_caption("Time Loop Puzzle Game")
+    def __init__(self, headless=False, input_source=None, max_loops=MAX_LOOPS, seed=None,
+                 record_path=None, replay_path=None, level=0, level_pack=DEFAULT_LEVEL_PACK,
+                 profile_path=None, spectate=None, adapt_quality=True):
+        """headless runs without a window: the SDL dummy video driver is used and
+        frames are rendered to an offscreen surface. input_source defaults to the
+        keyboard; pass a ScriptedInput to drive the game from a script.
+        
+        level is a level name or index in level_pack (a .json source or a
+        compiled .tlpack).
+        
+        record_path writes the session to a replay file; replay_path plays one
+        back (its seed, level and loop limit override the arguments).
+        
+        profile_path records a frame profile for the whole session, written on
+        close() as CSV if it ends in .csv, otherwise as a Chrome trace.
+        
+        spectate is a port (or a (host, port) pair) to stream the session to
+        spectators on; 0 picks a free port.
+        
+        adapt_quality lets the governor step the module-wide quality settings
+        to the frame time while run() renders a window; headless runs and
+        replays never adapt. The game leaves the preset itself to main()."""
+        self.headless = headless
+        if headless:
+            if pygame.display.get_init() and pygame.display.get_driver() != 'dummy':
+                pygame.display.quit()
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
+            # Sounds still load and play, into no device
+            os.environ['SDL_AUDIODRIVER'] = 'dummy'
+            init_subsystem('display')
+            self.screen = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT))
+        else:
+            init_subsystem('display')
+            with startup.timed('window'):
+                self.screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+                pygame.display.set_caption("Time Loop Puzzle Game")
+        self.replay = None
+        if replay_path:
+            self.replay = ReplayInput(replay_path)
+            seed = self.replay.header['seed']
+            level = self.replay.header['level']
+            max_loops = self.replay.header['max_loops']
+            input_source = self.replay
+        self.input = input_source or KeyboardInput()
+        self.replay_mismatches = 0  # Ticks whose state digest differed from the replay
         self.clock = pygame.time.Clock()
-        self.level = Level()
-        self.player = Player(*self.level.start_pos)
-        self.ghosts = []  # List of ghosts from previous loops
+        self.profiler = FrameProfiler()
+        self.profile_path = profile_path
+        self.profiler.set_enabled(profile_path is not None)
+        self.renderer = Renderer(self.screen, present=not headless, profiler=self.profiler)
+        self.quality = QualityGovernor(quality, adaptive=adapt_quality and not headless and replay_path is None)
+        self.particles = ParticlePool()  # Shared by every particle emitter in the game
+        self.seed = seed if seed is not None else random.SystemRandom().randrange(2**32)
+        self.particles.seed(self.seed)
+        with startup.timed('level'):
+            self.level_source = level_pack
+            self.level_pack = open_level_pack(level_pack)
+            self.level_index = level if isinstance(level, int) else self.level_pack.names.index(level)
+            self.level = Level(particles=self.particles, data=self.level_pack.load(self.level_index))
+        self.player = Player(*self.level.start_pos, particles=self.particles)
+        self.ghosts = GhostSwarm(self.particles)  # Ghosts from previous loops
+        self.camera = Camera()
+        self.watch_level()
         self.loop_count = 0
-        self.max_loops = 3  # Maximum number of loops/ghosts
-        self.font = pygame.font.SysFont(None, 36)
-        self.hud = HUD()
-        self.particles = []
+        self.max_loops = max_loops  # Maximum number of loops/ghosts
+        with startup.timed('hud'):
+            self.font = text_cache.get_font(None, 36)
+            self.hud = HUD()
         self.game_state = "playing"  # playing, level_complete, game_over
         self.transition_alpha = 255
         self.fade_direction = -1  # -1 for fade in, 1 for fade out
+        self.tick = 0  # Simulation ticks run so far
+        self.fast_forward = False
+        self.render_enabled = True
+        self.tick_input = 0  # Input byte for the current tick, as written to replays
+        self.recorder = None
+        if record_path:
+            self.recorder = ReplayWriter(record_path, {
+                'version': REPLAY_VERSION,
+                'seed': self.seed,
+                'level': self.level.name,
+                'tick_rate': TICK_RATE,
+                'max_loops': self.max_loops,
+            })
+        self.spectator = None
+        if spectate is not None:
+            host, port = spectate if isinstance(spectate, tuple) else (SPECTATOR_HOST, spectate)
+            self.spectator = SpectatorServer(host, port)
         
-        # Load sounds
+        # Sounds load in the background once the first frame is up
         self.sounds = {}
-        self.load_sounds()
+        self.audio_thread = None
         
-    def load_sounds(self):
-        """Load sound effects from assets directory"""
-        sound_files = {
-            'move': {'file': 'move.wav', 'volume': 0.2},
-            'restart': {'file': 'restart.wav', 'volume': 0.4},
-            'goal': {'file': 'goal.wav', 'volume': 0.5},
-            'lever': {'file': 'lever.wav', 'volume': 0.4},
-            'button': {'file': 'button.wav', 'volume': 0.3}
-        }
+        self.editor = LevelEditor(self)
         
-        # Create assets directory if it doesn't exist
-        assets_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'assets')
-        if not os.path.exists(assets_dir):
-            os.makedirs(assets_dir)
-            print(f"Created assets directory at {assets_dir}")
-            
-        # Check if sound files exist, if not create placeholder sounds
-        for sound_name, sound_info in sound_files.items():
-            sound_path = os.path.join(assets_dir, sound_info['file'])
-            if not os.path.exists(sound_path):
-                self.create_placeholder_sound(sound_path)
-                
-            try:
-                sound = pygame.mixer.Sound(sound_path)
-                sound.set_volume(sound_info['volume'])
-                self.sounds[sound_name] = sound
-            except:
-                print(f"Warning: Could not load sound {sound_path}")
-                self.sounds[sound_name] = None
-                
-    def create_placeholder_sound(self, path):
-        """Create a simple placeholder sound file"""
-        try:
-            import wave
-            import struct
-            
-            # Create a simple beep sound
-            duration = 0.1  # seconds
-            frequency = 440  # Hz
-            sample_rate = 44100  # samples per second
-            num_samples = int(duration * sample_rate)
-            
-            # Open file for writing
-            with wave.open(path, 'w') as wav_file:
-                # Set parameters
-                wav_file.setparams((1, 2, sample_rate, num_samples, 'NONE', 'not compressed'))
-                
-                # Generate sine wave
-                samples = []
-                for i in range(num_samples):
-                    sample = 32767 * 0.3 * math.sin(2 * math.pi * frequency * i / sample_rate)
-                    samples.append(struct.pack('h', int(sample)))
-                    
-                # Write samples to file
-                wav_file.writeframes(b''.join(samples))
-                
-            print(f"Created placeholder sound at {path}")
-        except:
-            print(f"Warning: Could not create placeholder sound at {path}")
+        # Start building the next level while this one is played
+        self.preloader = LevelPreloader()
+        self.preload_next_level()
+        
+        # Per-frame counters for the profiler (F3 shows its overlay)
+        self.fade_surfaces = 0  # Full-screen fade overlays allocated
+        self.profiler.watch_gauge('particles', lambda: self.particles.count)
+        self.profiler.watch_gauge('ghosts', lambda: len(self.ghosts))
+        self.profiler.watch_gauge('quality', lambda: QUALITY_LEVELS.index(quality.preset))
+        self.profiler.watch_total('blits', lambda: self.renderer.blits)
+        self.profiler.watch_total('surfaces', lambda: sprite_cache.misses + text_cache.misses + self.fade_surfaces)
+        self.profiler.watch_total('collision_tests', lambda: self.level.collision_index.tests +
+                                  self.level.triggers.index.tests)
+        
+    def start_audio(self):
+        """Bring up the mixer and load sounds on a background thread; until
+        they are ready play_sound does nothing"""
+        if self.audio_thread is None:
+            self.audio_thread = threading.Thread(target=self.load_sounds, name='audio', daemon=True)
+            self.audio_thread.start()
+            
+    def load_sounds(self):
+        """Load sound effects through the asset pipeline"""
+        if init_subsystem('mixer'):
+            with startup.timed('sounds'):
+                self.sounds = asset_pipeline.load_sounds(SOUND_SPECS)
+        startup.mark('audio_ready')
             
     def play_sound(self, sound_name):
         """Play a sound if it exists"""
@@ -665,57 +3596,61 @@ class TimeLoopGame:
             self.sounds[sound_name].play()
         
     def handle_events(self):
-        mouse_pos = pygame.mouse.get_pos()
+        mouse_pos = self.input.get_mouse_pos()
         self.hud.update(mouse_pos)
+        self.tick_input = 0
         
-        for event in pygame.event.get():
+        for event in self.input.get_events():
             if event.type == pygame.QUIT:
                 return False
+            if self.editor.handle_event(event):
+                continue
                 
             # Handle HUD events
             result = self.hud.handle_events(event)
             if result == "restart":
                 self.restart_loop()
                 self.play_sound('restart')
+                self.tick_input |= INPUT_RESTART
                 
             if event.type == pygame.KEYDOWN:
                 if event.key == pygame.K_r:
                     self.restart_loop()
                     self.play_sound('restart')
+                    self.tick_input |= INPUT_RESTART
+                elif event.key == pygame.K_f:
+                    self.fast_forward = not self.fast_forward
+                elif event.key == pygame.K_F3:
+                    self.toggle_profiler_overlay()
                         
         if self.game_state != "playing":
             return True
                     
-        keys = pygame.key.get_pressed()
+        keys = self.input.get_pressed()
         dx, dy = 0, 0
+        input_mask = 0
         
         if keys[pygame.K_LEFT]:
             dx = -1
+            input_mask |= INPUT_LEFT
         if keys[pygame.K_RIGHT]:
             dx = 1
+            input_mask |= INPUT_RIGHT
         if keys[pygame.K_UP]:
             dy = -1
+            input_mask |= INPUT_UP
         if keys[pygame.K_DOWN]:
             dy = 1
+            input_mask |= INPUT_DOWN
             
-        if dx != 0 or dy != 0:
-            prev_x, prev_y = self.player.x, self.player.y
-            self.player.move(dx, dy)
-            
-            # Check for collisions with walls
-            if self.level.check_collision(self.player):
-                # Move back (simple collision resolution)
-                self.player.move(-dx, -dy)
-            elif prev_x != self.player.x or prev_y != self.player.y:
-                # Only play sound if actually moved
-                self.play_sound('move')
-                
-            # Check for lever interactions
-            if self.level.check_lever_interactions(self.player):
-                self.play_sound('lever')
-                    
-        # Check for pressure plate interactions
-        self.level.check_pressure_plate_interactions(self.player, self.ghosts)
+        if (dx != 0 or dy != 0) and self.level.move_player(self.player, dx, dy):
+            # Only play sound if actually moved
+            self.play_sound('move')
+            
+        # Every playing tick is recorded, idle ones included, so ghosts keep
+        # the same timing as the loop they replay
+        self.player.record(input_mask)
+        self.tick_input |= input_mask
                 
         return True
         
@@ -729,71 +3664,94 @@ class TimeLoopGame:
             # Transition complete, reset game state
             self.fade_direction = -1
             if self.game_state == "level_complete":
-                self.restart_loop()
+                if self.has_next_level():
+                    self.enter_level(self.level_index + 1)
+                else:
+                    self.restart_loop()
                 self.game_state = "playing"
         
         # Update player
         self.player.update()
+        self.camera.follow(self.player.rect().center, self.level.world)
         
-        # Update level
-        self.level.update()
+        # Update level; decoration is only added where it can be seen
+        view = self.camera.view.inflate(2 * VIEW_MARGIN, 2 * VIEW_MARGIN)
+        self.level.update(view)
         
-        # Update all ghosts
-        for ghost in self.ghosts:
-            ghost.update()
+        # Update all ghosts in one vectorized step, then re-test only the
+        # ghosts that moved against the trigger volumes
+        self.ghosts.update(view)
+        for index in self.ghosts.take_moved():
+            ghost = self.ghosts[index]
+            self.level.triggers.move(ghost, ghost.rect())
             
-        # Update particles
-        for particle in self.particles[:]:
-            particle.update()
-            if particle.lifetime <= 0:
-                self.particles.remove(particle)
+        # Update every particle in one vectorized step
+        self.particles.update()
             
         # Check if player reached the goal
-        if self.game_state == "playing" and self.level.check_goal(self.player):
+        if self.game_state == "playing" and self.level.player_at_goal:
             self.game_state = "level_complete"
             self.fade_direction = 1
             self.play_sound('goal')
                 
-            # Add celebration particles
-            for _ in range(50):
-                self.particles.append(
-                    Particle(
-                        random.uniform(self.player.x, self.player.x + self.player.size),
-                        random.uniform(self.player.y, self.player.y + self.player.size),
-                        (random.randint(0, 255), random.randint(0, 255), random.randint(0, 255)),
-                        size=random.uniform(2, 5),
-                        lifetime=random.randint(30, 60)
-                    )
-                )
-            
-    def draw(self):
-        # Draw background with subtle pattern
-        self.screen.fill(BACKGROUND_COLOR)
-        
-        # Draw subtle grid pattern
-        for x in range(0, SCREEN_WIDTH, 40):
-            pygame.draw.line(self.screen, (230, 230, 235), (x, 0), (x, SCREEN_HEIGHT), 1)
-        for y in range(0, SCREEN_HEIGHT, 40):
-            pygame.draw.line(self.screen, (230, 230, 235), (0, y), (SCREEN_WIDTH, y), 1)
+            # Add celebration particles (random color per particle)
+            self.particles.burst(50, (self.player.x, self.player.y, self.player.size, self.player.size),
+                                 None, size_range=(2, 5), lifetime_range=(30, 60))
+            
+    def draw(self, alpha=1.0):
+        """Render a frame; alpha (0-1) is how far real time has progressed
+        into the next simulation tick, used to interpolate moving entities"""
+        # Only what is inside the view is drawn, translated to the screen
+        x, y = self.player.render_position(alpha)
+        view = Camera.view_around((x + self.player.size / 2, y + self.player.size / 2), self.level.world)
+        self.camera.shown = view
+        offset = (-view.x, -view.y)
         
-        # Draw level
-        self.level.draw(self.screen)
+        # Level elements (goal, movable walls, levers, plates)
+        layers = self.level.dirty_layers(view)
         
-        # Draw ghosts
+        # Ghosts
         for i, ghost in enumerate(self.ghosts):
             ghost.loop_number = i + 1
-            ghost.draw(self.screen)
+            bounds = ghost.bounds(alpha)
+            if bounds is None or not bounds.colliderect(view):
+                continue
+            position = ghost.render_position(alpha)
+            layers.append((('ghost', id(ghost)), (position, tuple(ghost.trail), ghost.loop_number),
+                           bounds.move(offset),
+                           lambda screen, ghost=ghost: ghost.draw(screen, alpha, offset)))
             
-        # Draw player
-        self.player.draw(self.screen)
+        # Player
+        layers.append(('player', (self.player.render_position(alpha), tuple(self.player.trail)),
+                       self.player.bounds(alpha).move(offset),
+                       lambda screen: self.player.draw(screen, alpha, offset)))
+        
+        # Particles move every frame while any are alive
+        bounds = self.particles.bounds()
+        if bounds is not None:
+            bounds = bounds.clip(view)
+            bounds = bounds.move(offset) if bounds.width and bounds.height else None
+        layers.append(('particles', self.particles.version, bounds,
+                       lambda screen: self.particles.draw(screen, view)))
         
-        # Draw particles
-        for particle in self.particles:
-            particle.draw(self.screen)
+        # HUD
+        layers.extend(self.hud.dirty_layers(self.loop_count, len(self.ghosts), self.max_loops))
+        layers.extend(self.editor.dirty_layers())
+        if self.profiler.show_overlay:
+            layers.append(self.profiler.overlay_layer())
         
-        # Draw HUD
-        self.hud.draw(self.screen, self.loop_count, len(self.ghosts), self.max_loops)
+        # Fades and the level complete message fall back to full-frame presentation
+        overlay = None
+        if self.transition_alpha > 0 or self.game_state == "level_complete":
+            overlay = self.draw_overlays
+        for rect in self.level.take_static_damage():
+            self.renderer.damage(rect)
+        self.renderer.present(self.level.get_static_layer(view), layers, overlay)
+        if self.audio_thread is None:
+            startup.mark('first_frame')
+            self.start_audio()
         
+    def draw_overlays(self, screen):
         # Draw level complete message
         if self.game_state == "level_complete":
             self.draw_level_complete()
@@ -801,15 +3759,14 @@ class TimeLoopGame:
         # Draw transition overlay
         if self.transition_alpha > 0:
             overlay = pygame.Surface((SCREEN_WIDTH, SCREEN_HEIGHT), pygame.SRCALPHA)
+            self.fade_surfaces += 1
             overlay.fill((0, 0, 0, self.transition_alpha))
-            self.screen.blit(overlay, (0, 0))
-        
-        pygame.display.flip()
+            screen.blit(overlay, (0, 0))
         
     def draw_level_complete(self):
         if self.transition_alpha < 100:  # Only show when fade is mostly complete
-            font = pygame.font.SysFont(None, 60)
-            text = font.render("Loop Complete!", True, (255, 255, 255))
+            title, subtitle = self.level_complete_text()
+            text = text_cache.render(title, 60, (255, 255, 255))
             text_rect = text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//2 - 50))
             
             # Draw text background
@@ -820,14 +3777,76 @@ class TimeLoopGame:
             self.screen.blit(text, text_rect)
             
             # Draw smaller instruction
-            small_font = pygame.font.SysFont(None, 30)
-            small_text = small_font.render("Starting next loop...", True, (200, 200, 200))
+            small_text = text_cache.render(subtitle, 30, (200, 200, 200))
             small_rect = small_text.get_rect(center=(SCREEN_WIDTH//2, SCREEN_HEIGHT//2 + 10))
             self.screen.blit(small_text, small_rect)
         
+    def level_complete_text(self):
+        if self.has_next_level():
+            return "Level Complete!", "Starting next level..."
+        return "Loop Complete!", "Starting next loop..."
+        
+    def has_next_level(self):
+        return self.level_index + 1 < len(self.level_pack)
+        
+    def preload_next_level(self):
+        """Have the preloader build the level after this one, and render the
+        text the player will see on the way there"""
+        if not self.has_next_level():
+            return
+        title, subtitle = self.level_complete_text()
+        texts = [(title, 60, (255, 255, 255)), (subtitle, 30, (200, 200, 200)),
+                 ("Loop: 0", 24, (50, 50, 50)), (f"Ghosts: 0/{self.max_loops}", 24, (50, 50, 50))]
+        self.preloader.request(self.level_pack, self.level_index + 1, self.particles, texts)
+        
+    def enter_level(self, index):
+        """Switch to another level of the pack, starting again from its first loop"""
+        try:
+            level = self.preloader.take(index)
+        except Exception:
+            level = None  # The background build failed; build it here, where errors surface as usual
+        if level is None:
+            level = Level(particles=self.particles, data=self.level_pack.load(index))
+        self.level = level
+        self.level_index = index
+        self.ghosts = GhostSwarm(self.particles)  # Ghosts only make sense in their own level
+        self.player.reset_position(*self.level.start_pos)
+        self.watch_level()
+        self.loop_count = 0
+        if self.recorder:
+            self.recorder.mark_loop(self.tick, self.loop_count)
+        self.preload_next_level()
+        
+    def watch_level(self):
+        """Hook the game into the current level's triggers and report where
+        the player starts"""
+        self.level.triggers.subscribe('activate', 'lever', lambda lever, mover: self.play_sound('lever'))
+        self.level.triggers.move('player', self.player.rect())
+        self.player.world = self.level.world
+        self.camera.follow(self.player.rect().center, self.level.world)
+        
+    def retest_movers(self):
+        """Have the player and ghosts report where they are again, after the
+        level's trigger volumes were edited"""
+        triggers = self.level.triggers
+        triggers.move('player', self.player.rect())
+        for ghost in self.ghosts:
+            if ghost.position() is not None:
+                triggers.move(ghost, ghost.rect())
+                
+    def toggle_profiler_overlay(self):
+        """Show or hide the profiler overlay; the profiler records while it is
+        shown, and for the whole session when it was started with --profile"""
+        self.profiler.show_overlay = not self.profiler.show_overlay
+        if self.profiler.show_overlay:
+            self.profiler.set_enabled(True)
+        elif not self.profile_path:
+            self.profiler.set_enabled(False)
+        self.renderer.invalidate()
+        
     def restart_loop(self):
         # Create a new ghost from player's actions
-        if self.player.actions:
+        if len(self.player.recording):
             # Assign different colors to different ghosts
             ghost_colors = [
                 (128, 0, 255, 180),  # Purple
@@ -835,32 +3854,186 @@ class TimeLoopGame:
                 (0, 128, 255, 180),  # Blue
             ]
             color_index = len(self.ghosts) % len(ghost_colors)
-            new_ghost = Ghost(self.player.actions, color=ghost_colors[color_index])
-            self.ghosts.append(new_ghost)
+            self.ghosts.add(self.player.recording, color=ghost_colors[color_index])
             
         # Limit the number of ghosts
         if len(self.ghosts) > self.max_loops:
-            self.ghosts.pop(0)  # Remove oldest ghost
+            ghost = self.ghosts.pop(0)  # Remove oldest ghost
+            self.level.triggers.remove_mover(ghost)
             
         # Reset player position
         self.player.reset_position(*self.level.start_pos)
+        self.level.triggers.move('player', self.player.rect())
         self.loop_count += 1
+        if self.recorder:
+            self.recorder.mark_loop(self.tick, self.loop_count)
         
-    def run(self):
-        running = True
-        while running:
+    def step(self):
+        """Advance the simulation by exactly one fixed tick"""
+        self.player.prev_x, self.player.prev_y = self.player.x, self.player.y
+        self.ghosts.begin_tick()
+        with self.profiler.scope('handle_events'):
             running = self.handle_events()
+        if not running:
+            return False
+        with self.profiler.scope('update'):
             self.update()
-            self.draw()
-            self.clock.tick(FPS)
+        
+        if self.recorder:
+            self.recorder.write_tick(self.tick, self.tick_input, self.state_digest())
+        if self.spectator and self.spectator.clients:
+            self.spectator.publish(self.tick, *self.spectator_state())
+        if self.replay:
+            expected = self.replay.expected_digest(self.tick)
+            if expected is not None and expected != self.state_digest():
+                self.replay_mismatches += 1
+        self.tick += 1
+        return running
+        
+    def state_digest(self):
+        """CRC32 over everything that drives game logic: player, ghost cursors,
+        levers, plates and movable walls"""
+        level = self.level
+        state = [self.player.x, self.player.y, self.loop_count]
+        for row in (level.levers.rows('activated', 'cooldown') + level.pressure_plates.rows('activated', 'timer') +
+                    level.movable_walls.rows('active', 'y')):
+            state += row
+        digest = zlib.crc32(repr(state).encode('ascii'))
+        return zlib.crc32(self.ghosts.cursor.tobytes() + self.ghosts.current.tobytes(), digest)
+        
+    def spectator_state(self):
+        """The header and state vector streamed to spectators"""
+        level = self.level
+        header = {
+            'version': SPECTATOR_VERSION,
+            'level': level.name,
+            'tick_rate': TICK_RATE,
+            'layout': {'ghosts': len(self.ghosts), 'levers': len(level.levers),
+                       'plates': len(level.pressure_plates), 'movable_walls': len(level.movable_walls)},
+        }
+        def interleave(store, *names):
+            return np.column_stack([store.values(name) for name in names]).ravel()
+        ghosts = self.ghosts
+        state = np.concatenate([
+            [self.player.x, self.player.y, self.loop_count],
+            np.column_stack([ghosts.cursor, ghosts.current]).ravel(),
+            interleave(level.levers, 'activated', 'cooldown'),
+            interleave(level.pressure_plates, 'activated', 'timer'),
+            interleave(level.movable_walls, 'active', 'y'),
+        ]).astype(np.int64)
+        return header, state
+        
+    def close(self):
+        """Finish any replay being recorded, write the frame profile and stop
+        the level preloader and spectator server"""
+        self.preloader.close()
+        if self.spectator:
+            self.spectator.close()
+        if self.recorder:
+            self.recorder.close()
+        if self.profile_path:
+            self.profiler.export(self.profile_path)
+        
+    def run(self, max_ticks=None):
+        """Main loop: the simulation advances in fixed TICK_TIME steps from an
+        accumulator while frames render as fast as MAX_RENDER_FPS allows.
+        
+        While fast_forward is set each rendered frame runs FAST_FORWARD_TICKS
+        ticks back to back; with render_enabled off nothing is drawn at all,
+        and the loop sleeps until the next tick is due unless fast-forwarding.
+        """
+        running = True
+        accumulator = 0.0
+        previous = time.perf_counter()
+        while running and (max_ticks is None or self.tick < max_ticks):
+            self.profiler.begin_frame()
+            now = time.perf_counter()
+            # Clamp long stalls so a hitch slows the game down instead of
+            # triggering an ever-growing burst of catch-up ticks
+            accumulator += min(now - previous, MAX_FRAME_TIME)
+            previous = now
             
-        pygame.quit()
-        sys.exit()
+            if self.fast_forward:
+                for _ in range(FAST_FORWARD_TICKS):
+                    running = self.step()
+                    if not running:
+                        break
+                accumulator = 0.0
+            else:
+                while running and accumulator >= TICK_TIME:
+                    running = self.step()
+                    accumulator -= TICK_TIME
+                    
+            if self.render_enabled:
+                self.draw(min(1.0, accumulator / TICK_TIME))
+            # The frame is over before the limiter sleeps
+            self.profiler.end_frame()
+            if self.render_enabled:
+                self.clock.tick(MAX_RENDER_FPS)
+                # Fast-forward frames run several ticks each, so they are not judged
+                if not self.fast_forward and self.quality.observe(self.clock.get_rawtime()):
+                    self.renderer.invalidate()
+            elif not self.fast_forward:
+                # Nothing to draw, so wait for the next tick instead of spinning
+                time.sleep(max(0.0, TICK_TIME - accumulator))
 
 # Main function
-def main():
-    game = TimeLoopGame()
-    game.run()
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time Loop Puzzle Game")
+    parser.add_argument('--record', metavar='FILE', help='record this session to a replay file')
+    parser.add_argument('--replay', metavar='FILE', help='play back a replay file')
+    parser.add_argument('--seed', type=int, help='random seed for particle effects')
+    parser.add_argument('--fast', action='store_true', help='start in fast-forward')
+    parser.add_argument('--level', default='0', help='level name or index to play')
+    parser.add_argument('--levels', metavar='FILE', default=DEFAULT_LEVEL_PACK,
+                        help='level pack: a .json source or a compiled .tlpack')
+    parser.add_argument('--compile-levels', action='store_true',
+                        help='compile the --levels JSON source into a .tlpack and exit')
+    parser.add_argument('--startup-report', action='store_true',
+                        help='print startup timings as JSON once the first frame and audio are up, then exit')
+    parser.add_argument('--profile', metavar='FILE',
+                        help='record per-frame timings and write them on exit (.csv, otherwise Chrome trace JSON)')
+    parser.add_argument('--quality', choices=['auto'] + QUALITY_LEVELS, default='auto',
+                        help='effect quality preset (default: adapt to the frame time)')
+    parser.add_argument('--spectate', metavar='[HOST:]PORT', nargs='?', const=str(SPECTATOR_PORT),
+                        help=f'stream the session to spectators (default port {SPECTATOR_PORT}, localhost only)')
+    args = parser.parse_args(argv)
+    
+    if args.compile_levels:
+        print(f"Wrote {compile_level_pack(args.levels)}")
+        return
+    level = int(args.level) if args.level.isdigit() else args.level
+    spectate = None
+    if args.spectate:
+        host, _, port = args.spectate.rpartition(':')
+        spectate = (host or SPECTATOR_HOST, int(port))
+    if args.quality != 'auto':
+        quality.set_preset(args.quality)
+    try:
+        game = TimeLoopGame(seed=args.seed, record_path=args.record, replay_path=args.replay,
+                            level=level, level_pack=args.levels, profile_path=args.profile,
+                            spectate=spectate, adapt_quality=args.quality == 'auto')
+    except OSError as e:
+        # e.g. the spectator port is already taken or the replay file is missing
+        pygame.quit()
+        sys.exit(f"Could not start: {e}")
+    game.fast_forward = args.fast
+    try:
+        if args.startup_report:
+            game.step()
+            game.draw()
+            game.audio_thread.join()
+            print(json.dumps(startup.report(), indent=2))
+        else:
+            game.run()
+    finally:
+        game.close()
+    if game.replay and game.replay_mismatches:
+        print(f"Warning: replay diverged on {game.replay_mismatches} ticks")
+    pygame.quit()
+    sys.exit()
+
+startup.mark('imported')
 
 if __name__ == "__main__":
     main()